@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Union, Any
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple, Union, Any
 import httpx
 import os
 import asyncio
@@ -8,34 +9,177 @@ import uuid
 import logging
 import json
 import re
-from openai import OpenAI
+import time
+
+from balancer import ToolBalancer
+from cache import ResponseCache, cache_key
+from context import ContextManager, ConversationContext, SummaryState, normalize_history, truncate_tokens
+from fastpath import FastPathMatch, FastPathStats, classify_query, format_number
+from http_client import close_client, get_client, start_client
+from invoker import ToolInvocationError, ToolInvoker, ToolUnavailable
+from llm import create_provider
+from metrics import Gauge, gauges_from, instrument
+from sessions import Session, SessionConflict, SessionStoreUnavailable, create_session_store
+from tracing import Tracer, trace_requests
 
 app = FastAPI(title="Example LLM Agent")
 
 # Configuration
 REGISTRY_URL = os.environ.get("REGISTRY_URL", "http://service-registry:8000")
+# Heartbeats can go through a node-local aggregator instead of the registry
+HEARTBEAT_URL = os.environ.get("HEARTBEAT_URL", REGISTRY_URL)
 AGENT_NAME = "Example LLM Agent"
 AGENT_VERSION = "1.0.0"
 AGENT_ID = str(uuid.uuid4())
 
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# LLM backend: "openai", or "stub" for offline load tests and benchmarks
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "openai")
+
 # OpenAI configuration
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-3.5-turbo"
 
-# Initialize OpenAI client
-if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-else:
+# Stub backend behaviour: time to first token (in seconds) and output rate
+STUB_LLM_LATENCY = float(os.environ.get("STUB_LLM_LATENCY", "0.05"))
+STUB_LLM_TOKENS_PER_SECOND = float(os.environ.get("STUB_LLM_TOKENS_PER_SECOND", "100"))
+
+# Most LLM calls in flight at once, and the longest one may take (in seconds)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
+
+# Initialize the LLM backend (async, so completions never block the event loop)
+llm_provider = create_provider(
+    LLM_PROVIDER,
+    api_key=OPENAI_API_KEY,
+    model=OPENAI_MODEL,
+    timeout=LLM_TIMEOUT,
+    stub_latency=STUB_LLM_LATENCY,
+    stub_tokens_per_second=STUB_LLM_TOKENS_PER_SECOND,
+)
+if llm_provider is None:
     logger.warning("OPENAI_API_KEY not set, OpenAI integration will not work")
-    openai_client = None
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Local fast path for queries that are plain arithmetic
+FASTPATH_ENABLED = os.environ.get("FASTPATH_ENABLED", "true").lower() == "true"
+FASTPATH_MIN_CONFIDENCE = float(os.environ.get("FASTPATH_MIN_CONFIDENCE", "0.9"))
+# Answer fast-path queries straight from the calculator, skipping generation too
+FASTPATH_ANSWER = os.environ.get("FASTPATH_ANSWER", "true").lower() == "true"
+
+fastpath_stats = FastPathStats()
+
+# Cache of LLM analysis and generation results (LRU + TTL, optionally shared via Redis)
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "300"))
+LLM_CACHE_REDIS_URL = os.environ.get("LLM_CACHE_REDIS_URL")
+
+llm_cache = ResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL, redis_url=LLM_CACHE_REDIS_URL) if LLM_CACHE_ENABLED else None
 
 # Store discovered tools
 discovered_tools = {}
 
+# Spreading calls over tool replicas: round_robin, least_outstanding or ewma
+TOOL_LB_STRATEGY = os.environ.get("TOOL_LB_STRATEGY", "round_robin")
+# Replicas tried per call before giving up
+TOOL_MAX_ATTEMPTS = int(os.environ.get("TOOL_MAX_ATTEMPTS", "3"))
+# Consecutive failures that eject a replica, and for how long (in seconds)
+TOOL_EJECTION_FAILURES = int(os.environ.get("TOOL_EJECTION_FAILURES", "3"))
+TOOL_EJECTION_TIME = float(os.environ.get("TOOL_EJECTION_TIME", "30"))
+
+tool_balancer = ToolBalancer(
+    strategy=TOOL_LB_STRATEGY,
+    max_attempts=TOOL_MAX_ATTEMPTS,
+    failure_threshold=TOOL_EJECTION_FAILURES,
+    ejection_time=TOOL_EJECTION_TIME
+)
+
+# Request builders and validators compiled from each tool's OpenAPI schema
+tool_invoker = ToolInvoker()
+
+# Independent tool calls for one query run concurrently: at most this many at
+# once, and all of them within this many seconds
+TOOL_FANOUT_CONCURRENCY = int(os.environ.get("TOOL_FANOUT_CONCURRENCY", "4"))
+TOOL_FANOUT_TIMEOUT = float(os.environ.get("TOOL_FANOUT_TIMEOUT", "10"))
+
+# Conversation history in prompts is held to this many tokens; once it grows
+# past that, older turns are replaced by a summary of at most
+# CONTEXT_SUMMARY_TOKENS
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_SUMMARY_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", "300"))
+
+context_manager = ContextManager(
+    budget_tokens=CONTEXT_TOKEN_BUDGET,
+    summary_tokens=CONTEXT_SUMMARY_TOKENS,
+    summarize=(lambda previous, messages: summarize_conversation(previous, messages)) if llm_provider else None
+)
+
+# Conversation sessions for clients that send a session_id: memory (this
+# replica only) or redis (shared by replicas, survives restarts)
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL", os.environ.get("REDIS_URL", "redis://redis:6379/0"))
+# Least recently used sessions beyond this many are evicted
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "10000"))
+# Per-session caps: older messages beyond the count are dropped, longer ones clipped
+SESSION_MAX_MESSAGES = int(os.environ.get("SESSION_MAX_MESSAGES", "200"))
+SESSION_MAX_MESSAGE_CHARS = int(os.environ.get("SESSION_MAX_MESSAGE_CHARS", "8000"))
+# Redis sessions idle for this many seconds expire
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "86400"))
+
+session_store = create_session_store(
+    SESSION_STORE,
+    max_sessions=SESSION_MAX_SESSIONS,
+    max_messages=SESSION_MAX_MESSAGES,
+    max_message_chars=SESSION_MAX_MESSAGE_CHARS,
+    redis_url=SESSION_REDIS_URL,
+    ttl=SESSION_TTL
+)
+
+# Request latency and in-flight metrics for every route, plus GET /metrics
+metrics = instrument(app)
+llm_latency = metrics.histogram(
+    "agent_llm_request_duration_seconds", "LLM call latency, including the wait for a slot", ("stage", "outcome")
+)
+tool_call_latency = metrics.histogram(
+    "agent_tool_call_duration_seconds", "Tool call latency, including failover", ("tool_type", "operation", "outcome")
+)
+
+# A span per request and pipeline stage, continuing the caller's traceparent
+# and passing it on to tools; TRACE_EXPORT_FILE enables the JSONL export
+tracer = trace_requests(app, Tracer("example-agent"))
+
+
+@metrics.collector
+async def collect_agent_metrics():
+    """Cache, fast-path, balancer and session counters, read at scrape time"""
+    fast_path = fastpath_stats.snapshot()
+    collected = gauges_from("agent_fastpath", "Local arithmetic fast path", fast_path)
+    if llm_cache:
+        collected += gauges_from("agent_llm_cache", "LLM response cache", llm_cache.snapshot())
+    collected += gauges_from("agent_context", "Conversation context", context_manager.snapshot())
+    collected += gauges_from("agent_tool_invoker", "Tool invoker", tool_invoker.snapshot())
+
+    outstanding = Gauge("agent_tool_instance_outstanding", "Calls in flight per tool instance", ("instance",))
+    ejected = Gauge("agent_tool_instance_ejected", "Whether a tool instance is ejected (1) or not (0)", ("instance",))
+    for instance_id, stats in tool_balancer.snapshot()["instances"].items():
+        outstanding.set(stats["outstanding"], instance_id)
+        ejected.set(int(stats["ejected"]), instance_id)
+    failovers = Gauge("agent_tool_failovers", "Tool calls retried on another instance")
+    failovers.set(tool_balancer.failovers)
+    sessions = Gauge("agent_sessions", "Conversation sessions held by the session store")
+    sessions.set(await session_store.count())
+    return collected + [outstanding, ejected, failovers, sessions]
+
+# Tool discovery timing (in seconds)
+DISCOVERY_WATCH_TIMEOUT = 30
+DISCOVERY_POLL_INTERVAL = 30
+DISCOVERY_RETRY_INTERVAL = 5
+
 # Store agent registration ID
 agent_info = {
     "id": AGENT_ID,
@@ -47,7 +191,8 @@ agent_info = {
     "capabilities": ["text-processing", "question-answering", "math-processing"],
     "required_tools": ["calculator"],
     "metadata": {
-        "model": OPENAI_MODEL
+        "model": llm_provider.model if llm_provider else OPENAI_MODEL,
+        "llm_provider": LLM_PROVIDER
     }
 }
 
@@ -55,14 +200,14 @@ agent_info = {
 async def register_with_registry():
     """Register the agent with the service registry"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{REGISTRY_URL}/agents/register", json=agent_info)
-            if response.status_code == 200:
-                logger.info(f"Successfully registered agent: {AGENT_ID}")
-                return response.json()
-            else:
-                logger.error(f"Failed to register agent: {response.text}")
-                return None
+        client = get_client()
+        response = await client.post(f"{REGISTRY_URL}/agents/register", json=agent_info)
+        if response.status_code == 200:
+            logger.info(f"Successfully registered agent: {AGENT_ID}")
+            return response.json()
+        else:
+            logger.error(f"Failed to register agent: {response.text}")
+            return None
     except Exception as e:
         logger.error(f"Error registering agent: {str(e)}")
         return None
@@ -72,47 +217,90 @@ async def send_heartbeat():
     """Send a heartbeat to the registry periodically"""
     while True:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.put(f"{REGISTRY_URL}/agents/{AGENT_ID}/heartbeat")
-                if response.status_code == 200:
-                    logger.debug("Heartbeat sent successfully")
-                else:
-                    logger.warning(f"Failed to send heartbeat: {response.text}")
+            client = get_client()
+            response = await client.put(f"{HEARTBEAT_URL}/agents/{AGENT_ID}/heartbeat")
+            if response.status_code == 200:
+                logger.debug("Heartbeat sent successfully")
+            else:
+                logger.warning(f"Failed to send heartbeat: {response.text}")
         except Exception as e:
             logger.error(f"Error sending heartbeat: {str(e)}")
         
         await asyncio.sleep(20)  # Send heartbeat every 20 seconds
 
 
+def apply_tool_events(events: List[Dict]):
+    """Apply registry change events to the discovered tool cache"""
+    for event in events:
+        if event["event"] in ("register", "update"):
+            discovered_tools[event["id"]] = event["service"]
+        else:
+            discovered_tools.pop(event["id"], None)
+            tool_balancer.forget(event["id"])
+            tool_invoker.invalidate(event["id"])
+        logger.info(f"Tool {event['id']} {event['event']} (revision {event['revision']})")
+
+
 async def discover_tools():
-    """Discover and cache available tools from the registry"""
+    """
+    Keep the cache of available tools in sync with the registry
+
+    Takes a snapshot from /discover, then long-polls /watch and applies only
+    the changes, so new and expired tools show up as soon as the registry
+    sees them.
+    """
     global discovered_tools
+    revision = None
     while True:
         try:
-            async with httpx.AsyncClient() as client:
+            client = get_client()
+            if revision is None:
                 response = await client.post(
                     f"{REGISTRY_URL}/discover",
                     json={"service_type": "tool"}
                 )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    tools = {tool["id"]: tool for tool in data.get("tools", [])}
-                    
-                    # Update our cache of discovered tools
-                    discovered_tools = tools
-                    logger.info(f"Discovered {len(tools)} tools")
-                else:
-                    logger.warning(f"Failed to discover tools: {response.text}")
+                response.raise_for_status()
+                data = response.json()
+                discovered_tools = {tool["id"]: tool for tool in data.get("tools", [])}
+                for instance_id in set(tool_balancer.instances) - set(discovered_tools):
+                    tool_balancer.forget(instance_id)
+                for tool_id in set(tool_invoker.compiled) - set(discovered_tools):
+                    tool_invoker.invalidate(tool_id)
+                revision = data.get("revision")
+                logger.info(f"Discovered {len(discovered_tools)} tools")
+
+                if revision is None:
+                    # Registry has no change feed, fall back to polling
+                    await asyncio.sleep(DISCOVERY_POLL_INTERVAL)
+                continue
+
+            response = await client.get(
+                f"{REGISTRY_URL}/watch",
+                params={"since": revision, "service_type": "tool", "timeout": DISCOVERY_WATCH_TIMEOUT},
+                timeout=DISCOVERY_WATCH_TIMEOUT + 10
+            )
+            response.raise_for_status()
+            data = response.json()
+
+            if data.get("reset"):
+                logger.info("Tool watch reset by registry, resyncing")
+                revision = None
+                continue
+
+            apply_tool_events(data["events"])
+            revision = data["revision"]
         except Exception as e:
             logger.error(f"Error discovering tools: {str(e)}")
-        
-        await asyncio.sleep(30)  # Check for new tools every 30 seconds
+            revision = None
+            await asyncio.sleep(DISCOVERY_RETRY_INTERVAL)
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize agent on startup"""
+    # Open the shared connection pool used for registry and tool calls
+    await start_client()
+
     # Register with the service registry
     registration = await register_with_registry()
     if registration:
@@ -127,9 +315,32 @@ async def startup_event():
         logger.error("Failed to register agent with the service registry")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled connections on shutdown"""
+    await close_client()
+    if llm_provider:
+        await llm_provider.close()
+    if llm_cache:
+        await llm_cache.close()
+    await session_store.close()
+
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+
+class QueryContext(BaseModel):
+    session_id: Optional[str] = None
+    # Messages the client expects the session to hold; 0 starts it over
+    offset: Optional[int] = Field(None, ge=0)
+    conversation_history: List[Message] = []
+
+
 class QueryRequest(BaseModel):
     query: str
-    context: Optional[Dict] = None
+    context: Optional[QueryContext] = None
 
 
 class QueryResponse(BaseModel):
@@ -138,6 +349,72 @@ class QueryResponse(BaseModel):
     confidence: float
 
 
+async def load_conversation(context: Optional[QueryContext]) -> Tuple[Optional[str], Session]:
+    """
+    Resolve a request's conversation to (session_id, session)
+
+    With a ``session_id`` the conversation lives in the session store and
+    ``conversation_history`` holds only messages the agent has not seen (in
+    a one-agent conversation, none: the query itself is recorded with the
+    answer). ``offset`` is how many messages the client expects the session
+    to hold; a mismatch (e.g. the session was evicted) is a 409 and the
+    client resends the whole history with offset 0. Without a session the
+    history is taken as complete.
+    """
+    context = context or QueryContext()
+    history = normalize_history([message.model_dump() for message in context.conversation_history])
+    session_id = context.session_id
+    if not session_id:
+        return None, Session(messages=history, length=len(history))
+
+    offset = context.offset
+    try:
+        if offset is not None or history:
+            await session_store.append(
+                session_id,
+                history,
+                expected_length=offset or None,
+                reset=offset == 0
+            )
+        return session_id, await session_store.load(session_id)
+    except SessionConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"error": "Conversation out of sync", "messages": e.length}
+        )
+    except SessionStoreUnavailable as e:
+        logger.error(f"Session store error: {str(e)}")
+        raise HTTPException(status_code=503, detail="Session store unavailable")
+
+
+async def build_context(session_id: Optional[str], session: Session) -> ConversationContext:
+    """The conversation before the query, fitted into the token budget"""
+    # The summary position counts from the start of the session, the
+    # retained messages may not
+    state = SummaryState(session.summary, max(session.summarized - session.dropped, 0))
+    conversation = await context_manager.build(session.messages, state)
+    summarized = state.summarized + session.dropped
+    if session_id and (state.summary, summarized) != (session.summary, session.summarized):
+        try:
+            await session_store.save_summary(session_id, state.summary, summarized)
+        except Exception as e:
+            logger.warning(f"Failed to save conversation summary: {str(e)}")
+    return conversation
+
+
+async def record_turn(session_id: Optional[str], query: str, response: str):
+    """Append an answered query to its session"""
+    if session_id is None:
+        return
+    try:
+        await session_store.append(session_id, [
+            {"role": "user", "content": query},
+            {"role": "assistant", "content": response}
+        ])
+    except Exception as e:
+        logger.warning(f"Failed to record conversation turn: {str(e)}")
+
+
 @app.get("/")
 def read_root():
     return {
@@ -147,45 +424,315 @@ def read_root():
     }
 
 
-async def call_calculator_tool(expression: str) -> Dict[str, Any]:
+async def call_tool_instances(tools: List[Dict], operation: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Call ``operation`` on the best of ``tools``, failing over to other replicas on errors"""
+    async def invoke(tool):
+        # One span per attempt, so failovers show up in the trace
+        with tracer.span("tool.request", tool_id=tool.get("id"), host=tool.get("host")):
+            return await tool_invoker.invoke(tool, operation, arguments)
+
+    tool_type = tools[0].get("tool_type", "unknown") if tools else "unknown"
+    started = time.perf_counter()
+    with tracer.span("tool.call", tool_type=tool_type, operation=operation) as span:
+        try:
+            result = await tool_balancer.call(tools, invoke, retry_on=(httpx.HTTPError, ToolUnavailable))
+        except (ToolUnavailable, ToolInvocationError) as e:
+            result = {"error": str(e)}
+        except Exception as e:
+            error_msg = f"Error calling tool: {str(e)}"
+            logger.error(error_msg)
+            result = {"error": error_msg}
+        if "error" in result:
+            span.status = "error"
+    tool_call_latency.observe(time.perf_counter() - started, tool_type, operation, "error" if "error" in result else "ok")
+    return result
+
+
+async def call_calculator_tool(expression: Union[str, List[str]]) -> Dict[str, Any]:
     """
-    Call the calculator tool to evaluate a mathematical expression
+    Call the calculator tool to evaluate one or several mathematical expressions
+
+    A single expression returns the /calculate response. Several expressions
+    go to /calculate/batch in one round trip (or, when no replica has the
+    batch endpoint, to concurrent /calculate calls) and return
+    {"results": [...]} with a result or error per expression. Each call is
+    spread over the registered calculator replicas by ``tool_balancer``.
     """
-    calculator_tools = [tool for tool in discovered_tools.values() if tool.get("tool_type") == "calculator"]
-    
-    if not calculator_tools:
-        logger.warning("No calculator tool found")
-        return {"error": "Calculator tool not available"}
-    
-    calculator = calculator_tools[0]
-    host = calculator.get("host", "example-tool")
-    port = calculator.get("port", 8080)
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            url = f"http://{host}:{port}/calculate"
-            logger.info(f"Calling calculator at {url} with expression: {expression}")
-            response = await client.post(url, json={"expression": expression})
-            
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(f"Calculator result: {result}")
-                return result
+    expressions = [expression] if isinstance(expression, str) else list(expression)
+    with tracer.span("calculator", expressions=len(expressions)):
+        calculator_tools = [tool for tool in discovered_tools.values() if tool.get("tool_type") == "calculator"]
+
+        if not calculator_tools:
+            logger.warning("No calculator tool found")
+            return {"error": "Calculator tool not available"}
+
+        calculator_tools = [tool for tool in calculator_tools if tool_invoker.supports(tool, "calculate")]
+        if not calculator_tools:
+            logger.warning("No calculator tool exposes a calculate operation")
+            return {"error": "Calculator tool not available"}
+
+        if len(expressions) == 1:
+            return await call_tool_instances(calculator_tools, "calculate", {"expression": expressions[0]})
+
+        batch_tools = [tool for tool in calculator_tools if tool_invoker.supports(tool, "calculate_batch")]
+        if batch_tools:
+            result = await call_tool_instances(batch_tools, "calculate_batch", {"expressions": expressions})
+        else:
+            singles = await asyncio.gather(*(
+                call_tool_instances(calculator_tools, "calculate", {"expression": e}) for e in expressions
+            ))
+            result = {"results": [{"expression": e, **single} for e, single in zip(expressions, singles)]}
+
+        if "error" not in result and all("error" in item for item in result["results"]):
+            result["error"] = "; ".join(f"{item['expression']}: {item['error']}" for item in result["results"])
+        return result
+
+
+def describe_calculation(calculator_result: Dict[str, Any]) -> str:
+    """Describe calculator output for the generation prompt"""
+    if "error" in calculator_result:
+        return f"I tried to calculate the expression but encountered an error: {calculator_result['error']}"
+    if "results" in calculator_result:
+        return "\n".join(
+            f"I tried to calculate '{item['expression']}' but encountered an error: {item['error']}"
+            if "error" in item else
+            f"I calculated '{item['expression']}' and the result is: {item['result']}"
+            for item in calculator_result["results"]
+        )
+    return f"I calculated '{calculator_result['expression']}' and the result is: {calculator_result['result']}"
+
+
+async def call_tool(tool_type: str, operation: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Call ``operation`` on any discovered tool of ``tool_type``"""
+    tools = [
+        tool for tool in discovered_tools.values()
+        if tool.get("tool_type") == tool_type and tool_invoker.supports(tool, operation)
+    ]
+    if not tools:
+        logger.warning(f"No {tool_type} tool exposes a {operation} operation")
+        return {"error": f"{tool_type} tool not available"}
+    return await call_tool_instances(tools, operation, arguments)
+
+
+def tool_catalog() -> Dict[str, List[str]]:
+    """Operations of the discovered tools other than the calculator, by tool type"""
+    catalog: Dict[str, set] = {}
+    for tool in discovered_tools.values():
+        tool_type = tool.get("tool_type")
+        if tool_type and tool_type != "calculator":
+            catalog.setdefault(tool_type, set()).update(tool_invoker.compile(tool).operations)
+    return {tool_type: sorted(operations) for tool_type, operations in sorted(catalog.items())}
+
+
+def plan_tool_calls(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Turn a query analysis into independent tool calls
+
+    Calculator expressions become one call (batched by call_calculator_tool);
+    entries of ``tool_calls`` name any other tool type, operation and arguments.
+    """
+    calls = []
+    if analysis.get("requires_calculator", False):
+        expressions = analysis.get("expressions") or [analysis.get("expression")]
+        expressions = [e for e in expressions if isinstance(e, str) and e.strip()]
+        if expressions:
+            calls.append({"tool_type": "calculator", "operation": "calculate", "expressions": expressions})
+
+    for call in analysis.get("tool_calls") or []:
+        if isinstance(call, dict) and isinstance(call.get("tool_type"), str) and isinstance(call.get("operation"), str):
+            arguments = call.get("arguments")
+            calls.append({
+                "tool_type": call["tool_type"],
+                "operation": call["operation"],
+                "arguments": arguments if isinstance(arguments, dict) else {}
+            })
+    return calls
+
+
+async def run_tool_calls(
+    calls: List[Dict[str, Any]],
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Run a query's tool calls concurrently and return one result per call
+
+    At most TOOL_FANOUT_CONCURRENCY calls run at once, and calls still
+    running (or waiting for a slot) TOOL_FANOUT_TIMEOUT seconds after the
+    fan-out started are cancelled with an error result, so the query takes
+    about as long as its slowest tool rather than the sum of all of them.
+    ``on_result`` is called with each {"call", "result"} as it finishes.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + TOOL_FANOUT_TIMEOUT
+    budget = asyncio.Semaphore(TOOL_FANOUT_CONCURRENCY)
+
+    async def execute(call):
+        if "expressions" in call:
+            return await call_calculator_tool(call["expressions"])
+        return await call_tool(call["tool_type"], call["operation"], call["arguments"])
+
+    async def execute_within_budget(call):
+        async with budget:
+            return await execute(call)
+
+    async def bounded(call):
+        try:
+            result = await asyncio.wait_for(execute_within_budget(call), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            logger.warning(f"{call['tool_type']} {call['operation']} call missed the {TOOL_FANOUT_TIMEOUT}s deadline")
+            result = {"error": f"Tool call timed out after {TOOL_FANOUT_TIMEOUT}s"}
+        except Exception as e:
+            logger.error(f"{call['tool_type']} {call['operation']} call failed: {str(e)}")
+            result = {"error": f"Tool call failed: {str(e)}"}
+        if on_result:
+            on_result({"call": call, "result": result})
+        return result
+
+    results = await asyncio.gather(*(bounded(call) for call in calls))
+    return [{"call": call, "result": result} for call, result in zip(calls, results)]
+
+
+def describe_tool_result(call: Dict[str, Any], result: Dict[str, Any]) -> str:
+    """Describe one tool call's output for the generation prompt"""
+    if "expressions" in call:
+        return describe_calculation(result)
+    tool = f"the {call['tool_type']} tool ({call['operation']})"
+    if "error" in result:
+        return f"I tried to use {tool} but encountered an error: {result['error']}"
+    return f"I used {tool} with {json.dumps(call['arguments'])} and it returned: {json.dumps(result)}"
+
+
+def successful_tools(tool_results: List[Dict[str, Any]]) -> List[str]:
+    """Tool types with at least one successful call, in call order"""
+    used = []
+    for item in tool_results:
+        tool_type = item["call"]["tool_type"]
+        if "error" not in item["result"] and tool_type not in used:
+            used.append(tool_type)
+    return used
+
+
+async def create_chat_completion(messages: List[Dict], stage: str, json_mode: bool = False) -> str:
+    """
+    Run one chat completion on the event loop without blocking it
+
+    At most LLM_MAX_CONCURRENCY calls run at once; each (including time spent
+    waiting for a slot) is cancelled after LLM_TIMEOUT seconds. ``stage`` is
+    "analysis" or "generation" and labels the call's latency.
+    """
+    async def bounded_call():
+        async with llm_semaphore:
+            span.set(queued_ms=round(span.elapsed * 1000, 3))
+            return await llm_provider.complete(messages, json_mode=json_mode)
+
+    started = time.perf_counter()
+    with tracer.span(f"llm.{stage}", model=llm_provider.model) as span:
+        try:
+            content = await asyncio.wait_for(bounded_call(), LLM_TIMEOUT)
+        except asyncio.TimeoutError:
+            llm_latency.observe(time.perf_counter() - started, stage, "timeout")
+            raise TimeoutError(f"LLM call timed out after {LLM_TIMEOUT}s")
+        except Exception:
+            llm_latency.observe(time.perf_counter() - started, stage, "error")
+            raise
+    elapsed = time.perf_counter() - started
+    fastpath_stats.observe_llm_call(stage, elapsed)
+    llm_latency.observe(elapsed, stage, "ok")
+    return content
+
+
+async def stream_chat_completion(messages: List[Dict], stage: str) -> AsyncIterator[str]:
+    """
+    Stream one chat completion as text deltas
+
+    Shares create_chat_completion's concurrency limit, and the whole stream
+    (including the wait for a slot) must finish within LLM_TIMEOUT seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LLM_TIMEOUT
+    started = time.perf_counter()
+    with tracer.span(f"llm.{stage}", model=llm_provider.model, streamed=True) as span:
+        try:
+            await asyncio.wait_for(llm_semaphore.acquire(), LLM_TIMEOUT)
+        except asyncio.TimeoutError:
+            llm_latency.observe(time.perf_counter() - started, stage, "timeout")
+            raise TimeoutError(f"LLM call timed out after {LLM_TIMEOUT}s")
+        span.set(queued_ms=round(span.elapsed * 1000, 3))
+
+        chunks = llm_provider.stream(messages)
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"LLM call timed out after {LLM_TIMEOUT}s")
+                if "first_token_ms" not in span.attributes:
+                    span.set(first_token_ms=round(span.elapsed * 1000, 3))
+                yield delta
+        except BaseException as e:
+            # GeneratorExit: the client went away mid-stream
+            if isinstance(e, TimeoutError):
+                outcome = "timeout"
+            elif isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                outcome = "cancelled"
             else:
-                error_msg = f"Calculator error: {response.text}"
-                logger.error(error_msg)
-                return {"error": error_msg}
-    except Exception as e:
-        error_msg = f"Error calling calculator tool: {str(e)}"
-        logger.error(error_msg)
-        return {"error": error_msg}
+                outcome = "error"
+            llm_latency.observe(time.perf_counter() - started, stage, outcome)
+            raise
+        finally:
+            llm_semaphore.release()
+            await chunks.aclose()
+    elapsed = time.perf_counter() - started
+    fastpath_stats.observe_llm_call(stage, elapsed)
+    llm_latency.observe(elapsed, stage, "ok")
+
+
+async def cached_llm_call(stage: str, query: str, compute, tool_result: Optional[Dict] = None,
+                          conversation: Optional[ConversationContext] = None) -> Dict[str, Any]:
+    """
+    Serve an analysis or generation result from the response cache
+
+    The key covers the stage, model, normalized query, tool result and
+    conversation context, so a different calculator result or an earlier
+    turn never reuses a cached answer. Results that carry an ``error`` are
+    not cached.
+    """
+    if llm_cache is None or llm_provider is None:
+        return await compute()
+    key = cache_key(stage, llm_provider.model, query, tool_result, conversation.key() if conversation else None)
+    return await llm_cache.get_or_compute(key, compute, cacheable=lambda result: "error" not in result)
+
+
+async def summarize_conversation(previous: Optional[str], messages: List[Dict]) -> str:
+    """Fold conversation turns that left the context window into the running summary"""
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    if previous:
+        transcript = f"Summary so far: {previous}\n\n{transcript}"
+    return await create_chat_completion(
+        messages=[
+            {
+                "role": "system",
+                "content": "Summarize this conversation in a few sentences for an assistant continuing it. "
+                           "Keep names, numbers, results and anything the user may refer back to."
+            },
+            {"role": "user", "content": truncate_tokens(transcript, CONTEXT_TOKEN_BUDGET)}
+        ],
+        stage="summary"
+    )
 
 
-async def analyze_query_with_openai(query: str) -> Dict[str, Any]:
+async def analyze_query_with_openai(query: str, catalog: Optional[Dict[str, List[str]]] = None,
+                                    conversation: Optional[ConversationContext] = None) -> Dict[str, Any]:
     """
     Use OpenAI to analyze the query and determine if it contains a math expression
+
+    With a ``catalog`` of other tools (operations by tool type) the analysis
+    may also ask for independent calls to them. The ``conversation`` lets
+    follow-up questions refer to earlier turns.
     """
-    if not openai_client:
+    if not llm_provider:
         return {"requires_calculator": False, "error": "OpenAI API key not configured"}
     
     system_prompt = (
@@ -195,21 +742,29 @@ async def analyze_query_with_openai(query: str) -> Dict[str, Any]:
         "Output in JSON format with the following fields:\n"
         "- requires_calculator: boolean indicating if a calculator is needed\n"
         "- expression: the cleaned mathematical expression if requires_calculator is true\n"
+        "- expressions: a list of cleaned expressions, only if the query asks for several separate calculations\n"
         "- explanation: brief explanation of your decision"
     )
+    if catalog:
+        system_prompt += (
+            "\n- tool_calls: a list of independent calls to other tools the query needs, each an object with "
+            "tool_type, operation and arguments (a JSON object), using only these tools and operations: "
+            f"{json.dumps(catalog)}"
+        )
     
     try:
-        response = openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
+        response = await create_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
+                *(conversation.messages() if conversation else []),
                 {"role": "user", "content": query}
             ],
-            response_format={"type": "json_object"}
+            stage="analysis",
+            json_mode=True
         )
         
-        analysis = json.loads(response.choices[0].message.content)
-        logger.info(f"OpenAI query analysis: {analysis}")
+        analysis = json.loads(response)
+        logger.debug(f"OpenAI query analysis: {analysis}")
         return analysis
     except Exception as e:
         error_message = f"Error analyzing query with OpenAI: {str(e)}"
@@ -217,40 +772,48 @@ async def analyze_query_with_openai(query: str) -> Dict[str, Any]:
         return {"requires_calculator": False, "error": error_message}
 
 
-async def generate_response_with_openai(query: str, calculator_result: Optional[Dict] = None) -> Dict[str, Any]:
-    """
-    Generate a response using OpenAI, incorporating calculator results if available
-    """
-    if not openai_client:
-        return {"response": "I'm sorry, but I cannot process your request because the OpenAI API key is not configured."}
-    
+def generation_messages(query: str, tool_results: Optional[List[Dict]] = None,
+                        conversation: Optional[ConversationContext] = None) -> List[Dict]:
+    """Prompt for the final answer, after the conversation so far and with any tool results as system context"""
     system_prompt = "You are a helpful assistant that answers user queries clearly and concisely."
     
     messages = [
         {"role": "system", "content": system_prompt},
+        *(conversation.messages() if conversation else []),
         {"role": "user", "content": query}
     ]
     
-    # If calculator was used, provide the result
-    if calculator_result:
-        if "error" in calculator_result:
-            calc_message = f"I tried to calculate the expression but encountered an error: {calculator_result['error']}"
-        else:
-            calc_message = (f"I calculated '{calculator_result['expression']}' and the result is: "
-                            f"{calculator_result['result']}")
-        
-        messages.append({"role": "system", "content": f"You have access to calculation results. {calc_message}"})    
+    # If tools were used, provide their results
+    if tool_results:
+        tool_message = "\n".join(describe_tool_result(item["call"], item["result"]) for item in tool_results)
+        messages.append({"role": "system", "content": f"You have access to tool results. {tool_message}"})
+    return messages
+
+
+async def generate_response_with_openai(query: str, tool_results: Optional[List[Dict]] = None,
+                                       conversation: Optional[ConversationContext] = None) -> Dict[str, Any]:
+    """
+    Generate a response using OpenAI, incorporating tool results if available
+    """
+    if not llm_provider:
+        return {
+            "response": "I'm sorry, but I cannot process your request because the OpenAI API key is not configured.",
+            "tools_used": [],
+            "confidence": 0.0
+        }
+    
+    tools_used = successful_tools(tool_results or [])
     
     try:
-        response = openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages
+        response = await create_chat_completion(
+            messages=generation_messages(query, tool_results, conversation),
+            stage="generation"
         )
         
         return {
-            "response": response.choices[0].message.content,
-            "tools_used": ["calculator"] if calculator_result and "error" not in calculator_result else [],
-            "confidence": 0.95 if calculator_result and "error" not in calculator_result else 0.8
+            "response": response,
+            "tools_used": tools_used,
+            "confidence": 0.95 if tools_used else 0.8
         }
     except Exception as e:
         error_message = f"Error generating response with OpenAI: {str(e)}"
@@ -258,36 +821,97 @@ async def generate_response_with_openai(query: str, calculator_result: Optional[
         return {
             "response": f"I encountered an error while processing your request: {str(e)}",
             "tools_used": [],
-            "confidence": 0.1
+            "confidence": 0.1,
+            "error": error_message
         }
 
 
+async def analyze_query(query: str, conversation: Optional[ConversationContext] = None
+                        ) -> Tuple[Optional[FastPathMatch], Dict[str, Any]]:
+    """
+    Analyze the query to determine if it's a calculation, locally if it is
+    plain arithmetic, otherwise with the LLM
+    """
+    fast_match = classify_query(query) if FASTPATH_ENABLED else None
+    if fast_match and fast_match.confidence < FASTPATH_MIN_CONFIDENCE:
+        fast_match = None
+
+    if fast_match:
+        return fast_match, {"requires_calculator": True, "expression": fast_match.expression}
+
+    catalog = tool_catalog()
+    analysis = await cached_llm_call(
+        "analysis",
+        query,
+        lambda: analyze_query_with_openai(query, catalog, conversation),
+        tool_result=catalog or None,
+        conversation=conversation
+    )
+    return None, analysis
+
+
+def fast_path_response(fast_match: Optional[FastPathMatch], tool_results: List[Dict],
+                       tools_used: List[str]) -> Optional[Dict[str, Any]]:
+    """The answer for a fast-path query straight from the calculator, if it applies"""
+    if not (fast_match and FASTPATH_ANSWER and "calculator" in tools_used):
+        return None
+    fastpath_stats.record_query(hit=True, skipped_stages=("analysis", "generation"))
+    return {
+        "response": f"{fast_match.expression} = {format_number(tool_results[0]['result']['result'])}",
+        "tools_used": tools_used,
+        "confidence": fast_match.confidence
+    }
+
+
 @app.post("/query", response_model=QueryResponse)
 async def process_query(request: QueryRequest):
     """
     Process a user query, potentially using discovered tools
     """
     query = request.query
-    calculator_result = None
+    tool_results = []
     tools_used = []
+    with tracer.span("session.load"):
+        session_id, session = await load_conversation(request.context)
     
     # Log the tools that are available
     tools_count = len(discovered_tools)
     logger.info(f"Processing query with {tools_count} available tools")
     
-    # 1. Analyze the query to determine if it's a calculation
-    analysis = await analyze_query_with_openai(query)
+    # 1. Analyze the query in the context of the conversation so far
+    with tracer.span("context", messages=len(session.messages)):
+        conversation = await build_context(session_id, session)
+    with tracer.span("analysis") as span:
+        fast_match, analysis = await analyze_query(query, conversation)
+        span.set(fast_path=fast_match is not None)
     
-    # 2. If it's a calculation, use the calculator tool
-    if analysis.get("requires_calculator", False):
-        expression = analysis.get("expression")
-        if expression:
-            calculator_result = await call_calculator_tool(expression)
-            if calculator_result and "error" not in calculator_result:
-                tools_used.append("calculator")
+    # 2. Run the tool calls the analysis asked for, concurrently (calculator
+    #    expressions are batched into one call)
+    tool_calls = plan_tool_calls(analysis)
+    if tool_calls:
+        with tracer.span("tools", calls=len(tool_calls)):
+            tool_results = await run_tool_calls(tool_calls)
+        tools_used = successful_tools(tool_results)
     
-    # 3. Generate a response using OpenAI
-    response_data = await generate_response_with_openai(query, calculator_result)
+    # 3. Answer directly from the fast path, or generate a response using OpenAI
+    answer = fast_path_response(fast_match, tool_results, tools_used)
+    if answer:
+        with tracer.span("session.record"):
+            await record_turn(session_id, query, answer["response"])
+        return answer
+
+    with tracer.span("generation"):
+        response_data = await cached_llm_call(
+            "generation",
+            query,
+            lambda: generate_response_with_openai(query, tool_results, conversation),
+            tool_result=tool_results or None,
+            conversation=conversation
+        )
+    fastpath_stats.record_query(hit=fast_match is not None, skipped_stages=("analysis",))
+    if "error" not in response_data:
+        with tracer.span("session.record"):
+            await record_turn(session_id, query, response_data["response"])
     
     return {
         "response": response_data["response"],
@@ -296,6 +920,102 @@ async def process_query(request: QueryRequest):
     }
 
 
+def sse_event(event: str, data: Any) -> str:
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def query_events(query: str, session_id: Optional[str] = None,
+                       session: Optional[Session] = None) -> AsyncIterator[str]:
+    """The /query pipeline as a sequence of server-sent events"""
+    logger.info(f"Streaming query with {len(discovered_tools)} available tools")
+    session = session or Session()
+    with tracer.span("context", messages=len(session.messages)):
+        conversation = await build_context(session_id, session)
+    with tracer.span("analysis") as span:
+        fast_match, analysis = await analyze_query(query, conversation)
+        span.set(fast_path=fast_match is not None)
+
+    tool_results = []
+    tool_calls = plan_tool_calls(analysis)
+    if tool_calls:
+        for call in tool_calls:
+            yield sse_event("tool_call", call)
+        finished: asyncio.Queue = asyncio.Queue()
+        with tracer.span("tools", calls=len(tool_calls)):
+            fan_out = asyncio.create_task(run_tool_calls(tool_calls, on_result=finished.put_nowait))
+            try:
+                for _ in tool_calls:
+                    yield sse_event("tool_result", await finished.get())
+                tool_results = await fan_out
+            finally:
+                fan_out.cancel()
+    tools_used = successful_tools(tool_results)
+
+    answer = fast_path_response(fast_match, tool_results, tools_used)
+    if answer is None:
+        fastpath_stats.record_query(hit=fast_match is not None, skipped_stages=("analysis",))
+        if llm_provider is None:
+            answer = await generate_response_with_openai(query, tool_results, conversation)
+
+    key = None
+    if answer is None and llm_cache is not None:
+        key = cache_key("generation", llm_provider.model, query, tool_results or None, conversation.key())
+        answer = await llm_cache.get(key)
+
+    if answer is None:
+        pieces = []
+        try:
+            messages = generation_messages(query, tool_results, conversation)
+            with tracer.span("generation"):
+                async for delta in stream_chat_completion(messages, "generation"):
+                    pieces.append(delta)
+                    yield sse_event("token", {"delta": delta})
+        except Exception as e:
+            error_message = f"Error generating response with OpenAI: {str(e)}"
+            logger.error(error_message)
+            yield sse_event("error", {"detail": error_message})
+            return
+        answer = {
+            "response": "".join(pieces),
+            "tools_used": tools_used,
+            "confidence": 0.95 if tools_used else 0.8
+        }
+        if key is not None:
+            await llm_cache.set(key, answer)
+    else:
+        # Fast-path, cached and unconfigured answers arrive in one piece
+        yield sse_event("token", {"delta": answer["response"]})
+
+    if "error" not in answer:
+        with tracer.span("session.record"):
+            await record_turn(session_id, query, answer["response"])
+    yield sse_event("done", {
+        "response": answer["response"],
+        "tools_used": answer["tools_used"],
+        "confidence": answer["confidence"]
+    })
+
+
+@app.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """
+    Process a user query and stream the answer as server-sent events
+
+    Emits ``tool_call`` for each tool call as it starts, ``tool_result`` as
+    each one finishes, ``token`` for each piece of the answer, and finally
+    ``done`` with the same fields as /query (or ``error``).
+    """
+    # Resolved up front so an out-of-sync session is a plain 409
+    with tracer.span("session.load"):
+        session_id, session = await load_conversation(request.context)
+    return StreamingResponse(
+        query_events(request.query, session_id, session),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/tools")
 def list_available_tools():
     """
@@ -306,6 +1026,37 @@ def list_available_tools():
     }
 
 
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """
+    The messages the agent holds for a conversation session
+    """
+    try:
+        session = await session_store.load(session_id)
+    except SessionStoreUnavailable as e:
+        logger.error(f"Session store error: {str(e)}")
+        raise HTTPException(status_code=503, detail="Session store unavailable")
+    return {
+        "session_id": session_id,
+        "length": session.length,
+        "messages": session.messages
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    """
+    Counters for the agent's query pipeline
+    """
+    return {
+        "fast_path": fastpath_stats.snapshot(),
+        "llm_cache": llm_cache.snapshot() if llm_cache else None,
+        "tool_balancer": tool_balancer.snapshot(),
+        "tool_invoker": tool_invoker.snapshot(),
+        "context": {**context_manager.snapshot(), "sessions": await session_store.count()}
+    }
+
+
 @app.get("/health")
 def health_check():
     """Health check endpoint for the agent"""
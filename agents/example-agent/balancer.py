@@ -0,0 +1,174 @@
+"""
+Client-side load balancing across tool replicas
+
+``ToolBalancer`` orders the registered instances of a tool for each call
+using one of three strategies:
+
+- ``round_robin``: rotate through the instances
+- ``least_outstanding``: prefer the instance with the fewest calls in flight
+- ``ewma``: prefer the lowest moving-average latency, weighted by calls in
+  flight so a fast instance is not flooded
+
+Instances that fail ``failure_threshold`` calls in a row are ejected for
+``ejection_time`` seconds (doubling on each repeat ejection, up to
+``max_ejection_time``). A failed call moves on to the next instance, so one
+bad replica costs a retry rather than a failed request.
+"""
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("round_robin", "least_outstanding", "ewma")
+
+
+class InstanceStats:
+    """Per-instance counters used for selection and outlier detection"""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "outstanding": self.outstanding,
+            "latency": self.latency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ejected": self.ejected_until > time.monotonic(),
+        }
+
+
+class ToolBalancer:
+    """Selects tool instances and fails over between them"""
+
+    def __init__(
+        self,
+        strategy: str = "round_robin",
+        max_attempts: int = 3,
+        failure_threshold: int = 3,
+        ejection_time: float = 30.0,
+        max_ejection_time: float = 300.0,
+        smoothing: float = 0.3,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        self.strategy = strategy
+        self.max_attempts = max_attempts
+        self.failure_threshold = failure_threshold
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.smoothing = smoothing
+        self.instances: Dict[str, InstanceStats] = {}
+        self.counter = itertools.count()
+        self.failovers = 0
+
+    def stats(self, instance_id: str) -> InstanceStats:
+        stats = self.instances.get(instance_id)
+        if stats is None:
+            stats = self.instances[instance_id] = InstanceStats()
+        return stats
+
+    def forget(self, instance_id: str):
+        """Drop the counters of an instance that left the registry"""
+        self.instances.pop(instance_id, None)
+
+    def order(self, tools: List[Dict]) -> List[Dict]:
+        """
+        Return ``tools`` in the order they should be tried
+
+        Healthy instances come first, best first by the configured strategy;
+        ejected instances follow as a last resort, so traffic still flows if
+        every replica has been ejected.
+        """
+        now = time.monotonic()
+        tools = sorted(tools, key=lambda tool: tool["id"])
+        healthy = [tool for tool in tools if self.stats(tool["id"]).ejected_until <= now]
+        ejected = [tool for tool in tools if self.stats(tool["id"]).ejected_until > now]
+
+        if self.strategy == "round_robin":
+            if healthy:
+                start = next(self.counter) % len(healthy)
+                healthy = healthy[start:] + healthy[:start]
+        elif self.strategy == "least_outstanding":
+            healthy.sort(key=lambda tool: self.stats(tool["id"]).outstanding)
+        else:
+            healthy.sort(key=lambda tool: self._cost(self.stats(tool["id"])))
+
+        ejected.sort(key=lambda tool: self.stats(tool["id"]).ejected_until)
+        return healthy + ejected
+
+    @staticmethod
+    def _cost(stats: InstanceStats) -> float:
+        # Untried instances cost nothing, so every replica gets sampled
+        return (stats.latency or 0.0) * (stats.outstanding + 1)
+
+    def record(self, instance_id: str, seconds: float, success: bool):
+        stats = self.stats(instance_id)
+        stats.requests += 1
+        if success:
+            # Only successes feed the latency average; fast failures must not attract traffic
+            stats.latency = seconds if stats.latency is None else (
+                self.smoothing * seconds + (1 - self.smoothing) * stats.latency
+            )
+            stats.consecutive_failures = 0
+            return
+
+        stats.failures += 1
+        stats.consecutive_failures += 1
+        if stats.consecutive_failures >= self.failure_threshold:
+            duration = min(self.ejection_time * 2 ** stats.ejections, self.max_ejection_time)
+            stats.ejections += 1
+            stats.consecutive_failures = 0
+            stats.ejected_until = time.monotonic() + duration
+            logger.warning(f"Ejecting tool instance {instance_id} for {duration:.0f}s")
+
+    async def call(
+        self,
+        tools: List[Dict],
+        request: Callable[[Dict], Awaitable[Any]],
+        retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    ) -> Any:
+        """
+        Run ``request(tool)`` on the best instance, failing over on errors
+
+        Exceptions in ``retry_on`` mark the instance as failed and move on to
+        the next one, up to ``max_attempts`` instances; the last exception
+        is raised if they all fail.
+        """
+        if not tools:
+            raise ValueError("No tool instances to call")
+        last_error = None
+        for attempt, tool in enumerate(self.order(tools)[:self.max_attempts]):
+            if attempt:
+                self.failovers += 1
+                logger.info(f"Failing over to tool instance {tool['id']}")
+            stats = self.stats(tool["id"])
+            stats.outstanding += 1
+            started = time.monotonic()
+            try:
+                result = await request(tool)
+            except retry_on as e:
+                self.record(tool["id"], time.monotonic() - started, success=False)
+                last_error = e
+                continue
+            finally:
+                stats.outstanding -= 1
+            self.record(tool["id"], time.monotonic() - started, success=True)
+            return result
+        raise last_error
+
+    def snapshot(self) -> Dict:
+        return {
+            "strategy": self.strategy,
+            "failovers": self.failovers,
+            "instances": {instance_id: stats.snapshot() for instance_id, stats in self.instances.items()},
+        }
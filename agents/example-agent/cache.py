@@ -0,0 +1,178 @@
+"""
+Response cache for the agent's LLM calls
+
+Entries are keyed on the call kind, model, normalized query text, and
+fingerprints of any tool result fed into the prompt and of the conversation
+context before the query. A local LRU with TTL answers most hits; an
+optional Redis layer shares entries between agent replicas. Concurrent
+misses for the same key wait for a single LLM call.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+TRAILING_PUNCTUATION_PATTERN = re.compile(r"[\s\?\.!]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return TRAILING_PUNCTUATION_PATTERN.sub("", WHITESPACE_PATTERN.sub(" ", query.strip().lower()))
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_key(kind: str, model: str, query: str, tool_result: Any = None, context: Optional[str] = None) -> str:
+    return fingerprint([kind, model, normalize_query(query), tool_result, context])
+
+
+class LRUCache:
+    """Bounded in-process cache with least-recently-used eviction and a TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+class ResponseCache:
+    """
+    Two-level LLM response cache: local LRU, then optional shared Redis
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, redis_url: Optional[str] = None,
+                 prefix: str = "agent:llm-cache"):
+        self.local = LRUCache(maxsize, ttl)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.redis = None
+        if redis_url:
+            # Imported lazily so the local-only cache does not need a Redis client
+            import redis.asyncio as redis
+            self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.shared_errors = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(f"{self.prefix}:{key}")
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"Shared LLM cache read failed: {str(e)}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+                self.hits += 1
+                self.shared_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        self.local.set(key, value)
+        if self.redis is not None:
+            try:
+                await self.redis.set(f"{self.prefix}:{key}", json.dumps(value), ex=max(int(self.ttl), 1))
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"Shared LLM cache write failed: {str(e)}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """
+        Return the cached value for ``key`` or compute, cache and return it
+
+        Callers that miss while the same key is already being computed wait
+        for that result instead of making their own LLM call. Values for
+        which ``cacheable`` is False (e.g. errors) are returned but not stored.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            value = await asyncio.shield(pending)
+            # The first caller failed; fall back to our own call
+            return value if value is not None else await compute()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except BaseException:
+            future.set_result(None)
+            raise
+        finally:
+            del self._inflight[key]
+
+        future.set_result(value)
+        if cacheable(value):
+            await self.set(key, value)
+        return value
+
+    def snapshot(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "evictions": self.local.evictions,
+            "size": len(self.local),
+            "shared": self.redis is not None,
+            "shared_errors": self.shared_errors,
+        }
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
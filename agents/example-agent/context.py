@@ -0,0 +1,155 @@
+"""
+Bounded conversation context for the agent's prompts
+
+``ContextManager.build`` fits a conversation into a token budget. The most
+recent messages that fit are kept verbatim (a sliding window) and everything
+older is folded into a rolling summary. Summaries are incremental: only the
+messages that newly slid out of the window are summarized, on top of the
+previous summary, and results are cached. A long conversation therefore
+costs one small summarization call every few turns instead of an ever
+growing prompt.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache import LRUCache, fingerprint
+from llm import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Per-message formatting overhead in chat prompts, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+# Characters of each message kept by the extractive fallback summary
+EXTRACT_CHARACTERS = 200
+ROLES = ("user", "assistant")
+
+Summarizer = Callable[[Optional[str], List[Dict]], Awaitable[str]]
+
+
+def message_tokens(message: Dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def normalize_history(history: Optional[List]) -> List[Dict]:
+    """Keep only well-formed user and assistant messages, as {role, content}"""
+    return [
+        {"role": message["role"], "content": message["content"]}
+        for message in history or []
+        if isinstance(message, dict) and message.get("role") in ROLES and isinstance(message.get("content"), str)
+    ]
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Keep the end of ``text`` within roughly ``max_tokens`` tokens"""
+    max_characters = max_tokens * 4
+    return text if len(text) <= max_characters else "..." + text[-max_characters:]
+
+
+def extractive_summary(previous: Optional[str], messages: List[Dict]) -> str:
+    """Summary without an LLM: the start of each message, after the previous summary"""
+    lines = [previous] if previous else []
+    lines.extend(f"{message['role']}: {message['content'][:EXTRACT_CHARACTERS]}" for message in messages)
+    return "\n".join(lines)
+
+
+@dataclass
+class SummaryState:
+    """How much of a conversation has been folded into its rolling summary"""
+    summary: Optional[str] = None
+    summarized: int = 0
+
+
+@dataclass
+class ConversationContext:
+    summary: Optional[str] = None
+    window: List[Dict] = field(default_factory=list)
+
+    def messages(self) -> List[Dict]:
+        """Prompt messages: the summary as system context, then the window"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        return messages + self.window
+
+    def key(self) -> Optional[str]:
+        """Fingerprint for response cache keys; None for an empty context"""
+        if not self.summary and not self.window:
+            return None
+        return fingerprint([self.summary, self.window])
+
+
+class ContextManager:
+    """
+    Fits conversation history into ``budget_tokens``
+
+    Once the history no longer fits, ``summary_tokens`` of the budget are
+    reserved for the summary and the rest holds the newest messages.
+    ``summarize(previous_summary, messages)`` produces the new summary;
+    without it, or if it fails, an extractive summary is used.
+    """
+
+    def __init__(self, budget_tokens: int, summary_tokens: int, summarize: Optional[Summarizer] = None,
+                 cache_size: int = 1024, cache_ttl: float = 3600.0):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.summaries = 0
+        self.summary_cache_hits = 0
+        self.summary_failures = 0
+
+    async def build(self, history: List[Dict], state: Optional[SummaryState] = None) -> ConversationContext:
+        """
+        Return the summary and message window for ``history``
+
+        ``state`` carries a session's rolling summary between calls and is
+        updated in place; without it the summary is looked up by content.
+        """
+        state = state or SummaryState()
+        if state.summarized > len(history):
+            # The history was replaced; start over
+            state.summary, state.summarized = None, 0
+
+        if state.summarized == 0 and sum(map(message_tokens, history)) <= self.budget_tokens:
+            return ConversationContext(window=history)
+
+        # Slide the window back from the newest message while it fits
+        window_budget = self.budget_tokens - self.summary_tokens
+        cut, used = len(history), 0
+        while cut > state.summarized and used + message_tokens(history[cut - 1]) <= window_budget:
+            cut -= 1
+            used += message_tokens(history[cut])
+
+        if cut > state.summarized:
+            state.summary = await self._summarize(state.summary, history[state.summarized:cut])
+            state.summarized = cut
+        return ConversationContext(summary=state.summary, window=history[cut:])
+
+    async def _summarize(self, previous: Optional[str], messages: List[Dict]) -> str:
+        key = fingerprint([previous, messages])
+        summary = self.cache.get(key)
+        if summary is not None:
+            self.summary_cache_hits += 1
+            return summary
+
+        self.summaries += 1
+        summary = None
+        if self.summarize is not None:
+            try:
+                summary = await self.summarize(previous, messages)
+            except Exception as e:
+                self.summary_failures += 1
+                logger.warning(f"Conversation summary failed, using extract: {str(e)}")
+        summary = truncate_tokens(summary or extractive_summary(previous, messages), self.summary_tokens)
+        self.cache.set(key, summary)
+        return summary
+
+    def snapshot(self) -> Dict:
+        return {
+            "budget_tokens": self.budget_tokens,
+            "summary_tokens": self.summary_tokens,
+            "summaries": self.summaries,
+            "summary_cache_hits": self.summary_cache_hits,
+            "summary_failures": self.summary_failures,
+        }
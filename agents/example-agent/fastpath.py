@@ -0,0 +1,128 @@
+"""
+Local pre-classifier for queries that are plain arithmetic
+
+Queries like "2 + 2" or "what is (3 + 4) * 12?" do not need an LLM to find
+the expression. ``classify_query`` recognises them with a regex and AST check
+so the agent can skip the analysis call and, optionally, the generation call.
+"""
+import ast
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Lead-in phrases stripped before checking for a bare expression
+LEAD_IN_PATTERN = re.compile(
+    r"^(please\s+)?(what\s+is|what's|whats|calculate|compute|evaluate|solve|how\s+much\s+is)\s+",
+    re.IGNORECASE,
+)
+TRAILING_PATTERN = re.compile(r"[\s\?\.!=]+$")
+# Only digits, operators, parentheses and whitespace may remain
+ARITHMETIC_PATTERN = re.compile(r"^[\d\.\s\+\-\*/%\(\)]+$")
+SYMBOL_REPLACEMENTS = (("×", "*"), ("÷", "/"), ("^", "**"))
+# "12 x 7" style multiplication
+TIMES_PATTERN = re.compile(r"(?<=[\d\)])\s*[xX]\s*(?=[\d\(])")
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+)
+
+# Confidence for a bare expression, and for one behind a lead-in phrase
+BARE_CONFIDENCE = 1.0
+LEAD_IN_CONFIDENCE = 0.95
+
+
+@dataclass
+class FastPathMatch:
+    expression: str
+    confidence: float
+
+
+def is_arithmetic(expression: str) -> bool:
+    """True if ``expression`` parses to numbers joined by arithmetic operators"""
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError:
+        return False
+    nodes = list(ast.walk(tree))
+    if not any(isinstance(node, ast.BinOp) for node in nodes):
+        return False
+    return all(
+        isinstance(node, ALLOWED_NODES)
+        and (not isinstance(node, ast.Constant) or type(node.value) in (int, float))
+        for node in nodes
+    )
+
+
+def classify_query(query: str) -> Optional[FastPathMatch]:
+    """
+    Return the arithmetic expression a query asks for, or None
+
+    Only queries that are entirely an expression (optionally introduced by a
+    phrase like "what is") match; anything with other words goes to the LLM.
+    """
+    text = query.strip()
+    for symbol, replacement in SYMBOL_REPLACEMENTS:
+        text = text.replace(symbol, replacement)
+    text = TIMES_PATTERN.sub(" * ", text)
+
+    confidence = BARE_CONFIDENCE
+    stripped = LEAD_IN_PATTERN.sub("", text)
+    if stripped != text:
+        confidence = LEAD_IN_CONFIDENCE
+    expression = TRAILING_PATTERN.sub("", stripped).strip()
+
+    if not expression or not ARITHMETIC_PATTERN.match(expression):
+        return None
+    if not is_arithmetic(expression):
+        return None
+    return FastPathMatch(expression=expression, confidence=confidence)
+
+
+def format_number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return str(value)
+
+
+class FastPathStats:
+    """
+    Counters for how often the fast path fires and the LLM time it saves
+
+    Saved latency is estimated from a moving average of the LLM calls the
+    slow path actually makes.
+    """
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self.queries = 0
+        self.hits = 0
+        self.llm_calls_skipped = 0
+        self.latency_saved = 0.0
+        self.llm_latency: Dict[str, Optional[float]] = {"analysis": None, "generation": None}
+
+    def observe_llm_call(self, stage: str, seconds: float):
+        previous = self.llm_latency.get(stage)
+        self.llm_latency[stage] = seconds if previous is None else (
+            self.smoothing * seconds + (1 - self.smoothing) * previous
+        )
+
+    def record_query(self, hit: bool, skipped_stages=()):
+        self.queries += 1
+        if not hit:
+            return
+        self.hits += 1
+        for stage in skipped_stages:
+            self.llm_calls_skipped += 1
+            self.latency_saved += self.llm_latency[stage] or 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "queries": self.queries,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.queries if self.queries else 0.0,
+            "llm_calls_skipped": self.llm_calls_skipped,
+            "estimated_latency_saved_seconds": round(self.latency_saved, 3),
+            "avg_llm_latency_seconds": dict(self.llm_latency),
+        }
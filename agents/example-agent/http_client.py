@@ -0,0 +1,66 @@
+"""
+Shared outbound HTTP client
+
+One pooled httpx.AsyncClient per process, opened on startup and closed on
+shutdown, so registry and tool calls reuse warm keep-alive connections
+instead of paying for a new TCP connection and pool on every request.
+"""
+import os
+from typing import Optional
+
+import httpx
+
+# Connection pool limits
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# Default timeouts (in seconds); individual calls can override them
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+
+# HTTP/2 is negotiated over TLS; plain-http peers keep using HTTP/1.1
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "true").lower() == "true"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        http2=HTTP2_ENABLED and _http2_available(),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it if startup has not run yet"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def start_client() -> httpx.AsyncClient:
+    """Open the shared client; call from the app's startup event"""
+    return get_client()
+
+
+async def close_client():
+    """Close the shared client and its pooled connections; call on shutdown"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
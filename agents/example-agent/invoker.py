@@ -0,0 +1,294 @@
+"""
+Generic tool invocation driven by each tool's registered OpenAPI schema
+
+``ToolInvoker.compile`` turns a tool's ``endpoints`` and ``schema`` into
+``Operation`` objects once: a URL template, the query and path parameter
+names, and validators for the request body and the success response built
+ahead of time from the JSON schemas. Compiled tools are cached by id and
+recompiled when discovery reports a different version, so a call costs a
+dict lookup plus the pre-built checks.
+
+Validators cover the JSON-schema subset tools use here: ``type``,
+``nullable``, ``enum``, ``properties``, ``required``,
+``additionalProperties``, ``items``, ``oneOf``/``anyOf`` (any match is
+accepted) and local ``$ref`` into ``components``.
+"""
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from http_client import get_client
+from tracing import inject
+
+logger = logging.getLogger(__name__)
+
+# Statuses that mean "try another replica" rather than "bad request"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+PATH_PARAM_PATTERN = re.compile(r"{(\w+)}")
+HTTP_METHODS = ("get", "post", "put", "patch", "delete")
+
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "null": type(None),
+}
+
+Validator = Callable[[Any, str], None]
+
+
+class ToolInvocationError(Exception):
+    """A call does not match the tool's schema, or the tool's reply does not"""
+
+
+class ToolUnavailable(Exception):
+    """A tool instance failed in a way another replica might not"""
+
+
+def _always_valid(value: Any, path: str = "$"):
+    pass
+
+
+def compile_validator(schema: Optional[Dict], root: Optional[Dict] = None) -> Validator:
+    """
+    Build a function that checks a value against ``schema``
+
+    The function raises ToolInvocationError naming the offending location
+    (e.g. ``$.expressions[2]``). References are resolved against ``root``
+    while compiling, not per call.
+    """
+    if not schema:
+        return _always_valid
+    root = root or {}
+
+    if "$ref" in schema:
+        ref = schema["$ref"]
+        if not ref.startswith("#/"):
+            raise ToolInvocationError(f"Unsupported schema reference: {ref}")
+        target = root
+        for part in ref[2:].split("/"):
+            target = target.get(part, {})
+        return compile_validator(target, root)
+
+    checks: List[Validator] = []
+
+    if "type" in schema:
+        expected = schema["type"]
+        python_type = JSON_TYPES.get(expected)
+        if python_type is not None:
+            # bool is an int subclass but not a JSON number
+            exclude_bool = expected in ("number", "integer")
+
+            def check_type(value, path):
+                if not isinstance(value, python_type) or (exclude_bool and isinstance(value, bool)):
+                    raise ToolInvocationError(f"{path}: expected {expected}")
+            checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value, path):
+            if value not in allowed:
+                raise ToolInvocationError(f"{path}: must be one of {allowed}")
+        checks.append(check_enum)
+
+    if "properties" in schema or "required" in schema or "additionalProperties" in schema:
+        properties = {
+            name: compile_validator(subschema, root)
+            for name, subschema in schema.get("properties", {}).items()
+        }
+        required = schema.get("required", [])
+        additional = schema.get("additionalProperties", True)
+        additional_check = compile_validator(additional, root) if isinstance(additional, dict) else None
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    raise ToolInvocationError(f"{path}.{name}: required")
+            for name, item in value.items():
+                check = properties.get(name)
+                if check is not None:
+                    check(item, f"{path}.{name}")
+                elif additional_check is not None:
+                    additional_check(item, f"{path}.{name}")
+                elif additional is False:
+                    raise ToolInvocationError(f"{path}.{name}: unexpected property")
+        checks.append(check_object)
+
+    if "items" in schema:
+        item_check = compile_validator(schema["items"], root)
+
+        def check_items(value, path):
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    item_check(item, f"{path}[{index}]")
+        checks.append(check_items)
+
+    alternatives = schema.get("oneOf") or schema.get("anyOf")
+    if alternatives:
+        options = [compile_validator(option, root) for option in alternatives]
+
+        def check_alternatives(value, path):
+            for option in options:
+                try:
+                    option(value, path)
+                    return
+                except ToolInvocationError:
+                    continue
+            raise ToolInvocationError(f"{path}: matches none of the allowed schemas")
+        checks.append(check_alternatives)
+
+    nullable = schema.get("nullable", False)
+
+    def validate(value, path="$"):
+        if value is None and nullable:
+            return
+        for check in checks:
+            check(value, path)
+    return validate
+
+
+def _json_schema(content: Optional[Dict]) -> Optional[Dict]:
+    """The JSON schema of an OpenAPI ``content`` map, if it has one"""
+    return ((content or {}).get("application/json") or {}).get("schema")
+
+
+class Operation:
+    """One compiled tool endpoint"""
+
+    def __init__(self, name: str, method: str, path: str, spec: Optional[Dict] = None, root: Optional[Dict] = None):
+        described = spec is not None
+        spec = spec or {}
+        self.name = name
+        self.method = method.upper()
+        self.path = path
+        self.path_params = PATH_PARAM_PATTERN.findall(path)
+        self.query_params = [
+            parameter["name"] for parameter in spec.get("parameters", [])
+            if parameter.get("in") == "query"
+        ]
+        body = spec.get("requestBody")
+        # Endpoints missing from the schema take a JSON body if the method allows one
+        self.has_body = body is not None or (not described and self.method in ("POST", "PUT", "PATCH"))
+        self.body_required = bool(body and body.get("required"))
+        self.validate_body = compile_validator(_json_schema(body and body.get("content")), root)
+        responses = spec.get("responses", {})
+        success = next((responses[code] for code in ("200", "201") if code in responses), None)
+        self.validate_response = compile_validator(_json_schema(success and success.get("content")), root)
+
+    def build(self, arguments: Dict[str, Any]) -> Tuple[str, Dict, Optional[Dict]]:
+        """
+        Split ``arguments`` into (path, query params, JSON body) and validate
+
+        Path and query parameters are taken by name; everything else is the
+        request body.
+        """
+        arguments = dict(arguments)
+        try:
+            path = self.path.format(**{name: arguments.pop(name) for name in self.path_params})
+        except KeyError as e:
+            raise ToolInvocationError(f"Missing path parameter {e} for {self.name}")
+        params = {name: arguments.pop(name) for name in self.query_params if name in arguments}
+
+        body = None
+        if self.has_body and (arguments or self.body_required):
+            self.validate_body(arguments)
+            body = arguments
+        elif arguments:
+            raise ToolInvocationError(f"{self.name} takes no body, got {sorted(arguments)}")
+        return path, params, body
+
+
+class CompiledTool:
+    """A tool's operations, compiled from one version of its registration"""
+
+    def __init__(self, tool: Dict):
+        self.version = tool.get("version")
+        self.operations: Dict[str, Operation] = {}
+        schema = tool.get("schema") or {}
+        paths = schema.get("paths", {})
+
+        # Endpoints named at registration, with their schema when there is one
+        named = set()
+        for name, endpoint in (tool.get("endpoints") or {}).items():
+            method = endpoint.get("method", "POST").lower()
+            path = endpoint["path"]
+            spec = paths.get(path, {}).get(method)
+            self.operations[name] = Operation(name, method, path, spec, schema)
+            named.add((path, method))
+
+        # Remaining schema operations, by operationId or "METHOD /path"
+        for path, item in paths.items():
+            for method in HTTP_METHODS:
+                spec = item.get(method)
+                if spec is None or (path, method) in named:
+                    continue
+                name = spec.get("operationId") or f"{method.upper()} {path}"
+                self.operations[name] = Operation(name, method, path, spec, schema)
+
+
+class ToolInvoker:
+    """Calls any discovered tool through its compiled operations"""
+
+    def __init__(self):
+        self.compiled: Dict[str, CompiledTool] = {}
+        self.compilations = 0
+        self.calls = 0
+
+    def compile(self, tool: Dict) -> CompiledTool:
+        """Return the tool's compiled operations, recompiling on a version change"""
+        compiled = self.compiled.get(tool["id"])
+        if compiled is None or compiled.version != tool.get("version"):
+            compiled = self.compiled[tool["id"]] = CompiledTool(tool)
+            self.compilations += 1
+        return compiled
+
+    def invalidate(self, tool_id: str):
+        self.compiled.pop(tool_id, None)
+
+    def supports(self, tool: Dict, operation: str) -> bool:
+        return operation in self.compile(tool).operations
+
+    async def invoke(self, tool: Dict, operation: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Call ``operation`` on one tool instance and return the JSON reply
+
+        Tool-side errors (e.g. a 400 for an invalid expression) come back as
+        {"error": ...}. Transport errors (httpx.HTTPError) and overloaded or
+        failing instances (ToolUnavailable) raise so callers can fail over;
+        calls or replies that break the schema raise ToolInvocationError.
+        """
+        compiled = self.compile(tool)
+        spec = compiled.operations.get(operation)
+        if spec is None:
+            raise ToolInvocationError(f"{tool.get('name', tool['id'])} has no operation {operation}")
+        path, params, body = spec.build(arguments)
+
+        self.calls += 1
+        url = f"http://{tool.get('host')}:{tool.get('port')}{path}"
+        logger.debug(f"Calling {spec.method} {url} with {body or params}")
+        response = await get_client().request(spec.method, url, params=params or None, json=body, headers=inject())
+
+        if response.is_success:
+            result = response.json()
+            spec.validate_response(result)
+            logger.debug(f"{tool.get('name')} result: {result}")
+            return result
+        error_msg = f"{tool.get('name')} error: {response.text}"
+        logger.error(error_msg)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise ToolUnavailable(error_msg)
+        return {"error": error_msg}
+
+    def snapshot(self) -> Dict:
+        return {
+            "compiled_tools": len(self.compiled),
+            "compilations": self.compilations,
+            "calls": self.calls,
+        }
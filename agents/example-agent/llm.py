@@ -0,0 +1,188 @@
+"""
+LLM backends for the agent
+
+``OpenAIProvider`` talks to the OpenAI API. ``StubProvider`` is a local,
+deterministic stand-in with configurable latency and token rate, so the
+/query pipeline can be load-tested and benchmarked without network access.
+"""
+import asyncio
+import json
+import re
+from typing import AsyncIterator, Dict, List, Optional
+
+# Streamed stub replies are split into pieces of about one token each
+STUB_TOKEN_PATTERN = re.compile(r"\S{1,4}\s*|\s+")
+
+# Runs of digits, operators and parentheses; each one containing an operator
+# is treated as an expression to calculate
+EXPRESSION_PATTERN = re.compile(r"[\d\.\s\+\-\*/%\(\)]+")
+OPERATOR_PATTERN = re.compile(r"\d\s*(\*\*|[\+\-\*/%])\s*[\d\(\-]")
+CALCULATION_RESULT_PATTERN = re.compile(r"I calculated '(.+?)' and the result is: (\S+)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+class LLMProvider:
+    """Chat-completion backend used by the agent"""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def complete(self, messages: List[Dict], json_mode: bool = False) -> str:
+        """
+        Return the assistant message for ``messages``
+
+        With ``json_mode`` the reply must be a single JSON object.
+        """
+        raise NotImplementedError
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        """
+        Yield the assistant message for ``messages`` in pieces as it is produced
+
+        Backends without native streaming yield the whole reply at once.
+        """
+        yield await self.complete(messages)
+
+    async def close(self):
+        pass
+
+
+class OpenAIProvider(LLMProvider):
+    """Async OpenAI chat-completions backend"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str, timeout: float):
+        super().__init__(model)
+        # Imported here so the stub backend works without the openai package
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=api_key, timeout=timeout)
+
+    async def complete(self, messages: List[Dict], json_mode: bool = False) -> str:
+        kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            **kwargs
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True
+        )
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Release the HTTP response if the consumer stops early
+            await response.close()
+
+    async def close(self):
+        await self.client.close()
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic local backend for offline load tests and benchmarks
+
+    Each call sleeps ``latency`` seconds (time to first token) plus the
+    reply's estimated token count divided by ``tokens_per_second``; streamed
+    replies arrive at that token rate after the first-token delay. JSON-mode
+    calls answer the analysis prompt with ``requires_calculator`` and
+    ``expression`` extracted from the user message by pattern matching; other
+    calls echo the calculation results found in the system messages.
+    """
+
+    name = "stub"
+
+    def __init__(self, model: str = "stub", latency: float = 0.05, tokens_per_second: float = 100.0):
+        super().__init__(model)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+
+    async def complete(self, messages: List[Dict], json_mode: bool = False) -> str:
+        query = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if json_mode:
+            reply = json.dumps(self.analyze(query))
+        else:
+            reply = self.respond(query, messages)
+        await asyncio.sleep(self.delay(reply))
+        return reply
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        query = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        reply = self.respond(query, messages)
+        await asyncio.sleep(self.latency)
+        for token in STUB_TOKEN_PATTERN.findall(reply):
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield token
+
+    def delay(self, reply: str) -> float:
+        if self.tokens_per_second <= 0:
+            return self.latency
+        return self.latency + estimate_tokens(reply) / self.tokens_per_second
+
+    @staticmethod
+    def extract_expressions(text: str) -> List[str]:
+        candidates = [match.strip() for match in EXPRESSION_PATTERN.findall(text)]
+        return [c for c in candidates if OPERATOR_PATTERN.search(c)]
+
+    def analyze(self, query: str) -> Dict:
+        expressions = self.extract_expressions(query)
+        if len(expressions) > 1:
+            return {
+                "requires_calculator": True,
+                "expression": max(expressions, key=len),
+                "expressions": expressions,
+                "explanation": "Stub backend found several arithmetic expressions"
+            }
+        if expressions:
+            return {
+                "requires_calculator": True,
+                "expression": expressions[0],
+                "explanation": "Stub backend found an arithmetic expression"
+            }
+        return {
+            "requires_calculator": False,
+            "explanation": "Stub backend found no arithmetic expression"
+        }
+
+    def respond(self, query: str, messages: List[Dict]) -> str:
+        results = [
+            f"{expression} = {result}"
+            for message in messages if message["role"] == "system"
+            for expression, result in CALCULATION_RESULT_PATTERN.findall(message["content"])
+        ]
+        return "; ".join(results) if results else f"Stub response to: {query}"
+
+
+def create_provider(
+    backend: str,
+    api_key: Optional[str] = None,
+    model: str = "gpt-3.5-turbo",
+    timeout: float = 30.0,
+    stub_latency: float = 0.05,
+    stub_tokens_per_second: float = 100.0,
+) -> Optional[LLMProvider]:
+    """
+    Build the configured backend ("openai" or "stub")
+
+    Returns None for "openai" without an API key, which the agent reports
+    as an unconfigured LLM.
+    """
+    if backend == "stub":
+        return StubProvider(latency=stub_latency, tokens_per_second=stub_tokens_per_second)
+    if backend == "openai":
+        return OpenAIProvider(api_key, model, timeout) if api_key else None
+    raise ValueError(f"Unknown LLM provider: {backend}")
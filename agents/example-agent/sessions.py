@@ -0,0 +1,270 @@
+"""
+Server-side conversation sessions
+
+The agent keeps each conversation keyed by the client's session id, so a
+client only sends the messages the agent has not seen. Writes are appends:
+the client states how many messages it expects the session to hold
+(``expected_length``) and a mismatch raises SessionConflict instead of
+silently forking the conversation.
+
+Each session keeps at most ``max_messages`` messages of at most
+``max_message_chars`` characters; older messages are dropped, but
+``length`` keeps counting every message ever appended so offsets stay
+stable. Beyond ``max_sessions`` the least recently used session is evicted.
+Sessions also carry the rolling summary of their older turns (see
+``context.ContextManager``).
+"""
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+class SessionConflict(Exception):
+    """The client's view of a session does not match the stored one"""
+
+    def __init__(self, length: int):
+        super().__init__(f"Session holds {length} messages")
+        self.length = length
+
+
+class SessionStoreUnavailable(Exception):
+    """The session backend could not be reached"""
+
+
+@dataclass
+class Session:
+    messages: List[Dict] = field(default_factory=list)
+    length: int = 0
+    summary: Optional[str] = None
+    # Messages (counted from the start of the session) folded into the summary
+    summarized: int = 0
+
+    @property
+    def dropped(self) -> int:
+        """Messages trimmed from the front by the size cap"""
+        return self.length - len(self.messages)
+
+
+class SessionStore:
+    """Storage backend for conversation sessions"""
+
+    def __init__(self, max_sessions: int, max_messages: int, max_message_chars: int):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_message_chars = max_message_chars
+
+    def _clip(self, messages: List[Dict]) -> List[Dict]:
+        return [
+            {"role": message["role"], "content": message["content"][:self.max_message_chars]}
+            for message in messages
+        ]
+
+    async def append(self, session_id: str, messages: List[Dict], expected_length: Optional[int] = None,
+                     reset: bool = False) -> int:
+        """
+        Append ``messages`` and return the session's new length
+
+        With ``expected_length`` the append only happens if the session holds
+        exactly that many messages, otherwise SessionConflict is raised.
+        ``reset`` starts the session over with ``messages``. A backend that
+        cannot be reached raises SessionStoreUnavailable.
+        """
+        raise NotImplementedError
+
+    async def load(self, session_id: str) -> Session:
+        """Return the session (empty if unknown) and mark it recently used"""
+        raise NotImplementedError
+
+    async def save_summary(self, session_id: str, summary: Optional[str], summarized: int):
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in this process only, lost on restart"""
+
+    def __init__(self, max_sessions: int, max_messages: int, max_message_chars: int):
+        super().__init__(max_sessions, max_messages, max_message_chars)
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.evictions = 0
+
+    def _session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session()
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+        self.sessions.move_to_end(session_id)
+        return session
+
+    async def append(self, session_id: str, messages: List[Dict], expected_length: Optional[int] = None,
+                     reset: bool = False) -> int:
+        if reset:
+            self.sessions.pop(session_id, None)
+        # Check before creating, so rejected appends cannot evict other sessions
+        existing = self.sessions.get(session_id)
+        length = existing.length if existing else 0
+        if expected_length is not None and expected_length != length:
+            raise SessionConflict(length)
+        session = self._session(session_id)
+        session.messages.extend(self._clip(messages))
+        del session.messages[:-self.max_messages]
+        session.length += len(messages)
+        return session.length
+
+    async def load(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return Session()
+        self.sessions.move_to_end(session_id)
+        return Session(list(session.messages), session.length, session.summary, session.summarized)
+
+    async def save_summary(self, session_id: str, summary: Optional[str], summarized: int):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.summary, session.summarized = summary, summarized
+
+    async def count(self) -> int:
+        return len(self.sessions)
+
+
+# Checks the expected length, appends, trims to the size cap and evicts the
+# least recently used sessions, all in one step.
+# KEYS: messages list, meta hash, LRU sorted set
+# ARGV: expected length (-1 for any), reset flag, max messages, ttl seconds,
+#       now, session id, max sessions, key prefix, messages...
+APPEND_SCRIPT = """
+if ARGV[2] == '1' then
+  redis.call('DEL', KEYS[1], KEYS[2])
+end
+local length = tonumber(redis.call('HGET', KEYS[2], 'length') or '0')
+local expected = tonumber(ARGV[1])
+if expected >= 0 and expected ~= length then
+  return {0, length}
+end
+local count = #ARGV - 8
+if count > 0 then
+  redis.call('RPUSH', KEYS[1], unpack(ARGV, 9))
+  redis.call('LTRIM', KEYS[1], -tonumber(ARGV[3]), -1)
+end
+length = length + count
+redis.call('HSET', KEYS[2], 'length', length)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('ZADD', KEYS[3], ARGV[5], ARGV[6])
+local excess = redis.call('ZCARD', KEYS[3]) - tonumber(ARGV[7])
+if excess > 0 then
+  for _, evicted in ipairs(redis.call('ZRANGE', KEYS[3], 0, excess - 1)) do
+    redis.call('DEL', ARGV[8] .. ':' .. evicted .. ':messages', ARGV[8] .. ':' .. evicted .. ':meta')
+  end
+  redis.call('ZREMRANGEBYRANK', KEYS[3], 0, excess - 1)
+end
+return {1, length}
+"""
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions shared by every agent replica through Redis
+
+    Key layout (``prefix`` defaults to "agent:sessions"):
+
+    - ``{prefix}:{id}:messages``  list of message JSON, trimmed to the cap
+    - ``{prefix}:{id}:meta``      hash of length, summary and summarized
+    - ``{prefix}:lru``            session ids scored by last use
+
+    Session keys also expire after ``ttl`` seconds without use, so sessions
+    dropped from the LRU index by other means do not linger.
+    """
+
+    def __init__(self, url: str, max_sessions: int, max_messages: int, max_message_chars: int,
+                 ttl: float = 86400.0, prefix: str = "agent:sessions"):
+        super().__init__(max_sessions, max_messages, max_message_chars)
+        # Imported lazily so the in-memory default does not need a Redis client
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.redis_error = redis.RedisError
+        self.ttl = max(int(ttl), 1)
+        self.prefix = prefix
+        self.lru_key = f"{prefix}:lru"
+        self._append = self.redis.register_script(APPEND_SCRIPT)
+
+    def _keys(self, session_id: str) -> List[str]:
+        return [f"{self.prefix}:{session_id}:messages", f"{self.prefix}:{session_id}:meta", self.lru_key]
+
+    @contextmanager
+    def _unavailable_on_error(self):
+        try:
+            yield
+        except self.redis_error as e:
+            raise SessionStoreUnavailable(str(e)) from e
+
+    async def append(self, session_id: str, messages: List[Dict], expected_length: Optional[int] = None,
+                     reset: bool = False) -> int:
+        with self._unavailable_on_error():
+            applied, length = await self._append(
+                keys=self._keys(session_id),
+                args=[
+                    -1 if expected_length is None else expected_length,
+                    int(reset),
+                    self.max_messages,
+                    self.ttl,
+                    time.time(),
+                    session_id,
+                    self.max_sessions,
+                    self.prefix,
+                    *(json.dumps(message) for message in self._clip(messages)),
+                ],
+            )
+        if not applied:
+            raise SessionConflict(int(length))
+        return int(length)
+
+    async def load(self, session_id: str) -> Session:
+        messages_key, meta_key, _ = self._keys(session_id)
+        with self._unavailable_on_error():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.lrange(messages_key, 0, -1)
+                pipe.hgetall(meta_key)
+                pipe.zadd(self.lru_key, {session_id: time.time()}, xx=True)
+                pipe.expire(messages_key, self.ttl)
+                pipe.expire(meta_key, self.ttl)
+                raw_messages, meta, *_ = await pipe.execute()
+        return Session(
+            messages=[json.loads(message) for message in raw_messages],
+            length=int(meta.get("length", 0)),
+            summary=meta.get("summary") or None,
+            summarized=int(meta.get("summarized", 0)),
+        )
+
+    async def save_summary(self, session_id: str, summary: Optional[str], summarized: int):
+        _, meta_key, _ = self._keys(session_id)
+        with self._unavailable_on_error():
+            if await self.redis.exists(meta_key):
+                await self.redis.hset(meta_key, mapping={"summary": summary or "", "summarized": summarized})
+
+    async def count(self) -> int:
+        with self._unavailable_on_error():
+            return await self.redis.zcard(self.lru_key)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_session_store(backend: str, max_sessions: int, max_messages: int, max_message_chars: int,
+                         redis_url: Optional[str] = None, ttl: float = 86400.0) -> SessionStore:
+    """Build the configured session backend ("memory" or "redis")"""
+    if backend == "memory":
+        return MemorySessionStore(max_sessions, max_messages, max_message_chars)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, max_sessions, max_messages, max_message_chars, ttl)
+    raise ValueError(f"Unknown session store backend: {backend}")
@@ -0,0 +1,255 @@
+"""
+Distributed tracing with W3C trace context and a JSONL exporter
+
+A request's trace id travels between services in the ``traceparent``
+header (https://www.w3.org/TR/trace-context/). Within a service the
+current span lives in a context variable, so asyncio tasks started inside
+a span (e.g. a tool fan-out) become its children without passing it
+around.
+
+Finished spans are written as JSON lines to ``TRACE_EXPORT_FILE`` by a
+background thread, so the event loop never waits on the disk. Every
+service can append to the same file. Run ``python tracing.py <file>`` to
+print each trace as a tree with per-stage durations.
+
+This file is shared by the frontend, agent and tool; keep the copies in sync.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Spans are appended to this file (one JSON object per line); unset disables export
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE")
+# Share of new traces that are recorded; incoming traceparent flags take precedence
+TRACE_SAMPLE_RATIO = float(os.environ.get("TRACE_SAMPLE_RATIO", "1.0"))
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    """One timed stage of a request"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "sampled", "attributes", "start", "_started",
+                 "duration", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the span started"""
+        return time.perf_counter() - self._started
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self, service: str) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": service,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Trace id, parent span id and sampled flag from a ``traceparent`` header"""
+    match = TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return {
+        "trace_id": match.group(1),
+        "parent_id": match.group(2),
+        "sampled": bool(int(match.group(3), 16) & 1),
+    }
+
+
+class JsonlExporter:
+    """Appends spans to a file from a background thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue: "queue.SimpleQueue[Dict]" = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self.thread.start()
+
+    def export(self, span: Dict[str, Any]):
+        self.queue.put(span)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while not self.queue.empty() and len(batch) < 512:
+                batch.append(self.queue.get_nowait())
+            try:
+                with open(self.path, "a") as trace_file:
+                    trace_file.write("".join(json.dumps(span, default=str) + "\n" for span in batch))
+            except OSError as e:
+                logger.warning(f"Failed to export {len(batch)} spans: {str(e)}")
+
+
+class Tracer:
+    """Creates spans for one service and hands finished ones to the exporter"""
+
+    def __init__(self, service: str, export_file: Optional[str] = TRACE_EXPORT_FILE,
+                 sample_ratio: float = TRACE_SAMPLE_RATIO):
+        self.service = service
+        self.exporter = JsonlExporter(export_file) if export_file else None
+        self.sample_ratio = sample_ratio
+
+    @contextmanager
+    def span(self, name: str, traceparent: Optional[str] = None, **attributes) -> Iterator[Span]:
+        """
+        Time a block as a span, the child of the current one
+
+        ``traceparent`` (an incoming header) sets the parent instead, for the
+        first span of a request in this service.
+        """
+        remote = parse_traceparent(traceparent) if traceparent else None
+        parent = current_span.get()
+        if remote:
+            span = Span(name, remote["trace_id"], remote["parent_id"], remote["sampled"], attributes)
+        elif parent:
+            span = Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+        else:
+            sampled = random.random() < self.sample_ratio
+            span = Span(name, f"{random.getrandbits(128):032x}", None, sampled, attributes)
+
+        token = current_span.set(span)
+        try:
+            yield span
+        except (GeneratorExit, asyncio.CancelledError):
+            # The client went away
+            span.status = "cancelled"
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.attributes.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.duration = span.elapsed
+            try:
+                current_span.reset(token)
+            except ValueError:
+                # An async generator finalized from another context
+                pass
+            if span.sampled and self.exporter:
+                self.exporter.export(span.to_dict(self.service))
+
+
+def inject(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """``headers`` plus the current span's ``traceparent``, for an outgoing request"""
+    headers = dict(headers or {})
+    span = current_span.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent
+    return headers
+
+
+class TracingMiddleware:
+    """Wraps every HTTP request in a span that continues the caller's trace"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        status = {}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        with self.tracer.span(f"{scope['method']} {scope['path']}", traceparent=traceparent) as span:
+            await self.app(scope, receive, send_with_status)
+            # Name by route template once routing has run, keeping names bounded
+            route = scope.get("route")
+            if route is not None:
+                span.name = f"{scope['method']} {route.path}"
+            span.set(status_code=status.get("code"))
+            if status.get("code", 500) >= 500:
+                span.status = "error"
+
+
+def trace_requests(app, tracer: Tracer) -> Tracer:
+    """Trace every request to a FastAPI app"""
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    return tracer
+
+
+def print_traces(spans: List[Dict[str, Any]]):
+    """Print each trace as an indented tree of spans with their durations"""
+    traces: Dict[str, List[Dict]] = {}
+    for span in spans:
+        traces.setdefault(span["trace_id"], []).append(span)
+
+    for trace_id, trace in sorted(traces.items(), key=lambda item: min(s["start"] for s in item[1])):
+        ids = {span["span_id"] for span in trace}
+        children: Dict[Optional[str], List[Dict]] = {}
+        for span in trace:
+            parent = span["parent_id"] if span["parent_id"] in ids else None
+            children.setdefault(parent, []).append(span)
+        origin = min(span["start"] for span in trace)
+        print(f"trace {trace_id}")
+
+        def show(span, depth):
+            offset = (span["start"] - origin) * 1000
+            marker = " !" if span["status"] != "ok" else ""
+            print(f"  {'  ' * depth}{span['service']}: {span['name']}  "
+                  f"{span['duration_ms']:.1f} ms (at +{offset:.1f} ms){marker}")
+            for child in sorted(children.get(span["span_id"], []), key=lambda s: s["start"]):
+                show(child, depth + 1)
+
+        for root in sorted(children.get(None, []), key=lambda s: s["start"]):
+            show(root, 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python tracing.py <spans.jsonl> [trace_id]")
+    with open(sys.argv[1]) as trace_file:
+        spans = [json.loads(line) for line in trace_file if line.strip()]
+    if len(sys.argv) > 2:
+        spans = [span for span in spans if span["trace_id"] == sys.argv[2]]
+    print_traces(spans)
@@ -3,6 +3,10 @@ import httpx
 import json
 from typing import Dict, List, Optional
 import os
+import uuid
+
+from registry_data import RegistryData
+from tracing import Tracer, inject
 
 # Configure page
 st.set_page_config(
@@ -19,6 +23,11 @@ REGISTRY_URL = os.environ.get("REGISTRY_URL", "http://service-registry:8000")
 # Debug flag to show connection details
 DEBUG = os.environ.get("DEBUG", "false").lower() == "true"
 
+# Agent and tool lists are cached for all sessions and refreshed in the
+# background once older than this many seconds
+REGISTRY_CACHE_TTL = float(os.environ.get("REGISTRY_CACHE_TTL", "5"))
+REGISTRY_TIMEOUT = float(os.environ.get("REGISTRY_TIMEOUT", "5"))
+
 # Session state initialization
 if "conversation_history" not in st.session_state:
     st.session_state.conversation_history = []
@@ -26,90 +35,48 @@ if "current_agent" not in st.session_state:
     st.session_state.current_agent = None
 if "available_agents" not in st.session_state:
     st.session_state.available_agents = []
-if "available_tools" not in st.session_state:
-    st.session_state.available_tools = []
+if "registry_summary" not in st.session_state:
+    st.session_state.registry_summary = {"tool_types": {}, "agents": {}, "health": {}}
+# Agents keep the conversation per session; only new messages are sent, and
+# synced_messages counts how much of the history each agent already has. The
+# session id is kept in the page URL so a reload can pick the conversation up
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("session") or str(uuid.uuid4())
+    st.query_params["session"] = st.session_state.session_id
+if "synced_messages" not in st.session_state:
+    st.session_state.synced_messages = {}
 
 # Sidebar - Agent Selection
 st.sidebar.title("🤖 Agent Selection")
 
-async def fetch_agents():
-    """Fetch available agents from the service registry"""
-    try:
-        async with httpx.AsyncClient() as client:
-            if DEBUG:
-                st.sidebar.info(f"Connecting to registry at {REGISTRY_URL}/agents")
-            response = await client.get(f"{REGISTRY_URL}/agents")
-            if response.status_code == 200:
-                return response.json()
-            else:
-                st.sidebar.error(f"Failed to fetch agents: {response.status_code}")
-                return []
-    except Exception as e:
-        st.sidebar.error(f"Error connecting to service registry: {str(e)}")
-        # Try alternative URL if initial connection fails (for local debugging)
-        if "service-registry" in REGISTRY_URL:
-            try:
-                alt_url = "http://localhost:8005"
-                if DEBUG:
-                    st.sidebar.info(f"Trying alternative URL: {alt_url}/agents")
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(f"{alt_url}/agents")
-                    if response.status_code == 200:
-                        return response.json()
-            except Exception as alt_e:
-                if DEBUG:
-                    st.sidebar.error(f"Alternative connection also failed: {str(alt_e)}")
-        return []
+@st.cache_resource
+def registry_data():
+    """Registry lists shared by every browser session of this frontend"""
+    urls = [REGISTRY_URL]
+    # Fall back to the published port when running outside Docker
+    if "service-registry" in REGISTRY_URL:
+        urls.append("http://localhost:8005")
+    return RegistryData(urls, ttl=REGISTRY_CACHE_TTL, timeout=REGISTRY_TIMEOUT)
 
-async def fetch_tools():
-    """Fetch available tools from the service registry"""
-    try:
-        async with httpx.AsyncClient() as client:
-            if DEBUG:
-                st.sidebar.info(f"Connecting to registry at {REGISTRY_URL}/tools")
-            response = await client.get(f"{REGISTRY_URL}/tools")
-            if response.status_code == 200:
-                return response.json()
-            else:
-                st.sidebar.error(f"Failed to fetch tools: {response.status_code}")
-                return []
-    except Exception as e:
-        st.sidebar.error(f"Error connecting to service registry: {str(e)}")
-        # Try alternative URL if initial connection fails (for local debugging)
-        if "service-registry" in REGISTRY_URL:
-            try:
-                alt_url = "http://localhost:8005"
-                if DEBUG:
-                    st.sidebar.info(f"Trying alternative URL: {alt_url}/tools")
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(f"{alt_url}/tools")
-                    if response.status_code == 200:
-                        return response.json()
-            except Exception as alt_e:
-                if DEBUG:
-                    st.sidebar.error(f"Alternative connection also failed: {str(alt_e)}")
-        return []
 
-def load_agents_and_tools():
-    """Load available agents and tools"""
-    import asyncio
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    agents = loop.run_until_complete(fetch_agents())
-    tools = loop.run_until_complete(fetch_tools())
-    
-    st.session_state.available_agents = agents
-    st.session_state.available_tools = tools
-    
-    loop.close()
+@st.cache_resource
+def tracer():
+    """Starts a trace per message sent to an agent (see TRACE_EXPORT_FILE)"""
+    return Tracer("frontend")
 
-if st.sidebar.button("Refresh Agents & Tools"):
-    load_agents_and_tools()
+def load_agents_and_tools(refresh=False):
+    """Load available agents and tools, from the shared cache unless ``refresh``"""
+    registry = registry_data()
+    snapshot = registry.refresh() if refresh else registry.get()
+    if snapshot.error:
+        st.sidebar.error(f"Error connecting to service registry: {snapshot.error}")
+    if DEBUG:
+        st.sidebar.info(f"Using registry at {registry.base_url}")
+    
+    st.session_state.available_agents = snapshot.agents
+    st.session_state.registry_summary = snapshot.summary
 
-# Automatic loading of agents on first run
-if not st.session_state.available_agents:
-    load_agents_and_tools()
+load_agents_and_tools(refresh=st.sidebar.button("Refresh Agents & Tools"))
 
 # Display available agents
 if st.session_state.available_agents:
@@ -133,10 +100,10 @@ if st.session_state.available_agents:
         # Display required tools
         if selected_agent['required_tools']:
             st.sidebar.subheader("Required Tools")
+            tool_counts = st.session_state.registry_summary["tool_types"]
             for tool_type in selected_agent['required_tools']:
-                matching_tools = [tool for tool in st.session_state.available_tools if tool['tool_type'] == tool_type]
-                if matching_tools:
-                    st.sidebar.success(f"✅ {tool_type}: {len(matching_tools)} available")
+                if tool_counts.get(tool_type):
+                    st.sidebar.success(f"✅ {tool_type}: {tool_counts[tool_type]} available")
                 else:
                     st.sidebar.error(f"❌ {tool_type}: Not available")
 else:
@@ -144,10 +111,8 @@ else:
 
 # Display available tools
 st.sidebar.subheader("Available Tools")
-if st.session_state.available_tools:
-    tool_types = set(tool['tool_type'] for tool in st.session_state.available_tools)
-    for tool_type in tool_types:
-        count = len([t for t in st.session_state.available_tools if t['tool_type'] == tool_type])
+if st.session_state.registry_summary["tool_types"]:
+    for tool_type, count in st.session_state.registry_summary["tool_types"].items():
         st.sidebar.markdown(f"- **{tool_type}**: {count} available")
 else:
     st.sidebar.info("No tools registered yet.")
@@ -178,11 +143,39 @@ if not st.session_state.current_agent:
     with col1:
         st.metric("Agents Available", len(st.session_state.available_agents))
     with col2:
-        st.metric("Tools Available", len(st.session_state.available_tools))
+        st.metric("Tools Available", st.session_state.registry_summary["health"].get("tools", 0))
         
 else:
     selected_agent = agent_options[st.session_state.current_agent]
     
+    def load_session_history(agent):
+        """Restore the conversation the agent holds for this session, e.g. after a reload"""
+        try:
+            agent_url = f"http://{agent['host']}:{agent['port']}/sessions/{st.session_state.session_id}"
+            response = httpx.get(agent_url, timeout=5.0)
+            if response.status_code != 200:
+                return
+            session = response.json()
+        except Exception as e:
+            if DEBUG:
+                st.warning(f"Could not load the conversation session: {str(e)}")
+            return
+        st.session_state.conversation_history = [
+            {
+                "role": msg["role"],
+                "content": msg["content"],
+                "agent_name": agent["name"] if msg["role"] == "assistant" else None
+            } for msg in session["messages"]
+        ]
+        # Older messages trimmed by the agent are gone; the next query resyncs
+        if len(session["messages"]) == session["length"]:
+            st.session_state.synced_messages[agent["id"]] = session["length"]
+    
+    if "session_restored" not in st.session_state:
+        st.session_state.session_restored = True
+        if not st.session_state.conversation_history:
+            load_session_history(selected_agent)
+    
     # Display conversation history
     st.subheader("Conversation")
     for i, message in enumerate(st.session_state.conversation_history):
@@ -196,27 +189,46 @@ else:
     # Input for user message
     user_input = st.text_area("Your message:", height=100)
     
-    async def send_message_to_agent(agent, message):
+    def build_query_payload(agent, message, resync=False):
+        """
+        Request body for /query and /query/stream
+
+        The agent loads earlier turns from its session store, so usually only
+        the new message is sent, plus any messages the agent has not seen
+        (e.g. answers from other agents). With ``resync`` the whole history
+        is sent again.
+        """
+        offset = 0 if resync else st.session_state.synced_messages.get(agent["id"], 0)
+        context = {
+            "session_id": st.session_state.session_id,
+            "offset": offset
+        }
+        unseen = st.session_state.conversation_history[offset:-1]
+        if unseen:
+            context["conversation_history"] = [
+                {
+                    "role": msg["role"],
+                    "content": msg["content"]
+                } for msg in unseen
+            ]
+        return {"query": message, "context": context}
+    
+    async def send_message_to_agent(agent, message, resync=False):
         """Send a message to an agent and get a response"""
         try:
             agent_host = agent["host"]
             agent_port = agent["port"]
             agent_url = f"http://{agent_host}:{agent_port}/query"
             
-            payload = {
-                "query": message,
-                "context": {
-                    "conversation_history": [
-                        {
-                            "role": msg["role"],
-                            "content": msg["content"]
-                        } for msg in st.session_state.conversation_history
-                    ]
-                }
-            }
+            payload = build_query_payload(agent, message, resync)
             
             async with httpx.AsyncClient() as client:
-                response = await client.post(agent_url, json=payload, timeout=30.0)
+                with tracer().span("agent.query", agent=agent["name"], resync=resync) as span:
+                    response = await client.post(agent_url, json=payload, headers=inject(), timeout=30.0)
+                    span.set(status_code=response.status_code)
+                if response.status_code == 409 and not resync:
+                    # The agent lost track of the conversation; send all of it
+                    return await send_message_to_agent(agent, message, resync=True)
                 if response.status_code == 200:
                     return response.json()
                 else:
@@ -226,6 +238,51 @@ else:
             st.error(f"Error communicating with agent: {str(e)}")
             return None
     
+    async def stream_message_to_agent(agent, message, on_event, resync=False):
+        """
+        Send a message to an agent's streaming endpoint
+
+        Calls ``on_event(event, data)`` for every server-sent event and returns
+        the final ``done`` payload. Agents without /query/stream fall back to
+        the blocking /query endpoint.
+        """
+        try:
+            agent_url = f"http://{agent['host']}:{agent['port']}"
+            payload = build_query_payload(agent, message, resync)
+
+            async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=60.0)) as client:
+                with tracer().span("agent.query.stream", agent=agent["name"], resync=resync) as span:
+                    async with client.stream("POST", f"{agent_url}/query/stream", json=payload,
+                                             headers=inject()) as response:
+                        span.set(status_code=response.status_code)
+                        if response.status_code == 404:
+                            return await send_message_to_agent(agent, message, resync)
+                        if response.status_code == 409 and not resync:
+                            return await stream_message_to_agent(agent, message, on_event, resync=True)
+                        if response.status_code != 200:
+                            await response.aread()
+                            st.error(f"Error from agent: {response.status_code} - {response.text}")
+                            return None
+
+                        event = "message"
+                        async for line in response.aiter_lines():
+                            if line.startswith("event:"):
+                                event = line[len("event:"):].strip()
+                            elif line.startswith("data:"):
+                                data = json.loads(line[len("data:"):])
+                                if "first_event_ms" not in span.attributes:
+                                    span.set(first_event_ms=round(span.elapsed * 1000, 3))
+                                on_event(event, data)
+                                if event == "done":
+                                    return data
+                                if event == "error":
+                                    st.error(f"Error from agent: {data.get('detail')}")
+                                    return None
+            return None
+        except Exception as e:
+            st.error(f"Error communicating with agent: {str(e)}")
+            return None
+    
     if st.button("Send"):
         if user_input.strip():
             # Add user message to history
@@ -235,13 +292,29 @@ else:
                 "agent_name": None
             })
             
-            # Get response from agent
+            # Stream the response from the agent, rendering tool calls and
+            # tokens as they arrive
             import asyncio
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             
-            with st.spinner(f"Waiting for {selected_agent['name']} to respond..."):
-                response = loop.run_until_complete(send_message_to_agent(selected_agent, user_input))
+            st.markdown(f"**You:** {user_input}")
+            status = st.status(f"{selected_agent['name']} is working...", expanded=False)
+            answer_placeholder = st.empty()
+            streamed = []
+
+            def render_event(event, data):
+                if event == "tool_call":
+                    status.write(f"🔧 Calling **{data['tool_type']}** ({data['operation']})")
+                elif event == "tool_result":
+                    outcome = "❌" if "error" in data["result"] else "✅"
+                    status.write(f"{outcome} **{data['call']['tool_type']}** finished")
+                elif event == "token":
+                    streamed.append(data["delta"])
+                    answer_placeholder.markdown(f"**{selected_agent['name']}:** {''.join(streamed)}▌")
+
+            response = loop.run_until_complete(stream_message_to_agent(selected_agent, user_input, render_event))
+            status.update(label="Done" if response else "Failed", state="complete" if response else "error")
             
             loop.close()
             
@@ -254,6 +327,7 @@ else:
                     "tools_used": response.get("tools_used", []),
                     "confidence": response.get("confidence", 0)
                 })
+                st.session_state.synced_messages[selected_agent["id"]] = len(st.session_state.conversation_history)
             
             # Rerun to update the UI
             st.experimental_rerun()
@@ -0,0 +1,148 @@
+"""
+Service registry data for the frontend
+
+One ``RegistryData`` per frontend process, shared by every browser session,
+holds the latest agent list and the registry's precomputed /summary (tool
+counts per type and which agents have their required tools). Reads return
+the cached snapshot straight away; once it is older than ``ttl`` seconds a
+background thread refreshes it, so page renders only wait on the registry
+for the very first load. Both documents are fetched concurrently over one
+pooled client, asking only for the agent fields the pages use and
+revalidating with the registry's ETags, so an unchanged registry answers
+304 with no body.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Agent fields the frontend displays (see the registry's fields=)
+AGENT_FIELDS = "id,name,version,description,capabilities,required_tools,host,port"
+
+EMPTY_SUMMARY = {
+    "tool_types": {},
+    "agents": {},
+    "health": {"agents": 0, "tools": 0, "satisfied_agents": 0, "unsatisfied_agents": 0},
+}
+
+
+@dataclass
+class RegistrySnapshot:
+    agents: List[Dict] = field(default_factory=list)
+    summary: Dict = field(default_factory=lambda: EMPTY_SUMMARY)
+    # time.monotonic() of the fetch, 0 before the first one
+    fetched_at: float = 0.0
+    error: Optional[str] = None
+
+
+class RegistryData:
+    """
+    Cached, background-refreshed agent list and registry summary
+
+    ``urls`` are tried in order; once a fallback answers it is used until it
+    fails in turn.
+    """
+
+    def __init__(self, urls: List[str], ttl: float = 5.0, timeout: float = 5.0):
+        self.urls = urls
+        self.base_url = urls[0]
+        self.ttl = ttl
+        self.client = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 2.0)),
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4)
+        )
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="registry-fetch")
+        self.lock = threading.Lock()
+        self.snapshot = RegistrySnapshot()
+        self.etags: Dict[str, str] = {}
+        self.refreshing = False
+
+    def get(self) -> RegistrySnapshot:
+        """The latest snapshot, starting a background refresh if it is stale"""
+        with self.lock:
+            snapshot = self.snapshot
+            stale = time.monotonic() - snapshot.fetched_at >= self.ttl
+            start_refresh = stale and snapshot.fetched_at > 0 and not self.refreshing
+            if start_refresh:
+                self.refreshing = True
+
+        if snapshot.fetched_at == 0:
+            return self.refresh()
+        if start_refresh:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return snapshot
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def refresh(self) -> RegistrySnapshot:
+        """Fetch both documents now, concurrently, and return the new snapshot"""
+        requests = {
+            "agents": self.executor.submit(self._fetch, "/agents", {"fields": AGENT_FIELDS}),
+            "summary": self.executor.submit(self._fetch, "/summary"),
+        }
+        previous = self.snapshot
+        results, errors = {}, []
+        for kind, request in requests.items():
+            try:
+                results[kind] = request.result()
+            except Exception as e:
+                errors.append(f"{kind}: {str(e)}")
+                results[kind] = None
+
+        snapshot = RegistrySnapshot(
+            # None means unchanged (304) or failed; keep what we had
+            agents=results["agents"] if results["agents"] is not None else previous.agents,
+            summary=results["summary"] if results["summary"] is not None else previous.summary,
+            fetched_at=time.monotonic(),
+            error="; ".join(errors) or None
+        )
+        if snapshot.error:
+            logger.warning(f"Registry refresh failed: {snapshot.error}")
+        with self.lock:
+            self.snapshot = snapshot
+        return snapshot
+
+    def _fetch(self, path: str, params: Optional[Dict] = None):
+        """One registry document, or None if it has not changed"""
+        headers = {"If-None-Match": self.etags[path]} if path in self.etags else {}
+        response = self._get(path, params=params, headers=headers)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        if "ETag" in response.headers:
+            self.etags[path] = response.headers["ETag"]
+        return response.json()
+
+    def _get(self, path: str, **kwargs) -> httpx.Response:
+        base_url = self.base_url
+        try:
+            return self.client.get(f"{base_url}{path}", **kwargs)
+        except httpx.TransportError:
+            # Try the other registry URLs (e.g. localhost when debugging outside Docker)
+            for url in self.urls:
+                if url == base_url:
+                    continue
+                try:
+                    response = self.client.get(f"{url}{path}", **kwargs)
+                except httpx.TransportError:
+                    continue
+                if self.base_url != url:
+                    logger.info(f"Using registry at {url}")
+                    self.base_url = url
+                return response
+            raise
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.client.close()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Benchmark the registry, calculator tool and agent under concurrent load
+
+Boots each service as a local uvicorn process on a free port (the agent
+with the stub LLM, so no API key or network is needed), waits until the
+agent has discovered the calculator, then runs each scenario in turn:
+
+- discover:        POST /discover for calculator tools on the registry
+- heartbeat:       PUT /tools/{id}/heartbeat on the registry
+- calculate:       POST /calculate on the tool
+- query_fastpath:  POST /query with plain arithmetic, which the agent answers
+                   with one calculator call and no LLM calls
+- query:           POST /query with a wordy calculation request, which goes
+                   through context building, LLM analysis, the calculator
+                   and LLM generation (all on the stub LLM)
+
+Queries are numbered so the agent's response cache cannot answer them.
+Each query scenario also records the agent's fast-path hit rate, and a
+warning is printed if the ``query`` scenario was answered by the fast path.
+
+Every scenario keeps ``--concurrency`` requests in flight for
+``--duration`` seconds after a ``--warmup``, and reports throughput,
+p50/p95/p99 latency and the error rate. Results are written to
+``--output`` as JSON; pass an earlier result as ``--baseline`` to compare
+and fail on regressions beyond ``--max-regression`` percent.
+
+Give ``--registry-url``, ``--tool-url`` or ``--agent-url`` to benchmark an
+already running service instead of booting one. The load generator runs
+on the same machine as booted services, so compare results from the same
+host only.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICE_DIRS = {
+    "registry": "service-registry",
+    "tool": "tools/example-tool",
+    "agent": "agents/example-agent",
+}
+
+SCENARIOS = ("discover", "heartbeat", "calculate", "query_fastpath", "query")
+QUERY_SCENARIOS = ("query_fastpath", "query")
+
+# Expressions cycled through by the calculate scenario
+EXPRESSIONS = ["2 + 3 * 4", "(17 - 5) / 4", "2 ** 10 - 1", "sqrt(144) + 7", "3.5 * (2 + 8) / 5"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(fraction * len(ordered)), 1) - 1]
+
+
+class Stack:
+    """Local uvicorn processes for the services that were not given a URL"""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = {}
+        self.log_dir = tempfile.mkdtemp(prefix="agent-forge-bench-")
+        self.urls = {
+            "registry": args.registry_url,
+            "tool": args.tool_url,
+            "agent": args.agent_url,
+        }
+
+    def start(self, name, env):
+        port = free_port()
+        log_path = os.path.join(self.log_dir, f"{name}.log")
+        environment = {**os.environ, **env, "HOST": "127.0.0.1", "PORT": str(port)}
+        environment.update(self.args.env)
+        self.processes[name] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=os.path.join(ROOT, SERVICE_DIRS[name]),
+            env=environment,
+            stdout=open(log_path, "w"),
+            stderr=subprocess.STDOUT,
+        )
+        self.urls[name] = f"http://127.0.0.1:{port}"
+        print(f"Started {name} at {self.urls[name]} (log: {log_path})")
+
+    async def wait_healthy(self, client, name, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            process = self.processes.get(name)
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {process.returncode}; see {self.log_dir}/{name}.log")
+            try:
+                if (await client.get(f"{self.urls[name]}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f"{name} at {self.urls[name]} did not become healthy within {timeout:.0f}s")
+
+    async def boot(self, client):
+        if not self.urls["registry"]:
+            self.start("registry", {})
+        await self.wait_healthy(client, "registry")
+
+        services = {"REGISTRY_URL": self.urls["registry"], "HEARTBEAT_URL": self.urls["registry"]}
+        if not self.urls["tool"]:
+            self.start("tool", services)
+        if not self.urls["agent"]:
+            self.start("agent", {**services, "LLM_PROVIDER": "stub"})
+        await self.wait_healthy(client, "tool")
+        await self.wait_healthy(client, "agent")
+
+        # The agent answers arithmetic with the calculator once it has discovered one
+        deadline = time.monotonic() + 30.0
+        while time.monotonic() < deadline:
+            tools = (await client.get(f"{self.urls['agent']}/tools")).json()
+            if any(tool.get("tool_type") == "calculator" for tool in tools["tools"]):
+                return
+            await asyncio.sleep(0.5)
+        raise RuntimeError("The agent did not discover a calculator tool within 30s")
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def scenario_requests(name, urls, tool_id, args):
+    """A function building (method, url, json body) for request number ``i``"""
+    if name == "discover":
+        body = {"service_type": "tool", "tool_type": "calculator"}
+        return lambda i: ("POST", f"{urls['registry']}/discover", body)
+    if name == "heartbeat":
+        return lambda i: ("PUT", f"{urls['registry']}/tools/{tool_id}/heartbeat", None)
+    if name == "calculate":
+        return lambda i: ("POST", f"{urls['tool']}/calculate", {"expression": EXPRESSIONS[i % len(EXPRESSIONS)]})
+    if name == "query_fastpath":
+        return lambda i: ("POST", f"{urls['agent']}/query", {"query": args.fastpath_query.format(i=i)})
+    if name == "query":
+        return lambda i: ("POST", f"{urls['agent']}/query", {"query": args.query.format(i=i)})
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+async def fast_path_counts(client, agent_url):
+    """The agent's (queries, fast-path hits) so far, or None if it doesn't report them"""
+    try:
+        stats = (await client.get(f"{agent_url}/stats")).json().get("fast_path") or {}
+    except (httpx.HTTPError, ValueError):
+        return None
+    if "queries" not in stats or "hits" not in stats:
+        return None
+    return stats["queries"], stats["hits"]
+
+
+async def run_scenario(client, build_request, concurrency, duration, warmup):
+    """Keep ``concurrency`` requests in flight; record the ones after the warmup"""
+    latencies, errors = [], {}
+    counter = iter(range(sys.maxsize))
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def worker():
+        while True:
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            method, url, body = build_request(next(counter))
+            try:
+                response = await client.request(method, url, json=body)
+                error = None if response.is_success else f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = e.__class__.__name__
+            if sent < measure_from:
+                continue
+            latencies.append(time.perf_counter() - sent)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+
+    ordered = sorted(latencies)
+    failed = sum(errors.values())
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "requests": len(ordered),
+        "errors": failed,
+        "error_rate": round(failed / len(ordered), 4) if ordered else 0.0,
+        "errors_by_kind": errors,
+        "throughput": round(len(ordered) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(ordered, 0.50)),
+            "p95": ms(percentile(ordered, 0.95)),
+            "p99": ms(percentile(ordered, 0.99)),
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else None,
+            "max": ms(ordered[-1]) if ordered else None,
+        },
+    }
+
+
+def print_results(results):
+    print()
+    print(f"{'scenario':<16} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8} {'fast path':>10}")
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        fast_path = result.get("fast_path_hit_rate")
+        print(f"{name:<16} {result['throughput']:>9.1f} {latency['p50'] or 0:>9.2f} {latency['p95'] or 0:>9.2f} "
+              f"{latency['p99'] or 0:>9.2f} {result['error_rate']:>8.2%} "
+              f"{'-' if fast_path is None else f'{fast_path:.0%}':>10}")
+        for error, count in sorted(result["errors_by_kind"].items()):
+            print(f"  error: {error} x{count}")
+
+
+def compare(results, baseline, max_regression):
+    """Print changes against a baseline and return the regressions"""
+    regressions = []
+    limit = max_regression / 100
+    print()
+    print(f"Compared with the baseline from {baseline.get('created', 'unknown')} "
+          f"(allowed regression {max_regression:.0f}%)")
+    for name, result in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            print(f"  {name}: not in the baseline")
+            continue
+        changes = []
+        if previous["throughput"]:
+            change = result["throughput"] / previous["throughput"] - 1
+            changes.append(f"req/s {change:+.1%}")
+            if change < -limit:
+                regressions.append(f"{name} throughput fell {-change:.1%}")
+        for key in ("p50", "p95", "p99"):
+            before, after = previous["latency_ms"].get(key), result["latency_ms"].get(key)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            changes.append(f"{key} {change:+.1%}")
+            if key != "p50" and change > limit:
+                regressions.append(f"{name} {key} latency rose {change:.1%}")
+        # Any new errors count, whatever the allowed regression
+        if result["error_rate"] > previous["error_rate"] + 0.001:
+            regressions.append(f"{name} error rate rose to {result['error_rate']:.2%}")
+        print(f"  {name}: {', '.join(changes)}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    stack = Stack(args)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            await stack.boot(client)
+            tools = (await client.get(f"{stack.urls['registry']}/tools")).json()
+            calculators = [tool["id"] for tool in tools if tool.get("tool_type") == "calculator"]
+            if not calculators:
+                print("❌ No calculator is registered")
+                return 1
+
+            results = {}
+            for name in args.scenarios:
+                print(f"Running {name}: {args.concurrency} concurrent for {args.duration:.0f}s "
+                      f"(+{args.warmup:.0f}s warmup)")
+                build_request = scenario_requests(name, stack.urls, calculators[0], args)
+                before = await fast_path_counts(client, stack.urls["agent"]) if name in QUERY_SCENARIOS else None
+                results[name] = await run_scenario(client, build_request, args.concurrency, args.duration,
+                                                   args.warmup)
+                after = await fast_path_counts(client, stack.urls["agent"]) if before else None
+                if after and after[0] > before[0]:
+                    results[name]["fast_path_hit_rate"] = round((after[1] - before[1]) / (after[0] - before[0]), 4)
+    finally:
+        stack.stop()
+
+    print_results(results)
+    if results.get("query", {}).get("fast_path_hit_rate"):
+        print("\n⚠️  The fast path answered some query-scenario requests, so the orchestration path "
+              "was not fully measured; pass a --query that needs the LLM")
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "query": args.query,
+            "fastpath_query": args.fastpath_query,
+            "env": args.env,
+        },
+        "scenarios": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    status = 0
+    if any(result["errors"] for result in results.values()):
+        print("❌ Some requests failed")
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("config") != report["config"]:
+            print(f"\n⚠️  The baseline ran with different settings: {json.dumps(baseline.get('config'))}")
+        regressions = compare(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            status = 1
+        else:
+            print("✅ No regressions against the baseline")
+    return status
+
+
+def parse_env(value):
+    key, separator, setting = value.partition("=")
+    if not separator or not key:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {value!r}")
+    return key, setting
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the registry, calculator tool and agent")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated scenarios to run ({', '.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests kept in flight per scenario")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before each scenario")
+    parser.add_argument("--query", default="Please work out {i} * 7 pencils for the students",
+                        help="Query for the query scenario, which should need the LLM; "
+                             "{i} is replaced by the request number")
+    parser.add_argument("--fastpath-query", default="What is {i} * 7?",
+                        help="Query for the query_fastpath scenario, which the fast path should answer")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--registry-url", help="Use a running registry instead of booting one")
+    parser.add_argument("--tool-url", help="Use a running calculator tool instead of booting one")
+    parser.add_argument("--agent-url", help="Use a running agent instead of booting one")
+    parser.add_argument("--env", type=parse_env, action="append", default=[],
+                        help="KEY=VALUE setting for the booted services (repeatable), e.g. CALC_EXECUTION_MODE=process")
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Earlier results to compare with")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="Allowed throughput drop or p95/p99 rise against the baseline, in percent")
+
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.env = dict(args.env)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
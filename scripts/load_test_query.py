@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Concurrent /query load test for an agent
+
+Measures the latency of a single query, then fires batches of simultaneous
+queries and compares each batch's wall-clock time with running them one after
+another. If LLM calls block the agent's event loop the batch serializes and
+the speedup (concurrency * single latency / batch wall time) stays near 1x;
+if the queries overlap it approaches the batch size.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+
+async def timed_query(client, url, query):
+    """Send one query and return (latency in seconds, error or None)"""
+    start = time.perf_counter()
+    try:
+        response = await client.post(url, json={"query": query})
+        error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    return time.perf_counter() - start, error
+
+
+def make_queries(query, count, unique):
+    """Identical queries, or numbered ones so response caches cannot serve them"""
+    if not unique:
+        return [query] * count
+    stamp = time.time_ns()
+    return [f"{query} (request {stamp}-{i})" for i in range(count)]
+
+
+async def run_batch(client, url, query, concurrency, unique):
+    queries = make_queries(query, concurrency, unique)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed_query(client, url, q) for q in queries))
+    return time.perf_counter() - start, results
+
+
+async def run(args):
+    url = f"{args.url.rstrip('/')}/query"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        # The first query also warms up the connection pool
+        await timed_query(client, url, args.query)
+        single = statistics.median([
+            (await timed_query(client, url, q))[0] for q in make_queries(args.query, 3, args.unique)
+        ])
+        print(f"Single query latency: {single:.3f}s")
+
+        walls, latencies, errors = [], [], []
+        for batch in range(args.batches):
+            wall, results = await run_batch(client, url, args.query, args.concurrency, args.unique)
+            walls.append(wall)
+            latencies.extend(latency for latency, _ in results)
+            errors.extend(error for _, error in results if error)
+            print(f"Batch {batch + 1}: wall {wall:.3f}s, speedup {args.concurrency * single / wall:.1f}x")
+
+    total_wall = sum(walls)
+    speedup = len(latencies) * single / total_wall
+    print()
+    print(f"Requests:        {len(latencies)} ({len(errors)} errors)")
+    print(f"Latency p50/max: {statistics.median(latencies):.3f}s / {max(latencies):.3f}s")
+    print(f"Throughput:      {len(latencies) / total_wall:.1f} req/s")
+    print(f"Speedup:         {speedup:.1f}x (serial 1x, ideal {args.concurrency}x)")
+    for error in sorted(set(errors))[:5]:
+        print(f"  error: {error}")
+
+    if errors:
+        print("❌ Some queries failed")
+        return 1
+    # Require at least half the ideal speedup
+    if speedup < args.concurrency / 2:
+        print("❌ Concurrent queries are serializing")
+        return 1
+    print("✅ Concurrent queries overlap")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test an agent's /query endpoint")
+    parser.add_argument("--url", default="http://localhost:8080", help="Base URL of the agent")
+    parser.add_argument("--concurrency", type=int, default=10, help="Simultaneous queries per batch")
+    parser.add_argument("--batches", type=int, default=3, help="Number of batches to send")
+    parser.add_argument("--query", default="What is 12 * 7?", help="Query text to send")
+    parser.add_argument("--unique", action="store_true", help="Make every query distinct to bypass response caches")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
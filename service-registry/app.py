@@ -1,52 +1,96 @@
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Depends, Request
 from typing import List, Dict, Optional, Literal
-import uuid
+import asyncio
+import os
 import time
+import logging
 from datetime import datetime, timedelta
 
+from metrics import Counter, Gauge, instrument
+from models import Agent, Tool, ServiceQuery, HeartbeatBatch
+from responses import conditional_json, make_etag, parse_fields, project
+from store import create_store
+
 app = FastAPI(title="Agent Framework Service Registry")
 
-# In-memory storage for services (in production, use a persistent database)
-agents = {}
-tools = {}
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Health check interval (in seconds)
 HEALTH_CHECK_INTERVAL = 30
 # Service expiration (in seconds)
 SERVICE_EXPIRATION = 120
 
-
-class ServiceBase(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    description: str
-    version: str
-    host: str
-    port: int
-    health_endpoint: str = "/health"
-    last_seen: float = Field(default_factory=time.time)
-    metadata: Dict = {}
-
-
-class Agent(ServiceBase):
-    type: Literal["agent"] = "agent"
-    capabilities: List[str] = []
-    required_tools: List[str] = []
-
-
-class Tool(ServiceBase):
-    type: Literal["tool"] = "tool"
-    tool_type: str
-    endpoints: Dict[str, Dict] = {}
-    schema: Dict = {}
-
-
-class ServiceQuery(BaseModel):
-    service_type: Optional[Literal["agent", "tool"]] = None
-    tool_type: Optional[str] = None
-    capabilities: Optional[List[str]] = None
-    name: Optional[str] = None
+# Longest a /watch long-poll is held open (in seconds)
+WATCH_MAX_TIMEOUT = 60
+
+# Storage backend: "memory" (default, process-local) or "redis" (shared by replicas)
+REGISTRY_STORE = os.environ.get("REGISTRY_STORE", "memory")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+
+store = create_store(REGISTRY_STORE, SERVICE_EXPIRATION, redis_url=REDIS_URL)
+
+# Request latency and in-flight metrics for every route, plus GET /metrics
+metrics = instrument(app)
+heartbeats_total = metrics.counter(
+    "registry_heartbeats_total", "Heartbeats received, by service type and whether the service was known",
+    ("type", "known")
+)
+watchers = metrics.gauge("registry_watchers", "Open /watch long-polls")
+
+
+@metrics.collector
+async def collect_registry_metrics():
+    """Registry size and change counts, read at scrape time"""
+    summary = await store.summary()
+    services = Gauge("registry_services", "Live registered services", ("type",))
+    services.set(summary["health"]["agents"], "agent")
+    services.set(summary["health"]["tools"], "tool")
+    tool_instances = Gauge("registry_tool_instances", "Live tools per tool_type", ("tool_type",))
+    for tool_type, count in summary["tool_types"].items():
+        tool_instances.set(count, tool_type)
+    unsatisfied = Gauge("registry_unsatisfied_agents", "Agents missing at least one required tool type")
+    unsatisfied.set(summary["health"]["unsatisfied_agents"])
+    revision = Gauge("registry_revision", "Current registry revision")
+    revision.set(summary["revision"])
+    changes = Counter(
+        "registry_changes_total", "Registrations, updates, deregistrations and expiries recorded here", ("event",)
+    )
+    for event, count in store.change_counts.items():
+        changes.inc(event, amount=count)
+    return [services, tool_instances, unsatisfied, revision, changes]
+
+
+async def expiry_sweeper():
+    """Expire services as their deadlines pass, even when nobody is reading"""
+    while True:
+        try:
+            expired = await store.expire()
+            if expired:
+                logger.info(f"Expired {expired} services")
+        except Exception as e:
+            logger.error(f"Error expiring services: {str(e)}")
+
+        next_expiry = store.next_expiry()
+        if next_expiry is None:
+            delay = HEALTH_CHECK_INTERVAL
+        else:
+            delay = min(max(next_expiry - time.time(), 0), HEALTH_CHECK_INTERVAL)
+        await asyncio.sleep(delay)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Start the background expiry sweeper"""
+    app.state.expiry_task = asyncio.create_task(expiry_sweeper())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background expiry sweeper and release the store"""
+    app.state.expiry_task.cancel()
+    await store.close()
 
 
 @app.get("/")
@@ -55,109 +99,177 @@ def read_root():
 
 
 @app.post("/agents/register", response_model=Agent)
-def register_agent(agent: Agent):
+async def register_agent(agent: Agent):
     agent.last_seen = time.time()
-    agents[agent.id] = agent
+    await store.save(agent)
     return agent
 
 
 @app.post("/tools/register", response_model=Tool)
-def register_tool(tool: Tool):
+async def register_tool(tool: Tool):
     tool.last_seen = time.time()
-    tools[tool.id] = tool
+    await store.save(tool)
     return tool
 
 
+# List and discovery reads honour If-None-Match against an ETag derived from
+# the registry revision, and accept ``fields=`` (e.g. id,host,port,tool_type)
+# to return only those fields of each service.
 @app.get("/agents", response_model=List[Agent])
-def list_agents():
-    # Remove expired agents
-    current_time = time.time()
-    expired_agents = [
-        agent_id
-        for agent_id, agent in agents.items()
-        if current_time - agent.last_seen > SERVICE_EXPIRATION
-    ]
-    for agent_id in expired_agents:
-        agents.pop(agent_id, None)
-    
-    return list(agents.values())
+async def list_agents(request: Request, fields: Optional[str] = None):
+    include = parse_fields(fields, Agent.model_fields)
+    etag = make_etag(await store.revision(), "agents", include)
+
+    async def build():
+        return project(await store.list("agent"), include)
+
+    return await conditional_json(request, etag, build)
 
 
 @app.get("/tools", response_model=List[Tool])
-def list_tools():
-    # Remove expired tools
-    current_time = time.time()
-    expired_tools = [
-        tool_id
-        for tool_id, tool in tools.items()
-        if current_time - tool.last_seen > SERVICE_EXPIRATION
-    ]
-    for tool_id in expired_tools:
-        tools.pop(tool_id, None)
-    
-    return list(tools.values())
+async def list_tools(request: Request, fields: Optional[str] = None):
+    include = parse_fields(fields, Tool.model_fields)
+    etag = make_etag(await store.revision(), "tools", include)
+
+    async def build():
+        return project(await store.list("tool"), include)
+
+    return await conditional_json(request, etag, build)
 
 
 @app.get("/agents/{agent_id}", response_model=Agent)
-def get_agent(agent_id: str):
-    if agent_id not in agents:
+async def get_agent(agent_id: str):
+    agent = await store.get("agent", agent_id)
+    if agent is None:
         raise HTTPException(status_code=404, detail="Agent not found")
-    return agents[agent_id]
+    return agent
 
 
 @app.get("/tools/{tool_id}", response_model=Tool)
-def get_tool(tool_id: str):
-    if tool_id not in tools:
+async def get_tool(tool_id: str):
+    tool = await store.get("tool", tool_id)
+    if tool is None:
         raise HTTPException(status_code=404, detail="Tool not found")
-    return tools[tool_id]
+    return tool
 
 
 @app.post("/discover", response_model=Dict)
-def discover_services(query: ServiceQuery):
+async def discover_services(request: Request, query: ServiceQuery, fields: Optional[str] = None):
     """
     Discover services based on query parameters
+
+    The response includes the registry ``revision`` it reflects, so callers
+    can follow /watch from there to keep the result up to date.
     """
-    matched_agents = []
-    matched_tools = []
-    
-    if query.service_type == "agent" or query.service_type is None:
-        for agent in agents.values():
-            if query.name and query.name.lower() not in agent.name.lower():
-                continue
-            if query.capabilities and not all(cap in agent.capabilities for cap in query.capabilities):
-                continue
-            matched_agents.append(agent)
-    
-    if query.service_type == "tool" or query.service_type is None:
-        for tool in tools.values():
-            if query.name and query.name.lower() not in tool.name.lower():
-                continue
-            if query.tool_type and query.tool_type.lower() != tool.tool_type.lower():
-                continue
-            matched_tools.append(tool)
-    
-    return {
-        "agents": matched_agents,
-        "tools": matched_tools
-    }
+    include = parse_fields(fields, set(Agent.model_fields) | set(Tool.model_fields))
+    # Read the revision first: events racing with the query are replayed, not lost
+    revision = await store.revision()
+    etag = make_etag(revision, "discover", include, query.model_dump())
+
+    async def build():
+        matched = await store.discover(query)
+        return {
+            "agents": project(matched["agents"], include),
+            "tools": project(matched["tools"], include),
+            "revision": revision,
+        }
+
+    return await conditional_json(request, etag, build)
+
+
+@app.get("/summary")
+async def registry_summary(request: Request):
+    """
+    Fleet overview: live tools per tool_type, whether each agent's required
+    tools are available, and health totals
+
+    Maintained as services register and expire rather than computed by
+    scanning agents against tools; revalidate with If-None-Match.
+    """
+    etag = make_etag(await store.revision(), "summary")
+
+    async def build():
+        return await store.summary()
+
+    return await conditional_json(request, etag, build)
+
+
+@app.get("/watch")
+async def watch_changes(
+    since: int,
+    timeout: float = 30,
+    service_type: Optional[Literal["agent", "tool"]] = None,
+):
+    """
+    Long-poll for registry changes after revision ``since``
+
+    Returns as soon as at least one change event is available, or with no
+    events after ``timeout`` seconds. Continue from the returned ``revision``.
+    ``reset`` means ``since`` is no longer available (too old, or the registry
+    restarted) and the caller should re-read via /discover.
+    """
+    watchers.inc()
+    try:
+        events = await store.watch(since, min(max(timeout, 0), WATCH_MAX_TIMEOUT))
+    finally:
+        watchers.dec()
+    if events is None:
+        return {"reset": True, "revision": await store.revision(), "events": []}
+
+    revision = events[-1]["revision"] if events else since
+    if service_type:
+        events = [event for event in events if event["service_type"] == service_type]
+    return {"reset": False, "revision": revision, "events": events}
+
+
+@app.delete("/agents/{agent_id}")
+async def deregister_agent(agent_id: str):
+    if not await store.remove("agent", agent_id):
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return {"status": "ok"}
+
+
+@app.delete("/tools/{tool_id}")
+async def deregister_tool(tool_id: str):
+    if not await store.remove("tool", tool_id):
+        raise HTTPException(status_code=404, detail="Tool not found")
+    return {"status": "ok"}
 
 
 @app.put("/agents/{agent_id}/heartbeat")
-def update_agent_heartbeat(agent_id: str):
-    if agent_id not in agents:
+async def update_agent_heartbeat(agent_id: str):
+    known = await store.heartbeat("agent", agent_id)
+    heartbeats_total.inc("agent", str(known).lower())
+    if not known:
         raise HTTPException(status_code=404, detail="Agent not found")
-    agents[agent_id].last_seen = time.time()
     return {"status": "ok"}
 
 
 @app.put("/tools/{tool_id}/heartbeat")
-def update_tool_heartbeat(tool_id: str):
-    if tool_id not in tools:
+async def update_tool_heartbeat(tool_id: str):
+    known = await store.heartbeat("tool", tool_id)
+    heartbeats_total.inc("tool", str(known).lower())
+    if not known:
         raise HTTPException(status_code=404, detail="Tool not found")
-    tools[tool_id].last_seen = time.time()
     return {"status": "ok"}
 
 
+@app.post("/heartbeats")
+async def batch_heartbeat(batch: HeartbeatBatch):
+    """
+    Refresh many services in one call and report the ids that are not registered
+    """
+    unknown = {
+        "agents": await store.heartbeat_many("agent", batch.agents),
+        "tools": await store.heartbeat_many("tool", batch.tools),
+    }
+    for service_type, sent, missing in (("agent", batch.agents, unknown["agents"]),
+                                        ("tool", batch.tools, unknown["tools"])):
+        heartbeats_total.inc(service_type, "true", amount=len(sent) - len(missing))
+        heartbeats_total.inc(service_type, "false", amount=len(missing))
+    return {"status": "ok", "unknown": unknown}
+
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
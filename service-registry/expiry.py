@@ -0,0 +1,58 @@
+import heapq
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Rebuild the heap once stale entries outnumber live ones by this factor
+COMPACTION_RATIO = 4
+
+
+class ExpiryQueue:
+    """
+    Min-heap of service deadlines
+
+    Rescheduling a key (e.g. on heartbeat) pushes a new entry and leaves the
+    old one in place; stale entries are skipped when they reach the top, so
+    every operation stays O(log n) without searching the heap.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, Hashable]] = []
+        self._deadlines: Dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Set (or move) the deadline for ``key``"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > COMPACTION_RATIO * (len(self._deadlines) + 1):
+            self._compact()
+
+    def discard(self, key: Hashable):
+        """Stop tracking ``key``; its heap entries are dropped lazily"""
+        self._deadlines.pop(key, None)
+
+    def next_deadline(self) -> Optional[float]:
+        """Return the earliest live deadline, or None if nothing is scheduled"""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[Hashable]:
+        """Remove and return every key whose deadline is at or before ``now``"""
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append(key)
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _compact(self):
+        self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Optional
+
+# Number of recent events kept for watchers to catch up from
+FEED_HISTORY = 1000
+
+
+def change_event(revision: int, event: str, service_type: str, service_id: str, service: Optional[Dict] = None) -> Dict:
+    return {
+        "revision": revision,
+        "event": event,
+        "service_type": service_type,
+        "id": service_id,
+        "service": service,
+    }
+
+
+class ChangeFeed:
+    """
+    Process-local registry revision counter and bounded change log
+
+    Every register, update, deregister and expiry bumps the revision by one.
+    Watchers ask for the events after a revision they already applied and
+    can wait for the next one instead of polling.
+    """
+
+    def __init__(self, history: int = FEED_HISTORY):
+        # Start from the clock rather than zero so revisions (and the ETags
+        # built from them) keep increasing across registry restarts, and
+        # watchers from a previous process are told to resync
+        self.revision = int(time.time() * 1000)
+        self.events = deque(maxlen=history)
+        self._changed = asyncio.Event()
+
+    def publish(self, event: str, service_type: str, service_id: str, service: Optional[Dict] = None) -> int:
+        self.revision += 1
+        self.events.append(change_event(self.revision, event, service_type, service_id, service))
+        # Wake every current waiter, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return self.revision
+
+    def since(self, revision: int) -> Optional[List[Dict]]:
+        """
+        Return the events after ``revision``, or None if the caller must resync
+
+        A resync is needed when ``revision`` has fallen out of the retained
+        history or is ahead of this feed (e.g. the registry restarted).
+        """
+        if revision == self.revision:
+            return []
+        if revision > self.revision or not self.events or self.events[0]["revision"] > revision + 1:
+            return None
+        return list(islice(self.events, revision + 1 - self.events[0]["revision"], None))
+
+    async def wait(self, revision: int, timeout: float) -> Optional[List[Dict]]:
+        """Like ``since`` but waits up to ``timeout`` seconds for a new event"""
+        events = self.since(revision)
+        if events == []:
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            events = self.since(revision)
+        return events
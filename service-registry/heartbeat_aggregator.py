@@ -0,0 +1,104 @@
+"""
+Node-local heartbeat aggregator
+
+Runs next to a group of co-located agents and tools (as a sidecar or one per
+node) and accepts the same ``PUT /agents/{id}/heartbeat`` and
+``PUT /tools/{id}/heartbeat`` calls as the registry. Heartbeats are coalesced
+and forwarded to the registry's ``POST /heartbeats`` once per interval.
+
+Point a service's HEARTBEAT_URL at the aggregator to use it. Registration
+still goes straight to REGISTRY_URL.
+
+    uvicorn heartbeat_aggregator:app --host 0.0.0.0 --port 8001
+"""
+from fastapi import FastAPI, HTTPException
+import httpx
+import os
+import asyncio
+import logging
+
+app = FastAPI(title="Heartbeat Aggregator")
+
+# Configuration
+REGISTRY_URL = os.environ.get("REGISTRY_URL", "http://service-registry:8000")
+# Seconds between batched flushes; keep well under the registry's SERVICE_EXPIRATION
+FLUSH_INTERVAL = float(os.environ.get("HEARTBEAT_FLUSH_INTERVAL", "10"))
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Ids waiting for the next flush
+pending = {"agent": set(), "tool": set()}
+# Ids the registry reported as unknown; the next heartbeat for each gets a 404
+unknown = {"agent": set(), "tool": set()}
+
+
+def queue_heartbeat(service_type: str, service_id: str):
+    if service_id in unknown[service_type]:
+        unknown[service_type].discard(service_id)
+        raise HTTPException(status_code=404, detail=f"{service_type.capitalize()} not found")
+    pending[service_type].add(service_id)
+    return {"status": "ok"}
+
+
+@app.put("/agents/{agent_id}/heartbeat")
+async def agent_heartbeat(agent_id: str):
+    return queue_heartbeat("agent", agent_id)
+
+
+@app.put("/tools/{tool_id}/heartbeat")
+async def tool_heartbeat(tool_id: str):
+    return queue_heartbeat("tool", tool_id)
+
+
+async def flush_heartbeats(client: httpx.AsyncClient):
+    """Send every pending heartbeat to the registry in one request"""
+    batch = {"agent": pending["agent"], "tool": pending["tool"]}
+    if not batch["agent"] and not batch["tool"]:
+        return
+    pending["agent"], pending["tool"] = set(), set()
+
+    try:
+        response = await client.post(
+            f"{REGISTRY_URL}/heartbeats",
+            json={"agents": list(batch["agent"]), "tools": list(batch["tool"])}
+        )
+        response.raise_for_status()
+    except Exception:
+        # Retry on the next flush rather than letting the services expire
+        pending["agent"] |= batch["agent"]
+        pending["tool"] |= batch["tool"]
+        raise
+
+    missing = response.json().get("unknown", {})
+    unknown["agent"].update(missing.get("agents", []))
+    unknown["tool"].update(missing.get("tools", []))
+    logger.debug(f"Flushed {len(batch['agent'])} agent and {len(batch['tool'])} tool heartbeats")
+
+
+async def flush_loop():
+    async with httpx.AsyncClient() as client:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await flush_heartbeats(client)
+            except Exception as e:
+                logger.error(f"Error flushing heartbeats: {str(e)}")
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Start the periodic flush"""
+    app.state.flush_task = asyncio.create_task(flush_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the periodic flush"""
+    app.state.flush_task.cancel()
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "healthy"}
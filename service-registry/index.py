@@ -0,0 +1,137 @@
+from collections import defaultdict
+from itertools import count
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Longest n-gram kept in the name index. Shorter queries hit the index
+# directly; longer ones intersect their trigrams and confirm the substring.
+NAME_NGRAM_SIZE = 3
+
+
+def name_ngrams(name: str, max_size: int = NAME_NGRAM_SIZE) -> Set[str]:
+    """Return every lowercase n-gram of ``name`` up to ``max_size`` characters"""
+    name = name.lower()
+    grams = set()
+    for size in range(1, max_size + 1):
+        for start in range(len(name) - size + 1):
+            grams.add(name[start:start + size])
+    return grams
+
+
+class ServiceIndex:
+    """
+    Inverted indexes over one kind of registered service (agents or tools)
+
+    Maps capabilities, lowercase tool types and name n-grams to service ids so
+    discovery queries become set intersections instead of full scans.
+    Matches are returned in registration order; re-indexing a service keeps
+    its place.
+    """
+
+    def __init__(self):
+        self.ids: Set[str] = set()
+        self.names: Dict[str, str] = {}
+        self.by_capability: Dict[str, Set[str]] = defaultdict(set)
+        self.by_tool_type: Dict[str, Set[str]] = defaultdict(set)
+        self.by_name_gram: Dict[str, Set[str]] = defaultdict(set)
+        # Keys each id was indexed under, so removal touches only its own postings
+        self._postings: Dict[str, List[Tuple[Dict[str, Set[str]], str]]] = {}
+        # Registration sequence number of each id, for a stable result order
+        self._order: Dict[str, int] = {}
+        self._sequence = count()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, service_id: str) -> bool:
+        return service_id in self.ids
+
+    def add(
+        self,
+        service_id: str,
+        name: str,
+        capabilities: Iterable[str] = (),
+        tool_type: Optional[str] = None,
+    ):
+        """Index a service, replacing any previous entry for the same id"""
+        order = self._order.get(service_id)
+        self.remove(service_id)
+
+        postings = [(self.by_capability, cap) for cap in set(capabilities)]
+        if tool_type is not None:
+            postings.append((self.by_tool_type, tool_type.lower()))
+        postings.extend((self.by_name_gram, gram) for gram in name_ngrams(name))
+
+        for table, key in postings:
+            table[key].add(service_id)
+
+        self.ids.add(service_id)
+        self.names[service_id] = name.lower()
+        self._postings[service_id] = postings
+        self._order[service_id] = next(self._sequence) if order is None else order
+
+    def remove(self, service_id: str):
+        """Drop a service from every index it appears in"""
+        postings = self._postings.pop(service_id, None)
+        if postings is None:
+            return
+
+        for table, key in postings:
+            bucket = table.get(key)
+            if bucket is None:
+                continue
+            bucket.discard(service_id)
+            if not bucket:
+                del table[key]
+
+        self.ids.discard(service_id)
+        self.names.pop(service_id, None)
+        self._order.pop(service_id, None)
+
+    def match(
+        self,
+        name: Optional[str] = None,
+        capabilities: Optional[List[str]] = None,
+        tool_type: Optional[str] = None,
+    ) -> List[str]:
+        """
+        Return the ids matching every given filter, in registration order
+
+        ``capabilities`` must all be present, ``tool_type`` is compared
+        case-insensitively and ``name`` is a case-insensitive substring match.
+        """
+        candidates = []
+
+        if capabilities:
+            candidates.extend(self.by_capability.get(cap, set()) for cap in set(capabilities))
+        if tool_type:
+            candidates.append(self.by_tool_type.get(tool_type.lower(), set()))
+
+        needle = name.lower() if name else None
+        if needle:
+            if len(needle) <= NAME_NGRAM_SIZE:
+                candidates.append(self.by_name_gram.get(needle, set()))
+            else:
+                candidates.extend(
+                    self.by_name_gram.get(needle[i:i + NAME_NGRAM_SIZE], set())
+                    for i in range(len(needle) - NAME_NGRAM_SIZE + 1)
+                )
+
+        if not candidates:
+            return self._ordered(self.ids)
+
+        # Intersect starting from the most selective posting list
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for bucket in candidates[1:]:
+            if not result:
+                break
+            result &= bucket
+
+        # N-gram overlap is necessary but not sufficient for long substrings
+        if needle and len(needle) > NAME_NGRAM_SIZE:
+            result = {service_id for service_id in result if needle in self.names[service_id]}
+
+        return self._ordered(result)
+
+    def _ordered(self, service_ids: Iterable[str]) -> List[str]:
+        return sorted(service_ids, key=self._order.__getitem__)
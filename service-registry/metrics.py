@@ -0,0 +1,237 @@
+"""
+Prometheus metrics without a client library
+
+Counters, gauges and histograms are plain Python numbers in dicts keyed by
+label values. They are only updated from the event loop thread, so
+recording a value is a dict lookup and an addition with no locking.
+``MetricsRegistry.render`` writes the Prometheus text exposition format.
+Collectors add values read at scrape time, such as statistics a service
+already keeps, so the hot path pays nothing for them.
+
+``instrument(app, registry)`` adds per-route request latency histograms,
+request counters by status, an in-flight gauge and GET /metrics to a
+FastAPI app. It is a plain ASGI wrapper rather than BaseHTTPMiddleware, so
+streamed responses are timed to their last byte.
+
+This file is shared by the registry, agent and tool; keep the copies in sync.
+"""
+import bisect
+import inspect
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+# Request latency buckets in seconds: sub-millisecond reads up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (name suffix, label names, label values, value)
+Sample = Tuple[str, Sequence[str], Sequence[str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count, one per combination of label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for label_values, value in self.values.items():
+            yield "", self.labels, label_values, value
+
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+
+    def dec(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) - amount
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets
+
+    Each observation increments one bucket; the cumulative counts the
+    exposition format wants are summed at scrape time.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [counts per bucket (+Inf last), sum]
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        state = self.values.get(label_values)
+        if state is None:
+            state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self) -> Iterable[Sample]:
+        bucket_labels = self.labels + ("le",)
+        for label_values, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", bucket_labels, label_values + (_format_value(bound),), cumulative
+            yield "_sum", self.labels, label_values, total
+            yield "_count", self.labels, label_values, cumulative
+
+
+class MetricsRegistry:
+    """A service's metrics, rendered together for /metrics"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable] = []
+
+    def _add(self, metric: Metric) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, function: Callable) -> Callable:
+        """
+        Register ``function`` (sync or async) to run at scrape time
+
+        It returns metrics built for the scrape, e.g. gauges set from a
+        stats snapshot. Usable as a decorator.
+        """
+        self.collectors.append(function)
+        return function
+
+    async def render(self) -> str:
+        metrics = list(self.metrics)
+        for collect in self.collectors:
+            collected = collect()
+            if inspect.isawaitable(collected):
+                collected = await collected
+            metrics.extend(collected or ())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, names, values, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def gauges_from(prefix: str, documentation: str, values: Dict[str, Any], labels: Sequence[str] = (),
+                label_values: Sequence[str] = ()) -> List[Gauge]:
+    """One gauge per numeric entry of a stats snapshot, e.g. ``llm_cache.snapshot()``"""
+    gauges = []
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        gauge = Gauge(f"{prefix}_{key}", f"{documentation} ({key})", labels)
+        gauge.set(value, *label_values)
+        gauges.append(gauge)
+    return gauges
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and counts the ones in flight"""
+
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being served")
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests served", ("method", "route", "status")
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency until the last byte", ("method", "route")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            # The route template (e.g. /agents/{agent_id}) keeps label values bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            self.latency.observe(time.perf_counter() - started, method, path)
+            self.requests.inc(method, path, str(status))
+
+
+def instrument(app: FastAPI, registry: Optional[MetricsRegistry] = None) -> MetricsRegistry:
+    """Add request metrics and GET /metrics to ``app``"""
+    registry = registry or MetricsRegistry()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(await registry.render(), media_type=CONTENT_TYPE)
+
+    return registry
@@ -0,0 +1,47 @@
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional, Literal, Union
+import uuid
+import time
+
+
+class ServiceBase(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: str
+    version: str
+    host: str
+    port: int
+    health_endpoint: str = "/health"
+    last_seen: float = Field(default_factory=time.time)
+    metadata: Dict = {}
+
+
+class Agent(ServiceBase):
+    type: Literal["agent"] = "agent"
+    capabilities: List[str] = []
+    required_tools: List[str] = []
+
+
+class Tool(ServiceBase):
+    type: Literal["tool"] = "tool"
+    tool_type: str
+    endpoints: Dict[str, Dict] = {}
+    schema: Dict = {}
+
+
+class ServiceQuery(BaseModel):
+    service_type: Optional[Literal["agent", "tool"]] = None
+    tool_type: Optional[str] = None
+    capabilities: Optional[List[str]] = None
+    name: Optional[str] = None
+
+
+class HeartbeatBatch(BaseModel):
+    agents: List[str] = []
+    tools: List[str] = []
+
+
+Service = Union[Agent, Tool]
+
+# Model class for each value of the ``type`` discriminator
+SERVICE_MODELS = {"agent": Agent, "tool": Tool}
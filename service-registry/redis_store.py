@@ -0,0 +1,345 @@
+import json
+import time
+from typing import Dict, Iterable, List, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+
+from feed import FEED_HISTORY, change_event
+from index import NAME_NGRAM_SIZE, name_ngrams
+from models import SERVICE_MODELS, Service, ServiceQuery
+from store import SERVICE_TYPES, RegistryStore, query_types
+from summary import RegistrySummary
+
+# Bumps the revision and appends the change event in one step. The revision
+# doubles as the stream entry id, so watchers can XREAD from "<since>-1".
+# Registered ids are scored by the revision that first added them, which
+# keeps listings in registration order across replicas.
+PUBLISH_SCRIPT = """
+local revision = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], revision .. '-1',
+           'event', ARGV[2], 'service_type', ARGV[3], 'id', ARGV[4], 'service', ARGV[5])
+if ARGV[2] == 'register' or ARGV[2] == 'update' then
+    redis.call('ZADD', KEYS[3], 'NX', revision, ARGV[4])
+end
+return revision
+"""
+
+
+class RedisStore(RegistryStore):
+    """
+    Registry store shared by every replica through Redis
+
+    Key layout (``prefix`` defaults to "registry"):
+
+    - ``{prefix}:doc:{type}:{id}``    service JSON
+    - ``{prefix}:alive:{type}:{id}``  liveness key whose TTL is the expiry timer
+    - ``{prefix}:ids:{type}``         registered ids, scored by registration revision
+    - ``{prefix}:idx:{type}:...``     capability, tool_type and name n-gram sets
+    - ``{prefix}:revision``           registry revision counter
+    - ``{prefix}:events``             stream of change events keyed by revision
+
+    A heartbeat is a single PEXPIRE on the liveness key, and ``last_seen`` is
+    derived from its remaining TTL. Documents and index entries of services
+    whose liveness key has expired are purged on read and by ``expire()``.
+    Listings and discovery results are in registration order, as with
+    ``MemoryStore``.
+
+    Writes that depend on a document (re-registration, removal, expiry)
+    WATCH it and retry if another replica changed it in the meantime, so
+    index entries always match the stored document and each change is
+    published once.
+
+    Each replica keeps its own ``RegistrySummary``, brought up to date from
+    the change events since it was last read and rebuilt from the services
+    when those events are no longer in the stream.
+    """
+
+    def __init__(self, url: str, expiration: float, prefix: str = "registry", client=None):
+        super().__init__(expiration)
+        self.redis = client if client is not None else redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.expiration_ms = int(expiration * 1000)
+        self.revision_key = f"{prefix}:revision"
+        self.events_key = f"{prefix}:events"
+        self._publish = self.redis.register_script(PUBLISH_SCRIPT)
+        self.registry_summary: Optional[RegistrySummary] = None
+        self.summary_revision = 0
+
+    def _doc_key(self, service_type: str, service_id: str) -> str:
+        return f"{self.prefix}:doc:{service_type}:{service_id}"
+
+    def _alive_key(self, service_type: str, service_id: str) -> str:
+        return f"{self.prefix}:alive:{service_type}:{service_id}"
+
+    def _ids_key(self, service_type: str) -> str:
+        return f"{self.prefix}:ids:{service_type}"
+
+    def _index_key(self, service_type: str, field: str, value: str) -> str:
+        return f"{self.prefix}:idx:{service_type}:{field}:{value}"
+
+    def _index_keys(self, service: Service) -> List[str]:
+        keys = [
+            self._index_key(service.type, "capability", cap)
+            for cap in set(getattr(service, "capabilities", ()))
+        ]
+        tool_type = getattr(service, "tool_type", None)
+        if tool_type is not None:
+            keys.append(self._index_key(service.type, "tool_type", tool_type.lower()))
+        keys.extend(self._index_key(service.type, "gram", gram) for gram in name_ngrams(service.name))
+        return keys
+
+    def _parse(self, service_type: str, doc: str) -> Service:
+        return SERVICE_MODELS[service_type].model_validate_json(doc)
+
+    async def _queue_event(self, pipe, event: str, service_type: str, service_id: str, doc: str = ""):
+        """Queue the revision bump and change event; count it once the transaction commits"""
+        await self._publish(
+            keys=[self.revision_key, self.events_key, self._ids_key(service_type)],
+            args=[FEED_HISTORY, event, service_type, service_id, doc],
+            client=pipe,
+        )
+
+    async def save(self, service: Service):
+        doc_key = self._doc_key(service.type, service.id)
+        doc = service.model_dump_json()
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # The old document decides which index entries to drop
+                    await pipe.watch(doc_key)
+                    old_doc = await pipe.get(doc_key)
+                    event = "register" if old_doc is None else "update"
+                    pipe.multi()
+                    if old_doc is not None:
+                        for key in self._index_keys(self._parse(service.type, old_doc)):
+                            pipe.srem(key, service.id)
+                    pipe.set(doc_key, doc)
+                    pipe.set(self._alive_key(service.type, service.id), 1, px=self.expiration_ms)
+                    for key in self._index_keys(service):
+                        pipe.sadd(key, service.id)
+                    await self._queue_event(pipe, event, service.type, service.id, doc)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        self.change_counts[event] += 1
+
+    async def get(self, service_type: str, service_id: str) -> Optional[Service]:
+        services = await self._load(service_type, [service_id])
+        return services[0] if services else None
+
+    async def list(self, service_type: str) -> List[Service]:
+        service_ids = await self.redis.zrange(self._ids_key(service_type), 0, -1)
+        return await self._load(service_type, service_ids)
+
+    async def discover(self, query: ServiceQuery) -> Dict[str, List[Service]]:
+        matched = {"agent": [], "tool": []}
+        needle = query.name.lower() if query.name else None
+
+        for service_type in query_types(query):
+            keys = []
+            if service_type == "agent" and query.capabilities:
+                keys.extend(self._index_key("agent", "capability", cap) for cap in set(query.capabilities))
+            if service_type == "tool" and query.tool_type:
+                keys.append(self._index_key("tool", "tool_type", query.tool_type.lower()))
+            if needle:
+                if len(needle) <= NAME_NGRAM_SIZE:
+                    keys.append(self._index_key(service_type, "gram", needle))
+                else:
+                    keys.extend(
+                        self._index_key(service_type, "gram", needle[i:i + NAME_NGRAM_SIZE])
+                        for i in range(len(needle) - NAME_NGRAM_SIZE + 1)
+                    )
+
+            if keys:
+                service_ids = await self._registration_order(service_type, await self.redis.sinter(keys))
+            else:
+                service_ids = await self.redis.zrange(self._ids_key(service_type), 0, -1)
+
+            services = await self._load(service_type, service_ids)
+            if needle and len(needle) > NAME_NGRAM_SIZE:
+                services = [service for service in services if needle in service.name.lower()]
+            matched[service_type] = services
+
+        return {"agents": matched["agent"], "tools": matched["tool"]}
+
+    async def remove(self, service_type: str, service_id: str) -> bool:
+        return await self._purge(service_type, [service_id], "deregister") > 0
+
+    async def heartbeat(self, service_type: str, service_id: str) -> bool:
+        return bool(await self.redis.pexpire(self._alive_key(service_type, service_id), self.expiration_ms))
+
+    async def heartbeat_many(self, service_type: str, service_ids: List[str]) -> List[str]:
+        if not service_ids:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for service_id in service_ids:
+                pipe.pexpire(self._alive_key(service_type, service_id), self.expiration_ms)
+            refreshed = await pipe.execute()
+        return [service_id for service_id, ok in zip(service_ids, refreshed) if not ok]
+
+    async def expire(self) -> int:
+        expired = 0
+        for service_type in SERVICE_TYPES:
+            service_ids = await self.redis.zrange(self._ids_key(service_type), 0, -1)
+            if not service_ids:
+                continue
+
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for service_id in service_ids:
+                    pipe.exists(self._alive_key(service_type, service_id))
+                results = await pipe.execute()
+
+            dead = [service_id for service_id, alive in zip(service_ids, results) if not alive]
+            if dead:
+                # Counts only what this replica purged, not what another one beat it to
+                expired += await self._purge(service_type, dead, "expire")
+        return expired
+
+    async def revision(self) -> int:
+        # Purge lapsed services first, so an ETag never covers expired data
+        await self.expire()
+        return int(await self.redis.get(self.revision_key) or 0)
+
+    async def summary(self) -> Dict:
+        revision = await self.revision()
+        if self.registry_summary is None or not await self._catch_up_summary(revision):
+            await self._rebuild_summary()
+        return self.registry_summary.document(self.summary_revision)
+
+    async def _catch_up_summary(self, revision: int) -> bool:
+        """Apply change events up to ``revision``; False if some are gone"""
+        if revision == self.summary_revision:
+            return True
+        if revision < self.summary_revision:
+            return False
+        entries = await self.redis.xrange(self.events_key, min=f"{self.summary_revision + 1}-1", max=f"{revision}-1")
+        if not entries or int(entries[0][0].split("-")[0]) != self.summary_revision + 1:
+            return False
+        for entry_id, fields in entries:
+            service = json.loads(fields["service"]) if fields["service"] else None
+            self.registry_summary.apply(fields["service_type"], fields["id"], service)
+        self.summary_revision = int(entries[-1][0].split("-")[0])
+        return True
+
+    async def _rebuild_summary(self):
+        # Read the revision first: changes racing with the listing are replayed
+        revision = await self.revision()
+        summary = RegistrySummary()
+        for service_type in SERVICE_TYPES:
+            for service in await self.list(service_type):
+                summary.apply(service_type, service.id, service.model_dump())
+        self.registry_summary, self.summary_revision = summary, revision
+
+    async def watch(self, since: int, timeout: float) -> Optional[List[Dict]]:
+        current = await self.revision()
+        if since > current:
+            return None
+        if since < current:
+            oldest = await self.redis.xrange(self.events_key, count=1)
+            if not oldest or int(oldest[0][0].split("-")[0]) > since + 1:
+                return None
+
+        streams = await self.redis.xread(
+            {self.events_key: f"{since}-1"},
+            block=None if since < current else max(int(timeout * 1000), 1),
+        )
+        if not streams:
+            return []
+
+        return [
+            change_event(
+                int(entry_id.split("-")[0]),
+                fields["event"],
+                fields["service_type"],
+                fields["id"],
+                json.loads(fields["service"]) if fields["service"] else None,
+            )
+            for entry_id, fields in streams[0][1]
+        ]
+
+    async def close(self):
+        await self.redis.aclose()
+
+    async def _registration_order(self, service_type: str, service_ids: Iterable[str]) -> List[str]:
+        """Sort ids from an index intersection the way ``list`` returns them"""
+        service_ids = list(service_ids)
+        if not service_ids:
+            return []
+        scores = await self.redis.zmscore(self._ids_key(service_type), service_ids)
+        # Ids missing from the registry (stale index entries) go last; _load drops them
+        order = {
+            service_id: (score is None, score or 0, service_id)
+            for service_id, score in zip(service_ids, scores)
+        }
+        return sorted(service_ids, key=order.__getitem__)
+
+    async def _load(self, service_type: str, service_ids: Iterable[str]) -> List[Service]:
+        """Fetch live services by id, purging any whose liveness key expired"""
+        service_ids = list(service_ids)
+        if not service_ids:
+            return []
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for service_id in service_ids:
+                pipe.get(self._doc_key(service_type, service_id))
+                pipe.pttl(self._alive_key(service_type, service_id))
+            results = await pipe.execute()
+
+        now = time.time()
+        services = []
+        dead: List[str] = []
+        for i, service_id in enumerate(service_ids):
+            doc, ttl_ms = results[2 * i], results[2 * i + 1]
+            if doc is None or ttl_ms < 0:
+                dead.append(service_id)
+                continue
+            service = self._parse(service_type, doc)
+            service.last_seen = now - (self.expiration_ms - ttl_ms) / 1000
+            services.append(service)
+
+        if dead:
+            await self._purge(service_type, dead, "expire")
+        return services
+
+    async def _purge(self, service_type: str, service_ids: List[str], reason: str) -> int:
+        """
+        Delete documents, liveness keys and index entries of ``service_ids``
+
+        For "expire" only services whose liveness key is still gone are
+        deleted, so a heartbeat or re-registration that raced the sweep wins.
+        Ids whose document is already gone are dropped from the id set
+        without an event. Returns how many documents were deleted.
+        """
+        doc_keys = [self._doc_key(service_type, service_id) for service_id in service_ids]
+        alive_keys = [self._alive_key(service_type, service_id) for service_id in service_ids]
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(*doc_keys, *alive_keys)
+                    docs = await pipe.mget(doc_keys)
+                    alive = await pipe.mget(alive_keys)
+                    purged = [
+                        (service_id, doc)
+                        for service_id, doc, is_alive in zip(service_ids, docs, alive)
+                        if reason != "expire" or is_alive is None
+                    ]
+                    pipe.multi()
+                    for service_id, doc in purged:
+                        if doc is not None:
+                            for key in self._index_keys(self._parse(service_type, doc)):
+                                pipe.srem(key, service_id)
+                            await self._queue_event(pipe, reason, service_type, service_id)
+                        pipe.zrem(self._ids_key(service_type), service_id)
+                        pipe.delete(self._doc_key(service_type, service_id), self._alive_key(service_type, service_id))
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+
+        deleted = sum(1 for _, doc in purged if doc is not None)
+        self.change_counts[reason] += deleted
+        return deleted
@@ -0,0 +1,57 @@
+import hashlib
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+from models import Service
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[Set[str]]:
+    """
+    Parse a ``fields=id,host,port`` projection, or return None for full models
+    """
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+
+def project(services: Iterable[Service], include: Optional[Set[str]]) -> List[Dict]:
+    return [service.model_dump(include=include) for service in services]
+
+
+def make_etag(revision: int, *variant) -> str:
+    """
+    Entity tag for a registry read at ``revision``
+
+    ``variant`` covers whatever else shapes the body (path, projection, query)
+    so different views of the same revision never share a tag. Heartbeats do
+    not bump the revision, so ``last_seen`` in a cached body may lag.
+    """
+    digest = hashlib.sha1(json.dumps(variant, sort_keys=True, default=sorted).encode()).hexdigest()[:16]
+    return f'"{revision}-{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+async def conditional_json(request: Request, etag: str, build: Callable) -> Response:
+    """
+    Return 304 if the caller already has ``etag``, otherwise the JSON from ``build``
+
+    ``build`` is only awaited on a miss, so unchanged reads skip both the
+    store lookup and serialization.
+    """
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(await build(), headers={"ETag": etag})
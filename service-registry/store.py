@@ -0,0 +1,212 @@
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from expiry import ExpiryQueue
+from feed import ChangeFeed
+from index import ServiceIndex
+from models import Service, ServiceQuery
+from summary import RegistrySummary
+
+SERVICE_TYPES = ("agent", "tool")
+
+
+def query_types(query: ServiceQuery) -> List[str]:
+    """Return the service types a discovery query covers"""
+    return [query.service_type] if query.service_type else list(SERVICE_TYPES)
+
+
+class RegistryStore:
+    """
+    Storage backend for registered agents and tools
+
+    Services are addressed by ``(service_type, service_id)``, where
+    ``service_type`` is the model's ``type`` field ("agent" or "tool").
+    Every read only returns services whose last heartbeat is within
+    ``expiration`` seconds.
+
+    Registrations, updates, deregistrations and expiries bump a registry
+    revision and are recorded as change events (see ``feed.change_event``)
+    that watchers can follow. Heartbeats do not change the revision.
+    ``change_counts`` counts the events this process recorded, by kind.
+    """
+
+    def __init__(self, expiration: float):
+        self.expiration = expiration
+        self.change_counts: Counter = Counter()
+
+    async def save(self, service: Service):
+        """Insert or replace a service and (re)start its expiry timer"""
+        raise NotImplementedError
+
+    async def get(self, service_type: str, service_id: str) -> Optional[Service]:
+        raise NotImplementedError
+
+    async def list(self, service_type: str) -> List[Service]:
+        raise NotImplementedError
+
+    async def discover(self, query: ServiceQuery) -> Dict[str, List[Service]]:
+        """Return ``{"agents": [...], "tools": [...]}`` matching the query"""
+        raise NotImplementedError
+
+    async def remove(self, service_type: str, service_id: str) -> bool:
+        """Deregister a service; returns False if it was not registered"""
+        raise NotImplementedError
+
+    async def heartbeat(self, service_type: str, service_id: str) -> bool:
+        """Refresh a service's expiry timer; returns False if it is unknown"""
+        raise NotImplementedError
+
+    async def heartbeat_many(self, service_type: str, service_ids: List[str]) -> List[str]:
+        """Refresh many services at once; returns the ids that are unknown"""
+        return [
+            service_id
+            for service_id in service_ids
+            if not await self.heartbeat(service_type, service_id)
+        ]
+
+    async def expire(self) -> int:
+        """Drop services whose timers have run out and return how many"""
+        raise NotImplementedError
+
+    def next_expiry(self) -> Optional[float]:
+        """Earliest pending deadline if the backend tracks one, else None"""
+        return None
+
+    async def revision(self) -> int:
+        raise NotImplementedError
+
+    async def summary(self) -> Dict:
+        """Tool counts, agent satisfiability and totals (see RegistrySummary.document)"""
+        raise NotImplementedError
+
+    async def watch(self, since: int, timeout: float) -> Optional[List[Dict]]:
+        """
+        Return the change events after revision ``since``, waiting up to
+        ``timeout`` seconds for one; None means the caller must resync
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryStore(RegistryStore):
+    """
+    Process-local store backed by dicts, inverted indexes and a deadline heap
+    """
+
+    def __init__(self, expiration: float):
+        super().__init__(expiration)
+        self.services: Dict[str, Dict[str, Service]] = {t: {} for t in SERVICE_TYPES}
+        self.indexes: Dict[str, ServiceIndex] = {t: ServiceIndex() for t in SERVICE_TYPES}
+        # Deadlines (last_seen + expiration) keyed by (service_type, id)
+        self.expiry_queue = ExpiryQueue()
+        self.feed = ChangeFeed()
+        self.registry_summary = RegistrySummary()
+
+    async def save(self, service: Service):
+        event = "update" if service.id in self.services[service.type] else "register"
+        self.services[service.type][service.id] = service
+        self.indexes[service.type].add(
+            service.id,
+            service.name,
+            capabilities=getattr(service, "capabilities", ()),
+            tool_type=getattr(service, "tool_type", None),
+        )
+        self.expiry_queue.schedule((service.type, service.id), service.last_seen + self.expiration)
+        document = service.model_dump()
+        self.registry_summary.apply(service.type, service.id, document)
+        self.feed.publish(event, service.type, service.id, document)
+        self.change_counts[event] += 1
+
+    async def get(self, service_type: str, service_id: str) -> Optional[Service]:
+        self._expire_due()
+        return self.services[service_type].get(service_id)
+
+    async def list(self, service_type: str) -> List[Service]:
+        self._expire_due()
+        return list(self.services[service_type].values())
+
+    async def discover(self, query: ServiceQuery) -> Dict[str, List[Service]]:
+        self._expire_due()
+        matched = {"agent": [], "tool": []}
+        for service_type in query_types(query):
+            services = self.services[service_type]
+            service_ids = self.indexes[service_type].match(
+                name=query.name,
+                capabilities=query.capabilities if service_type == "agent" else None,
+                tool_type=query.tool_type if service_type == "tool" else None,
+            )
+            matched[service_type] = [services[service_id] for service_id in service_ids]
+        return {"agents": matched["agent"], "tools": matched["tool"]}
+
+    async def remove(self, service_type: str, service_id: str) -> bool:
+        return self._remove(service_type, service_id, "deregister") is not None
+
+    async def heartbeat(self, service_type: str, service_id: str) -> bool:
+        self._expire_due()
+        return self._touch(service_type, service_id, time.time())
+
+    async def heartbeat_many(self, service_type: str, service_ids: List[str]) -> List[str]:
+        self._expire_due()
+        now = time.time()
+        return [
+            service_id
+            for service_id in service_ids
+            if not self._touch(service_type, service_id, now)
+        ]
+
+    async def expire(self) -> int:
+        return self._expire_due()
+
+    def next_expiry(self) -> Optional[float]:
+        return self.expiry_queue.next_deadline()
+
+    async def revision(self) -> int:
+        self._expire_due()
+        return self.feed.revision
+
+    async def summary(self) -> Dict:
+        self._expire_due()
+        return self.registry_summary.document(self.feed.revision)
+
+    async def watch(self, since: int, timeout: float) -> Optional[List[Dict]]:
+        self._expire_due()
+        return await self.feed.wait(since, timeout)
+
+    def _touch(self, service_type: str, service_id: str, now: float) -> bool:
+        service = self.services[service_type].get(service_id)
+        if service is None:
+            return False
+        service.last_seen = now
+        self.expiry_queue.schedule((service_type, service_id), now + self.expiration)
+        return True
+
+    def _remove(self, service_type: str, service_id: str, reason: str) -> Optional[Service]:
+        self.indexes[service_type].remove(service_id)
+        self.expiry_queue.discard((service_type, service_id))
+        service = self.services[service_type].pop(service_id, None)
+        if service is not None:
+            self.registry_summary.apply(service_type, service_id, None)
+            self.feed.publish(reason, service_type, service_id)
+            self.change_counts[reason] += 1
+        return service
+
+    def _expire_due(self) -> int:
+        # O(1) when nothing is due, so every read can afford to call it
+        expired = self.expiry_queue.pop_due(time.time())
+        for service_type, service_id in expired:
+            self._remove(service_type, service_id, "expire")
+        return len(expired)
+
+
+def create_store(backend: str, expiration: float, redis_url: Optional[str] = None) -> RegistryStore:
+    """Build the configured storage backend ("memory" or "redis")"""
+    if backend == "memory":
+        return MemoryStore(expiration)
+    if backend == "redis":
+        # Imported lazily so the in-memory default does not need a Redis client
+        from redis_store import RedisStore
+        return RedisStore(redis_url, expiration)
+    raise ValueError(f"Unknown registry store backend: {backend}")
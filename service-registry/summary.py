@@ -0,0 +1,98 @@
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Set
+
+
+class RegistrySummary:
+    """
+    Fleet overview kept up to date one registration change at a time
+
+    Tracks live tools per ``tool_type`` and, for each agent, which of its
+    ``required_tools`` currently have no live instance. A tool type going
+    from zero instances to one (or back) only touches the agents that
+    require it, so reads never scan agents against tools.
+
+    ``apply`` is idempotent: it replaces whatever was recorded for the id,
+    so replaying a change event is harmless.
+    """
+
+    def __init__(self):
+        self.tool_types: Dict[str, str] = {}
+        self.tool_counts: Counter = Counter()
+        self.agents: Dict[str, Dict] = {}
+        # Agents requiring each tool type, and each agent's unavailable ones
+        self.required_by: Dict[str, Set[str]] = defaultdict(set)
+        self.missing: Dict[str, Set[str]] = {}
+
+    def apply(self, service_type: str, service_id: str, service: Optional[Dict]):
+        """Record a registration or update (``service``), or a removal (None)"""
+        if service_type == "tool":
+            self._remove_tool(service_id)
+            if service is not None:
+                self._add_tool(service_id, service["tool_type"])
+        else:
+            self._remove_agent(service_id)
+            if service is not None:
+                self._add_agent(service_id, service)
+
+    def _add_tool(self, tool_id: str, tool_type: str):
+        self.tool_types[tool_id] = tool_type
+        self.tool_counts[tool_type] += 1
+        if self.tool_counts[tool_type] == 1:
+            for agent_id in self.required_by.get(tool_type, ()):
+                self.missing[agent_id].discard(tool_type)
+
+    def _remove_tool(self, tool_id: str):
+        tool_type = self.tool_types.pop(tool_id, None)
+        if tool_type is None:
+            return
+        self.tool_counts[tool_type] -= 1
+        if self.tool_counts[tool_type] == 0:
+            del self.tool_counts[tool_type]
+            for agent_id in self.required_by.get(tool_type, ()):
+                self.missing[agent_id].add(tool_type)
+
+    def _add_agent(self, agent_id: str, agent: Dict):
+        required = list(dict.fromkeys(agent.get("required_tools") or []))
+        self.agents[agent_id] = {
+            "name": agent.get("name"),
+            "version": agent.get("version"),
+            "required_tools": required,
+        }
+        for tool_type in required:
+            self.required_by[tool_type].add(agent_id)
+        self.missing[agent_id] = {tool_type for tool_type in required if not self.tool_counts[tool_type]}
+
+    def _remove_agent(self, agent_id: str):
+        agent = self.agents.pop(agent_id, None)
+        if agent is None:
+            return
+        for tool_type in agent["required_tools"]:
+            bucket = self.required_by.get(tool_type)
+            if bucket is not None:
+                bucket.discard(agent_id)
+                if not bucket:
+                    del self.required_by[tool_type]
+        del self.missing[agent_id]
+
+    def document(self, revision: int) -> Dict:
+        """The /summary response body"""
+        unsatisfied = sum(1 for missing in self.missing.values() if missing)
+        return {
+            "revision": revision,
+            "tool_types": dict(self.tool_counts),
+            "agents": {
+                agent_id: {
+                    **agent,
+                    "available_tools": {tool_type: self.tool_counts[tool_type] for tool_type in agent["required_tools"]},
+                    "missing_tools": sorted(self.missing[agent_id]),
+                    "satisfied": not self.missing[agent_id],
+                }
+                for agent_id, agent in self.agents.items()
+            },
+            "health": {
+                "agents": len(self.agents),
+                "tools": len(self.tool_types),
+                "satisfied_agents": len(self.agents) - unsatisfied,
+                "unsatisfied_agents": unsatisfied,
+            },
+        }
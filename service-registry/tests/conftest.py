@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# The registry's modules are imported by name, as uvicorn does from its directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import MemoryStore  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def fake_redis_store(expiration: float = 30.0, client=None):
+    """A RedisStore on an in-process fakeredis server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    from redis_store import RedisStore
+    if client is None:
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return RedisStore("redis://unused", expiration, client=client)
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def store(request):
+    store = MemoryStore(30.0) if request.param == "memory" else fake_redis_store()
+    yield store
+    await store.close()
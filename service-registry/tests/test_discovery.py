@@ -0,0 +1,51 @@
+import pytest
+
+from models import Agent, ServiceQuery, Tool
+
+pytestmark = pytest.mark.anyio
+
+
+def tool(name, tool_type="calculator"):
+    return Tool(name=name, description="", version="1.0", host="localhost", port=8000, tool_type=tool_type)
+
+
+async def test_discover_returns_services_in_registration_order(store):
+    tools = [tool(f"calc-{i}") for i in range(20)]
+    for service in tools:
+        await store.save(service)
+    expected = [service.id for service in tools]
+
+    for query in (
+        ServiceQuery(service_type="tool"),
+        ServiceQuery(service_type="tool", tool_type="calculator"),
+        ServiceQuery(service_type="tool", tool_type="calculator", name="calc"),
+    ):
+        found = await store.discover(query)
+        assert [service.id for service in found["tools"]] == expected
+    assert [service.id for service in await store.list("tool")] == expected
+
+
+async def test_reregistration_keeps_its_place(store):
+    first, second = tool("alpha"), tool("beta")
+    await store.save(first)
+    await store.save(second)
+    await store.save(first.model_copy(update={"name": "alpha-2"}))
+
+    found = await store.discover(ServiceQuery(service_type="tool", tool_type="calculator"))
+    assert [service.name for service in found["tools"]] == ["alpha-2", "beta"]
+
+
+async def test_discover_filters_by_capability_and_name(store):
+    planner = Agent(name="Planner", description="", version="1.0", host="localhost", port=8000,
+                    capabilities=["plan", "math"])
+    writer = Agent(name="Writer", description="", version="1.0", host="localhost", port=8000,
+                   capabilities=["write"])
+    await store.save(planner)
+    await store.save(writer)
+    await store.save(tool("Plan checker", tool_type="checker"))
+
+    found = await store.discover(ServiceQuery(service_type="agent", capabilities=["math"]))
+    assert [service.id for service in found["agents"]] == [planner.id]
+
+    found = await store.discover(ServiceQuery(name="plan"))
+    assert [service.name for service in found["agents"] + found["tools"]] == ["Planner", "Plan checker"]
@@ -0,0 +1,140 @@
+import pytest
+
+from conftest import fake_redis_store
+from models import ServiceQuery, Tool
+
+pytestmark = pytest.mark.anyio
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def tool(name, tool_type="calculator"):
+    return Tool(name=name, description="", version="1.0", host="localhost", port=8000, tool_type=tool_type)
+
+
+@pytest.fixture
+async def replicas():
+    """Two stores sharing one fake Redis server, like two registry replicas"""
+    server = fakeredis.FakeServer()
+    stores = [
+        fake_redis_store(client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        for _ in range(2)
+    ]
+    yield stores
+    for store in stores:
+        await store.close()
+
+
+def race_once(monkeypatch, store, write):
+    """Run ``write`` (another replica's change) inside ``store``'s next transaction, before EXEC"""
+    queue_event = store._queue_event
+    pending = [write]
+
+    async def queue_event_after_race(*args, **kwargs):
+        if pending:
+            await pending.pop()()
+        await queue_event(*args, **kwargs)
+
+    monkeypatch.setattr(store, "_queue_event", queue_event_after_race)
+
+
+async def indexed_under(store, service):
+    """Index keys that list ``service``"""
+    keys = await store.redis.keys(f"{store.prefix}:idx:*")
+    return {key for key in keys if await store.redis.sismember(key, service.id)}
+
+
+async def kill(store, service):
+    """Let a service's liveness key lapse"""
+    await store.redis.delete(store._alive_key(service.type, service.id))
+
+
+async def event_kinds(store, since=0):
+    return [event["event"] for event in await store.watch(since, 0)]
+
+
+async def test_reregistration_replaces_index_entries(replicas):
+    store, _ = replicas
+    service = tool("alpha")
+    await store.save(service)
+    renamed = service.model_copy(update={"name": "omega", "tool_type": "converter"})
+    await store.save(renamed)
+
+    assert await indexed_under(store, renamed) == set(store._index_keys(renamed))
+    assert (await store.discover(ServiceQuery(tool_type="calculator")))["tools"] == []
+    assert (await store.discover(ServiceQuery(name="alp")))["tools"] == []
+    assert [s.name for s in (await store.discover(ServiceQuery(tool_type="converter")))["tools"]] == ["omega"]
+
+
+async def test_save_retries_when_another_replica_writes_first(replicas, monkeypatch):
+    store, other = replicas
+    service = tool("alpha")
+    await store.save(service)
+    racing = service.model_copy(update={"name": "beta", "tool_type": "converter"})
+    race_once(monkeypatch, store, lambda: other.save(racing))
+
+    final = service.model_copy(update={"name": "gamma"})
+    await store.save(final)
+
+    assert (await store.get("tool", service.id)).name == "gamma"
+    # The retry dropped the racing version's entries, not the ones it first read
+    assert await indexed_under(store, final) == set(store._index_keys(final))
+    assert await event_kinds(store) == ["register", "update", "update"]
+    assert store.change_counts == {"register": 1, "update": 1}
+
+
+async def test_expiry_loses_to_a_racing_reregistration(replicas, monkeypatch):
+    store, other = replicas
+    service = tool("alpha")
+    await store.save(service)
+    await kill(store, service)
+    race_once(monkeypatch, store, lambda: other.save(service))
+
+    assert await store.expire() == 0
+    assert [s.id for s in await store.list("tool")] == [service.id]
+    assert await indexed_under(store, service) == set(store._index_keys(service))
+    assert await event_kinds(store) == ["register", "update"]
+
+
+async def test_each_expiry_is_published_once(replicas):
+    store, other = replicas
+    service = tool("alpha")
+    await store.save(service)
+    await kill(store, service)
+
+    assert [await store.expire(), await other.expire()] == [1, 0]
+    assert await event_kinds(store) == ["register", "expire"]
+    assert await indexed_under(store, service) == set()
+    assert await store.redis.zrange(store._ids_key("tool"), 0, -1) == []
+
+
+async def test_revision_covers_lapsed_services(replicas):
+    store, _ = replicas
+    service = tool("alpha")
+    await store.save(service)
+    before = await store.revision()
+    await kill(store, service)
+
+    # An ETag built from the revision must change once the service lapses
+    assert await store.revision() == before + 1
+
+
+async def test_feed_replays_changes_after_an_expiry(replicas, monkeypatch):
+    store, other = replicas
+    kept, lapsed = tool("kept"), tool("lapsed")
+    start = await store.revision()
+    await store.save(kept)
+    await store.save(lapsed)
+    await other.summary()
+    await kill(store, lapsed)
+
+    events = await store.watch(start, 0)
+    assert [(event["event"], event["id"]) for event in events] == [
+        ("register", kept.id), ("register", lapsed.id), ("expire", lapsed.id),
+    ]
+    assert [event["revision"] for event in events] == list(range(start + 1, start + 4))
+
+    # The other replica catches its summary up from the same events
+    monkeypatch.setattr(other, "_rebuild_summary", None)
+    summary = await other.summary()
+    assert other.summary_revision == start + 3
+    assert summary == (await store.summary())
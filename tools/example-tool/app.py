@@ -1,25 +1,89 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
-import httpx
+from typing import List, Dict, Optional, Union
 import os
 import asyncio
 import uuid
 import logging
-import json
+import time
+
+from executor import PoolBusy, PoolSaturated, ProcessPool
+from expression import ExpressionError, compile_expression, evaluate, evaluate_many, evaluate_vectorized
+from http_client import close_client, get_client, start_client
+from metrics import gauges_from, instrument
+from tracing import Tracer, trace_requests
 
 app = FastAPI(title="Example API Tool")
 
 # Configuration
 REGISTRY_URL = os.environ.get("REGISTRY_URL", "http://service-registry:8000")
+# Heartbeats can go through a node-local aggregator instead of the registry
+HEARTBEAT_URL = os.environ.get("HEARTBEAT_URL", REGISTRY_URL)
 TOOL_NAME = "Calculator API"
 TOOL_VERSION = "1.0.0"
 TOOL_ID = str(uuid.uuid4())
+# Most expressions accepted by one /calculate/batch request
+MAX_BATCH_SIZE = int(os.environ.get("CALC_MAX_BATCH_SIZE", "1000"))
+
+# Where calculations run: "inline" on the event loop, or "process" in a pool
+# of worker processes so heavy expressions cannot stall /health or heartbeats
+CALC_EXECUTION_MODE = os.environ.get("CALC_EXECUTION_MODE", "inline")
+CALC_WORKERS = int(os.environ.get("CALC_WORKERS", str(os.cpu_count() or 1)))
+# Calls allowed to wait for a busy worker before new ones get a 429
+CALC_QUEUE_SIZE = int(os.environ.get("CALC_QUEUE_SIZE", str(4 * CALC_WORKERS)))
+# Seconds a call may wait for a worker before it gets a 503
+CALC_QUEUE_TIMEOUT = float(os.environ.get("CALC_QUEUE_TIMEOUT", "5"))
+# Seconds a worker may run one call before it is killed and replaced
+CALC_TASK_TIMEOUT = float(os.environ.get("CALC_TASK_TIMEOUT", "2"))
+# Suggested Retry-After for rejected calls
+CALC_RETRY_AFTER = os.environ.get("CALC_RETRY_AFTER", "1")
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+calculation_pool = ProcessPool(
+    workers=CALC_WORKERS,
+    queue_size=CALC_QUEUE_SIZE,
+    task_timeout=CALC_TASK_TIMEOUT,
+    queue_timeout=CALC_QUEUE_TIMEOUT,
+    # Compile a trivial expression so workers load the engine before serving
+    initializer=evaluate,
+    initargs=("0",)
+) if CALC_EXECUTION_MODE == "process" else None
+
+# Request latency and in-flight metrics for every route, plus GET /metrics
+metrics = instrument(app)
+calculation_latency = metrics.histogram(
+    "calculator_evaluation_duration_seconds",
+    "Time to evaluate a calculation, including any wait for a pool worker",
+    ("operation",)
+)
+calculations_total = metrics.counter(
+    "calculator_evaluations_total", "Calculations by outcome (ok, invalid, rejected)", ("operation", "outcome")
+)
+
+# A span per request, continuing the agent's traceparent, plus one per
+# evaluation; TRACE_EXPORT_FILE enables the JSONL export
+tracer = trace_requests(app, Tracer("example-tool"))
+
+
+@metrics.collector
+def collect_calculator_metrics():
+    """Expression cache and worker pool counters, read at scrape time"""
+    # Compiled expressions cached in this process (workers keep their own in process mode)
+    info = compile_expression.cache_info()
+    lookups = info.hits + info.misses
+    collected = gauges_from("calculator_compile_cache", "Compiled expression cache", {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "hit_ratio": info.hits / lookups if lookups else 0.0,
+    })
+    if calculation_pool:
+        collected += gauges_from("calculator_pool", "Calculation worker pool", calculation_pool.snapshot())
+    return collected
+
 # OpenAPI schema for the tool's endpoints
 api_schema = {
     "openapi": "3.0.0",
@@ -42,7 +106,7 @@ api_schema = {
                                 "properties": {
                                     "expression": {
                                         "type": "string",
-                                        "description": "Mathematical expression to evaluate (e.g., '2 + 2')"
+                                        "description": "Arithmetic expression to evaluate (e.g., '2 + 2' or 'sqrt(2) * pi')"
                                     }
                                 },
                                 "required": ["expression"]
@@ -73,6 +137,75 @@ api_schema = {
                     }
                 }
             }
+        },
+        "/calculate/batch": {
+            "post": {
+                "summary": "Perform several calculations",
+                "description": (
+                    "Evaluate a list of expressions, or one expression over arrays of variable "
+                    "values (scalars broadcast to every element). Each item reports its own error."
+                ),
+                "requestBody": {
+                    "required": True,
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "expressions": {
+                                        "type": "array",
+                                        "items": {"type": "string"},
+                                        "description": "Expressions to evaluate independently"
+                                    },
+                                    "expression": {
+                                        "type": "string",
+                                        "description": "Expression using variables (e.g., 'x * y + 1')"
+                                    },
+                                    "variables": {
+                                        "type": "object",
+                                        "additionalProperties": {
+                                            "oneOf": [
+                                                {"type": "number"},
+                                                {"type": "array", "items": {"type": "number"}}
+                                            ]
+                                        },
+                                        "description": "Values for each variable in 'expression'"
+                                    }
+                                }
+                            }
+                        }
+                    }
+                },
+                "responses": {
+                    "200": {
+                        "description": "One result per expression or per array element",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "results": {
+                                            "type": "array",
+                                            "items": {
+                                                "type": "object",
+                                                "properties": {
+                                                    "expression": {"type": "string"},
+                                                    "result": {"type": "number", "nullable": True},
+                                                    "error": {"type": "string", "nullable": True}
+                                                }
+                                            }
+                                        },
+                                        "expression": {
+                                            "type": "string",
+                                            "description": "Expression evaluated over the variables"
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
         }
     }
 }
@@ -91,6 +224,11 @@ tool_info = {
             "path": "/calculate",
             "method": "POST",
             "description": "Perform a mathematical calculation"
+        },
+        "calculate_batch": {
+            "path": "/calculate/batch",
+            "method": "POST",
+            "description": "Perform several calculations in one request"
         }
     },
     "schema": api_schema,
@@ -103,14 +241,14 @@ tool_info = {
 async def register_with_registry():
     """Register the tool with the service registry"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{REGISTRY_URL}/tools/register", json=tool_info)
-            if response.status_code == 200:
-                logger.info(f"Successfully registered tool: {TOOL_ID}")
-                return response.json()
-            else:
-                logger.error(f"Failed to register tool: {response.text}")
-                return None
+        client = get_client()
+        response = await client.post(f"{REGISTRY_URL}/tools/register", json=tool_info)
+        if response.status_code == 200:
+            logger.info(f"Successfully registered tool: {TOOL_ID}")
+            return response.json()
+        else:
+            logger.error(f"Failed to register tool: {response.text}")
+            return None
     except Exception as e:
         logger.error(f"Error registering tool: {str(e)}")
         return None
@@ -120,12 +258,12 @@ async def send_heartbeat():
     """Send a heartbeat to the registry periodically"""
     while True:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.put(f"{REGISTRY_URL}/tools/{TOOL_ID}/heartbeat")
-                if response.status_code == 200:
-                    logger.debug("Heartbeat sent successfully")
-                else:
-                    logger.warning(f"Failed to send heartbeat: {response.text}")
+            client = get_client()
+            response = await client.put(f"{HEARTBEAT_URL}/tools/{TOOL_ID}/heartbeat")
+            if response.status_code == 200:
+                logger.debug("Heartbeat sent successfully")
+            else:
+                logger.warning(f"Failed to send heartbeat: {response.text}")
         except Exception as e:
             logger.error(f"Error sending heartbeat: {str(e)}")
         
@@ -135,6 +273,12 @@ async def send_heartbeat():
 @app.on_event("startup")
 async def startup_event():
     """Initialize tool on startup"""
+    # Open the shared connection pool used for registry calls
+    await start_client()
+
+    if calculation_pool:
+        await calculation_pool.start()
+
     # Register with the service registry
     registration = await register_with_registry()
     if registration:
@@ -146,6 +290,14 @@ async def startup_event():
         logger.error("Failed to register tool with the service registry")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled connections and calculation workers on shutdown"""
+    await close_client()
+    if calculation_pool:
+        await calculation_pool.close()
+
+
 class CalculationRequest(BaseModel):
     expression: str
 
@@ -155,6 +307,23 @@ class CalculationResponse(BaseModel):
     expression: str
 
 
+class BatchCalculationRequest(BaseModel):
+    expressions: Optional[List[str]] = None
+    expression: Optional[str] = None
+    variables: Optional[Dict[str, Union[float, List[float]]]] = None
+
+
+class BatchItem(BaseModel):
+    expression: Optional[str] = None
+    result: Optional[float] = None
+    error: Optional[str] = None
+
+
+class BatchCalculationResponse(BaseModel):
+    results: List[BatchItem]
+    expression: Optional[str] = None
+
+
 @app.get("/")
 def read_root():
     return {
@@ -165,22 +334,97 @@ def read_root():
     }
 
 
+async def run_calculation(function, *args):
+    """
+    Run a calculation inline or in the worker pool
+
+    A full pool raises 429 and a pool with no free worker in time raises
+    503, both with Retry-After, so callers back off instead of queueing.
+    """
+    operation = function.__name__
+    started = time.perf_counter()
+    try:
+        with tracer.span(operation, mode=CALC_EXECUTION_MODE):
+            if calculation_pool is None:
+                result = function(*args)
+            else:
+                result = await calculation_pool.run(function, *args)
+    except PoolSaturated as e:
+        calculations_total.inc(operation, "rejected")
+        raise HTTPException(status_code=429, detail=f"Calculator is saturated: {str(e)}",
+                            headers={"Retry-After": CALC_RETRY_AFTER})
+    except PoolBusy as e:
+        calculations_total.inc(operation, "rejected")
+        raise HTTPException(status_code=503, detail=f"Calculator is busy: {str(e)}",
+                            headers={"Retry-After": CALC_RETRY_AFTER})
+    except (ExpressionError, OverflowError):
+        calculations_total.inc(operation, "invalid")
+        raise
+    finally:
+        calculation_latency.observe(time.perf_counter() - started, operation)
+    calculations_total.inc(operation, "ok")
+    return result
+
+
 @app.post("/calculate", response_model=CalculationResponse)
 async def calculate(request: CalculationRequest):
     """
     Perform a mathematical calculation
     """
     try:
-        # WARNING: Using eval() is generally unsafe, but used here for simplicity
-        # In a production environment, use a safer approach like ast.literal_eval() 
-        # or a dedicated math expression parser
-        result = eval(request.expression)
+        result = float(await run_calculation(evaluate, request.expression))
+    except (ExpressionError, OverflowError) as e:
+        raise HTTPException(status_code=400, detail=f"Calculation error: {str(e)}")
+    return {
+        "result": result,
+        "expression": request.expression
+    }
+
+
+@app.post("/calculate/batch", response_model=BatchCalculationResponse, response_model_exclude_none=True)
+async def calculate_batch(request: BatchCalculationRequest):
+    """
+    Perform several calculations in one request
+
+    Send either ``expressions`` (each evaluated on its own) or ``expression``
+    with ``variables`` (evaluated once over the arrays, element by element).
+    Errors are reported per item; only a malformed request fails as a whole.
+    """
+    if request.expressions is not None:
+        if request.expression is not None or request.variables is not None:
+            raise HTTPException(status_code=400, detail="Send either expressions or expression with variables")
+        if len(request.expressions) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} expressions per batch")
+        try:
+            results = await run_calculation(evaluate_many, request.expressions)
+        except ExpressionError as e:
+            raise HTTPException(status_code=400, detail=f"Calculation error: {str(e)}")
         return {
-            "result": float(result),
-            "expression": request.expression
+            "results": [
+                {"expression": expression, "result": result, "error": error}
+                for expression, (result, error) in zip(request.expressions, results)
+            ]
         }
-    except Exception as e:
+
+    if request.expression is None or not request.variables:
+        raise HTTPException(status_code=400, detail="Send either expressions or expression with variables")
+    try:
+        results = await run_calculation(evaluate_vectorized, request.expression, request.variables)
+    except ExpressionError as e:
         raise HTTPException(status_code=400, detail=f"Calculation error: {str(e)}")
+    return {
+        "expression": request.expression,
+        "results": [{"result": result, "error": error} for result, error in results]
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    """Calculation execution mode and worker pool counters"""
+    return {
+        "execution_mode": CALC_EXECUTION_MODE,
+        "pool": calculation_pool.snapshot() if calculation_pool else None
+    }
 
 
 @app.get("/schema")
@@ -0,0 +1,188 @@
+"""
+Process pool for running calculations off the event loop
+
+Each worker is a separate process fed over a pipe, so a CPU-heavy
+calculation never blocks /health or heartbeats. The pool adds the controls
+``concurrent.futures.ProcessPoolExecutor`` lacks:
+
+- a bounded queue: once ``workers + queue_size`` calls are pending, new ones
+  are rejected with ``PoolSaturated`` instead of piling up
+- a wait limit: calls that cannot get a worker within ``queue_timeout`` (or
+  whose worker dies) fail with ``PoolBusy``
+- a per-task deadline: a worker still running after ``task_timeout`` is
+  killed and replaced, and the call fails with ``EvaluationTimeout``
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from typing import Any, Callable, Dict
+
+from expression import EvaluationTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """The pool's queue is full"""
+
+
+class PoolBusy(Exception):
+    """No worker became free in time"""
+
+
+def _worker_main(conn, initializer, initargs):
+    # Ctrl-C is handled by the parent, which stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer(*initargs)
+    conn.send((True, None))
+    while True:
+        try:
+            function, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (True, function(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The exception itself could not be pickled
+            conn.send((False, RuntimeError(str(e))))
+
+
+class _Worker:
+    def __init__(self, context, initializer: Callable = None, initargs: tuple = ()):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, initializer, initargs),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        # Wait until the worker is initialized so its first call is not slowed by imports
+        self.conn.recv()
+
+    def call(self, function: Callable, args: tuple) -> Any:
+        """Run ``function(*args)`` in the worker; blocks until it replies"""
+        self.conn.send((function, args))
+        ok, value = self.conn.recv()
+        if not ok:
+            raise value
+        return value
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ProcessPool:
+    """Fixed-size pool of calculation worker processes"""
+
+    def __init__(self, workers: int, queue_size: int, task_timeout: float, queue_timeout: float,
+                 initializer: Callable = None, initargs: tuple = ()):
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_pending = workers + queue_size
+        self.task_timeout = task_timeout
+        self.queue_timeout = queue_timeout
+        # "spawn" so workers never inherit the event loop or its threads
+        self.context = multiprocessing.get_context("spawn")
+        self.idle: asyncio.Queue = asyncio.Queue()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.respawns = 0
+        self.closed = False
+
+    async def _spawn(self) -> _Worker:
+        return await asyncio.to_thread(_Worker, self.context, self.initializer, self.initargs)
+
+    async def start(self):
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.workers)))
+        for worker in workers:
+            self.idle.put_nowait(worker)
+        logger.info(f"Started {self.workers} calculation workers")
+
+    async def run(self, function: Callable, *args) -> Any:
+        """
+        Run ``function(*args)`` in a worker process
+
+        ``function`` must be importable by the workers (defined at module
+        level). Exceptions it raises are re-raised here.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturated(f"{self.pending} calculations already pending")
+
+        self.pending += 1
+        try:
+            try:
+                worker = await asyncio.wait_for(self.idle.get(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise PoolBusy(f"No calculation worker free within {self.queue_timeout}s")
+
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.to_thread(worker.call, function, args),
+                    timeout=self.task_timeout
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"Killing calculation worker after {time.monotonic() - started:.2f}s")
+                self._replace(worker)
+                raise EvaluationTimeout("Evaluation timed out")
+            except asyncio.CancelledError:
+                # The worker's state is unknown (a reply may still be in flight)
+                self._replace(worker)
+                raise
+            except (EOFError, OSError):
+                logger.warning("Calculation worker died; replacing it")
+                self._replace(worker)
+                raise PoolBusy("Calculation worker exited unexpectedly")
+            except BaseException:
+                self.idle.put_nowait(worker)
+                raise
+
+            self.completed += 1
+            self.idle.put_nowait(worker)
+            return result
+        finally:
+            self.pending -= 1
+
+    def _replace(self, worker: _Worker):
+        """Kill ``worker`` and add a fresh one to the pool in the background"""
+        async def respawn():
+            await asyncio.to_thread(worker.kill)
+            if self.closed:
+                return
+            self.respawns += 1
+            self.idle.put_nowait(await self._spawn())
+
+        asyncio.create_task(respawn())
+
+    def snapshot(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "idle": self.idle.qsize(),
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "respawns": self.respawns,
+        }
+
+    async def close(self):
+        self.closed = True
+        while not self.idle.empty():
+            await asyncio.to_thread(self.idle.get_nowait().kill)
@@ -0,0 +1,387 @@
+"""
+Safe arithmetic expression engine for the calculator
+
+Expressions are parsed once with ``ast``, checked against a whitelist of
+numbers, arithmetic operators and math functions, and compiled into a tree
+of closures. Compiled expressions are kept in an LRU cache keyed by the
+expression string, so repeated expressions skip parsing entirely.
+
+Evaluation is bounded so one request cannot monopolize a worker:
+
+- expressions longer than MAX_EXPRESSION_LENGTH characters, with more than
+  MAX_OPERATIONS nodes or nested deeper than MAX_DEPTH are rejected
+- integer results may not exceed MAX_INT_BITS bits; ``**`` and ``*`` check
+  the size of their result before computing it, and functions check their
+  integer arguments before they are called (``round`` also limits its
+  ``ndigits``), since a builtin cannot be interrupted once it runs
+- evaluation stops once it runs past its timeout
+
+An expression may also be compiled with variable names and evaluated over
+arrays of inputs; ``evaluate_vectorized`` runs the compiled tree once on
+NumPy arrays instead of once per element.
+"""
+import ast
+import functools
+import math
+import operator
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+Number = Union[int, float]
+
+MAX_EXPRESSION_LENGTH = int(os.environ.get("CALC_MAX_EXPRESSION_LENGTH", "1000"))
+MAX_OPERATIONS = int(os.environ.get("CALC_MAX_OPERATIONS", "500"))
+MAX_DEPTH = int(os.environ.get("CALC_MAX_DEPTH", "100"))
+MAX_INT_BITS = int(os.environ.get("CALC_MAX_INT_BITS", "4096"))
+EVALUATION_TIMEOUT = float(os.environ.get("CALC_EVALUATION_TIMEOUT", "0.5"))
+EXPRESSION_CACHE_SIZE = int(os.environ.get("CALC_EXPRESSION_CACHE_SIZE", "4096"))
+# Largest array accepted by evaluate_vectorized
+MAX_VECTOR_LENGTH = int(os.environ.get("CALC_MAX_VECTOR_LENGTH", "100000"))
+
+
+class ExpressionError(ValueError):
+    """Raised for expressions that are invalid, unsafe or too expensive"""
+
+
+class EvaluationTimeout(ExpressionError):
+    pass
+
+
+def _check_int(value: Number) -> Number:
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ExpressionError(f"Integer result exceeds {MAX_INT_BITS} bits")
+    if isinstance(value, complex):
+        raise ExpressionError("Result is not a real number")
+    return value
+
+
+def _pow(base: Number, exponent: Number) -> Number:
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        # bit_length(base ** n) <= n * bit_length(base); refuse before computing
+        if (base.bit_length() - 1) * exponent > MAX_INT_BITS:
+            raise ExpressionError(f"Integer result exceeds {MAX_INT_BITS} bits")
+    return _check_int(operator.pow(base, exponent))
+
+
+def _mul(left: Number, right: Number) -> Number:
+    if isinstance(left, int) and isinstance(right, int):
+        if left.bit_length() + right.bit_length() > MAX_INT_BITS + 1:
+            raise ExpressionError(f"Integer result exceeds {MAX_INT_BITS} bits")
+    return left * right
+
+
+# round() computes 10 ** ndigits internally; beyond this float has no digits left
+MAX_ROUND_DIGITS = 308
+
+
+def _round(number: Number, ndigits: Optional[int] = None) -> Number:
+    if ndigits is None:
+        return round(number)
+    if not isinstance(ndigits, int):
+        raise ExpressionError("round() ndigits must be an integer")
+    if abs(ndigits) > MAX_ROUND_DIGITS:
+        raise ExpressionError(f"round() ndigits must be between -{MAX_ROUND_DIGITS} and {MAX_ROUND_DIGITS}")
+    return round(number, ndigits)
+
+
+def _at_least_two(name: str, function: Callable) -> Callable:
+    """``function`` for min/max, which only make sense over several numbers"""
+    def call(*args):
+        if len(args) < 2:
+            raise ExpressionError(f"{name}() needs at least two arguments")
+        return function(*args)
+    return call
+
+
+BINARY_OPERATORS = {
+    ast.Add: lambda left, right: _check_int(left + right),
+    ast.Sub: lambda left, right: _check_int(left - right),
+    ast.Mult: _mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _pow,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+FUNCTIONS = {
+    "abs": abs,
+    "round": _round,
+    "min": _at_least_two("min", min),
+    "max": _at_least_two("max", max),
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "floor": math.floor,
+    "ceil": math.ceil,
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+
+class CompiledExpression:
+    """A validated expression ready to evaluate without re-parsing"""
+
+    def __init__(self, source: str, evaluate: Callable[[Dict, float], Number], operations: int,
+                 variables: Tuple[str, ...] = ()):
+        self.source = source
+        self.operations = operations
+        self.variables = variables
+        self._evaluate = evaluate
+
+    def __call__(self, names: Optional[Dict] = None, timeout: float = None) -> Number:
+        deadline = time.perf_counter() + (EVALUATION_TIMEOUT if timeout is None else timeout)
+        try:
+            return self._evaluate(names or {}, deadline)
+        except ExpressionError:
+            raise
+        except OverflowError:
+            raise ExpressionError("Result is too large")
+        except (ArithmeticError, ValueError, TypeError) as e:
+            raise ExpressionError(str(e))
+
+
+def _check_deadline(deadline: float):
+    if time.perf_counter() > deadline:
+        raise EvaluationTimeout("Evaluation timed out")
+
+
+class _Compiler:
+    def __init__(self, variables: Tuple[str, ...], functions: Dict[str, Callable]):
+        self.variables = variables
+        self.functions = functions
+        self.operations = 0
+
+    def compile(self, node: ast.AST, depth: int = 0) -> Callable[[Dict, float], Number]:
+        self.operations += 1
+        if self.operations > MAX_OPERATIONS:
+            raise ExpressionError(f"Expression has more than {MAX_OPERATIONS} operations")
+        if depth > MAX_DEPTH:
+            raise ExpressionError(f"Expression is nested deeper than {MAX_DEPTH} levels")
+
+        if isinstance(node, ast.Constant):
+            if type(node.value) not in (int, float):
+                raise ExpressionError(f"Unsupported constant: {node.value!r}")
+            value = _check_int(node.value)
+            return lambda names, deadline: value
+
+        if isinstance(node, ast.Name):
+            # Bound variables shadow the built-in constants
+            if node.id in self.variables:
+                name = node.id
+                return lambda names, deadline: names[name]
+            if node.id not in CONSTANTS:
+                raise ExpressionError(f"Unknown name: {node.id}")
+            value = CONSTANTS[node.id]
+            return lambda names, deadline: value
+
+        if isinstance(node, ast.BinOp):
+            op = BINARY_OPERATORS.get(type(node.op))
+            if op is None:
+                raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+            left = self.compile(node.left, depth + 1)
+            right = self.compile(node.right, depth + 1)
+
+            def binary(names, deadline):
+                left_value = left(names, deadline)
+                right_value = right(names, deadline)
+                _check_deadline(deadline)
+                return op(left_value, right_value)
+            return binary
+
+        if isinstance(node, ast.UnaryOp):
+            op = UNARY_OPERATORS.get(type(node.op))
+            if op is None:
+                raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+            operand = self.compile(node.operand, depth + 1)
+            return lambda names, deadline: op(operand(names, deadline))
+
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in self.functions:
+                raise ExpressionError("Unsupported function call")
+            if node.keywords:
+                raise ExpressionError("Keyword arguments are not supported")
+            function = self.functions[node.func.id]
+            args = [self.compile(arg, depth + 1) for arg in node.args]
+
+            def call(names, deadline):
+                # A builtin runs to completion once called, so bound its inputs first
+                values = [_check_int(arg(names, deadline)) for arg in args]
+                _check_deadline(deadline)
+                return _check_int(function(*values))
+            return call
+
+        raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+
+
+@functools.lru_cache(maxsize=1)
+def _numpy():
+    # Imported lazily so scalar evaluation works without NumPy
+    import numpy
+    return numpy
+
+
+@functools.lru_cache(maxsize=1)
+def _vector_functions() -> Dict[str, Callable]:
+    """
+    Element-wise equivalents of FUNCTIONS for NumPy arrays
+
+    Wherever the scalar function raises, these give NaN or infinity, so
+    evaluate_vectorized can hand those elements to the scalar engine for
+    its error.
+    """
+    np = _numpy()
+
+    def vector_round(x, ndigits=None):
+        # Same argument rules as the scalar round
+        _round(0, ndigits)
+        return np.round(x, ndigits or 0)
+
+    def vector_log(x, base=None):
+        if base is None:
+            return np.log(x)
+        # log(x) / log(0) would be -0.0 rather than an error
+        return np.log(x) / np.log(np.where(base == 0, np.nan, base))
+
+    return {
+        "abs": np.abs,
+        "round": vector_round,
+        "min": _at_least_two("min", lambda *args: functools.reduce(np.minimum, args)),
+        "max": _at_least_two("max", lambda *args: functools.reduce(np.maximum, args)),
+        "sqrt": np.sqrt,
+        "exp": np.exp,
+        "log": vector_log,
+        "log10": np.log10,
+        "sin": np.sin,
+        "cos": np.cos,
+        "tan": np.tan,
+        "floor": np.floor,
+        "ceil": np.ceil,
+    }
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(source: str, variables: Tuple[str, ...] = (), vectorized: bool = False) -> CompiledExpression:
+    """
+    Parse and validate ``source``; cached by expression string
+
+    ``variables`` are the names that may be bound at evaluation time. With
+    ``vectorized`` the compiled tree calls NumPy functions so it can run on
+    arrays.
+    """
+    if len(source) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        raise ExpressionError(f"Invalid expression: {e.__class__.__name__}")
+
+    compiler = _Compiler(variables, _vector_functions() if vectorized else FUNCTIONS)
+    evaluate = compiler.compile(tree.body)
+    return CompiledExpression(source, evaluate, compiler.operations, variables)
+
+
+def _check_finite(value: Number) -> Number:
+    if isinstance(value, float):
+        if math.isnan(value):
+            raise ExpressionError("Result is undefined")
+        if math.isinf(value):
+            raise ExpressionError("Result is infinite")
+    return value
+
+
+def evaluate(source: str, timeout: float = None) -> Number:
+    """Compile (or fetch from cache) and evaluate an expression; NaN and infinite results are errors"""
+    return _check_finite(compile_expression(source)(timeout=timeout))
+
+
+def _result(compiled: CompiledExpression, names: Optional[Dict] = None,
+            timeout: float = None) -> Tuple[Optional[float], Optional[str]]:
+    """(result, error) for one evaluation; NaN and infinite results are errors"""
+    try:
+        return _check_finite(float(compiled(names, timeout))), None
+    except (ExpressionError, OverflowError) as e:
+        return None, str(e)
+
+
+def evaluate_many(sources: List[str], timeout: float = None) -> List[Tuple[Optional[float], Optional[str]]]:
+    """Evaluate each expression on its own; returns a (result, error) pair per expression"""
+    results = []
+    for source in sources:
+        try:
+            compiled = compile_expression(source)
+        except ExpressionError as e:
+            results.append((None, str(e)))
+            continue
+        results.append(_result(compiled, timeout=timeout))
+    return results
+
+
+def evaluate_vectorized(
+    source: str,
+    variables: Dict[str, Union[float, Sequence[float]]],
+    timeout: float = None,
+) -> List[Tuple[Optional[float], Optional[str]]]:
+    """
+    Evaluate ``source`` once over arrays of variable values
+
+    Values are broadcast against each other NumPy-style, so a scalar applies
+    to every element. Returns one (result, error) pair per element, the same
+    as evaluating the expression with that element's values: elements whose
+    vectorized result is NaN or infinite (e.g. division by zero) are
+    evaluated again by the scalar engine, which reports the error.
+    ``timeout`` bounds the whole call: elements still waiting for the
+    scalar engine when it runs out are reported as timed out.
+    Problems with the expression itself raise ExpressionError.
+    """
+    deadline = time.perf_counter() + (EVALUATION_TIMEOUT if timeout is None else timeout)
+    np = _numpy()
+    names = tuple(sorted(variables))
+    compiled = compile_expression(source, names, vectorized=True)
+
+    try:
+        arrays = [np.atleast_1d(np.asarray(variables[name], dtype=float)) for name in names]
+    except (TypeError, ValueError):
+        raise ExpressionError("Variable values must be numbers or arrays of numbers")
+    if any(array.ndim > 1 for array in arrays):
+        raise ExpressionError("Variable arrays must be one-dimensional")
+    try:
+        arrays = np.broadcast_arrays(*arrays) if arrays else []
+    except ValueError:
+        raise ExpressionError("Variable arrays must have the same length")
+    length = arrays[0].size if arrays else 1
+    if length > MAX_VECTOR_LENGTH:
+        raise ExpressionError(f"Variable arrays are longer than {MAX_VECTOR_LENGTH} elements")
+
+    with np.errstate(all="ignore"):
+        result = compiled(dict(zip(names, arrays)), deadline - time.perf_counter())
+        try:
+            result = np.broadcast_to(np.asarray(result, dtype=float), (length,))
+        except OverflowError:
+            raise ExpressionError("Result is too large")
+
+    results = [(value, None) for value in result.tolist()]
+    failed = np.flatnonzero(~np.isfinite(result)).tolist()
+    if failed:
+        scalar = compile_expression(source, names)
+        columns = [array.tolist() for array in arrays]
+        for position, index in enumerate(failed):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                for index in failed[position:]:
+                    results[index] = (None, "Evaluation timed out")
+                break
+            results[index] = _result(scalar, {name: column[index] for name, column in zip(names, columns)}, remaining)
+    return results
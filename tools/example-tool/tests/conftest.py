@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tool's modules are imported by name, as uvicorn does from its directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
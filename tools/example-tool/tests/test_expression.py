@@ -0,0 +1,143 @@
+import math
+import time
+
+import pytest
+
+import expression
+from expression import EvaluationTimeout, ExpressionError, evaluate
+
+
+def test_evaluates_arithmetic_and_functions():
+    assert evaluate("2 + 3 * 4") == 14
+    assert evaluate("sqrt(144) + round(2.567, 2)") == pytest.approx(14.57)
+    assert evaluate("max(1, 5, 3) - min(4, 2)") == 3
+
+
+def test_rejects_too_many_operations(monkeypatch):
+    # The default limit is only reachable near the length limit
+    monkeypatch.setattr(expression, "MAX_OPERATIONS", 20)
+    with pytest.raises(ExpressionError, match="operations"):
+        expression.compile_expression.__wrapped__(f"max({', '.join(['1'] * 20)})")
+
+
+def test_rejects_deep_nesting():
+    source = "-" * (expression.MAX_DEPTH + 1) + "1"
+    with pytest.raises(ExpressionError, match="nested"):
+        evaluate(source)
+
+
+@pytest.mark.parametrize("source", [
+    "2 ** 100000",
+    "(2 ** 4000) * (2 ** 4000)",
+    "10 ** 999 * 10 ** 999",
+])
+def test_rejects_oversized_integers(source):
+    with pytest.raises(ExpressionError, match="bits"):
+        evaluate(source)
+
+
+@pytest.mark.parametrize("source, message", [
+    ("1e309", "infinite"),
+    ("1e308 * 10", "infinite"),
+    ("-1e308 * 10", "infinite"),
+    ("1e309 - 1e309", "undefined"),
+])
+def test_rejects_non_finite_results(source, message):
+    with pytest.raises(ExpressionError, match=f"Result is {message}"):
+        evaluate(source)
+    assert expression.evaluate_many([source]) == [(None, f"Result is {message}")]
+
+
+def test_stops_at_the_deadline():
+    with pytest.raises(EvaluationTimeout):
+        evaluate("1 + 1", timeout=-1)
+
+
+@pytest.mark.parametrize("source", ["round(5, -10**7)", "round(5, -10**100)", "round(5, 10**7)"])
+def test_rejects_round_digits_out_of_range(source):
+    started = time.perf_counter()
+    with pytest.raises(ExpressionError, match="ndigits"):
+        evaluate(source)
+    assert time.perf_counter() - started < 1
+
+
+def test_rejects_non_integer_round_digits():
+    with pytest.raises(ExpressionError, match="ndigits must be an integer"):
+        evaluate("round(5, 1.5)")
+
+
+def test_checks_integer_arguments_before_calling_functions(monkeypatch):
+    calls = []
+    monkeypatch.setitem(expression.FUNCTIONS, "abs", lambda value: calls.append(value) or value)
+    expression.compile_expression.cache_clear()
+    try:
+        compiled = expression.compile_expression(f"abs({2 ** 100})")
+        # The literal passed the compile-time check; the call checks it again
+        monkeypatch.setattr(expression, "MAX_INT_BITS", 64)
+        with pytest.raises(ExpressionError, match="bits"):
+            compiled()
+        assert calls == []
+    finally:
+        expression.compile_expression.cache_clear()
+
+
+VALUES = [-2.0, -1.0, -0.5, 0.0, 0.5, 1.0, 2.0, 3.7]
+
+
+@pytest.mark.parametrize("source", [
+    "x + y * 2",
+    "x / y",
+    "x // y",
+    "x % y",
+    "x ** y",
+    "y ** -1",
+    "sqrt(x)",
+    "log(x)",
+    "log(x, y)",
+    "log(x, 0)",
+    "log10(x) + exp(y)",
+    "min(x, y) - max(x, y, 1)",
+    "min(x)",
+    "round(x * 10, 1)",
+    "round(x, y)",
+    "floor(x) + ceil(y) + abs(x)",
+    "x // 0",
+])
+def test_vectorized_matches_scalar(source):
+    pairs = [(x, y) for x in VALUES for y in VALUES]
+    variables = {"x": [x for x, _ in pairs], "y": [y for _, y in pairs]}
+    scalar = expression.compile_expression(source, ("x", "y"))
+
+    expected = []
+    for x, y in pairs:
+        try:
+            value = float(scalar({"x": x, "y": y}))
+        except ExpressionError as e:
+            expected.append((None, str(e)))
+            continue
+        expected.append((value, None) if math.isfinite(value) else (None, "non-finite"))
+
+    try:
+        actual = expression.evaluate_vectorized(source, variables)
+    except ExpressionError as e:
+        # Errors in the expression itself fail every element alike
+        assert expected == [(None, str(e))] * len(pairs)
+        return
+
+    for (x, y), (value, error), (expected_value, expected_error) in zip(pairs, actual, expected):
+        if expected_error == "non-finite":
+            assert value is None and error.startswith("Result is"), (x, y)
+        else:
+            assert error == expected_error, (x, y)
+            assert value == pytest.approx(expected_value, rel=1e-12, abs=1e-12), (x, y)
+
+
+def test_vectorized_fallback_stops_at_the_deadline():
+    # Every element is infinite, so each one would be re-evaluated by the scalar engine
+    length = expression.MAX_VECTOR_LENGTH
+    started = time.perf_counter()
+    results = expression.evaluate_vectorized("((x + 1) + 2) / 0", {"x": list(range(length))}, timeout=0.2)
+    assert time.perf_counter() - started < 1
+    assert len(results) == length
+    assert results[0] == (None, "float division by zero")
+    assert results[-1] == (None, "Evaluation timed out")